@@ -12,11 +12,9 @@ build_exe_options = {
         "mido",
         "pyaudio",
         "tinysoundfont",
-        "svg_stack",
         "lxml",
-        "bs4",
     ],
-    "excludes": [],
+    "excludes": ["PySide6.QtWebEngineCore", "PySide6.QtWebEngineWidgets", "PySide6.QtWebEngineQuick"],
     "include_files": include_assets("assets"),
     "optimize": 2,
 }
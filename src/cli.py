@@ -0,0 +1,562 @@
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import argparse
+
+from constants.soundfonts import SOUNDFONTS
+from constants.tunings import HARMONICA_TUNINGS, HARMONICA_KEYS
+from core import pipeline
+from core.engraver import shutdown_engraver
+from core.midiscan import is_midi, part_label, scan_midi
+from core.musicxml import is_musicxml
+from core.memory import set_memory_budget, format_bytes
+from core.memory_check import DEFAULT_SIZES, BUDGETS_PATH
+from core.tab_check import DEFAULT_SEEDS, GOLDENS_PATH, ENGINES
+from core.tab_import import load_tab
+from handlers.audio import render_song_audio, render_folder_audio
+from handlers.autofit import get_auto_fit, pitch_histogram
+from handlers.export import EXPORT_FORMATS, AUDIO_FORMATS, export_all, export_summary
+from handlers.library import SongLibrary, DEFAULT_LIBRARY_PATH
+from handlers.parts import process_all_parts, combine_tabs, shutdown_part_pool
+from handlers.pdf import render_song_pdf
+
+def export_audio(args):
+    start = time.perf_counter()
+
+    if os.path.isdir(args.source):
+        output_dir = args.output or args.source
+        failed = 0
+        for song, result in render_folder_audio(args.source, output_dir, args.instrument, args.format, args.jobs):
+            if isinstance(result, Exception):
+                failed += 1
+                print(f'Failed to render {song}. Reason: {result}')
+            else:
+                print(f'{result[0]} ({result[1]:.1f}s)')
+        print(f'Done in {time.perf_counter() - start:.1f}s')
+        return 1 if failed else 0
+
+    output_path = args.output or f"{os.path.splitext(args.source)[0]}.{args.format}"
+    output_path, duration = render_song_audio(args.source, output_path, args.instrument, args.part, args.measures)
+    elapsed = time.perf_counter() - start
+    print(f'{output_path} ({duration:.1f}s of audio in {elapsed:.1f}s)')
+    return 0
+
+
+def export_pdf(args):
+    start = time.perf_counter()
+    output_path = args.output or f"{os.path.splitext(args.source)[0]}.pdf"
+
+    output_path, page_count = render_song_pdf(
+        args.source,
+        output_path,
+        args.type,
+        args.tuning,
+        args.key,
+        args.part,
+        not args.keep_chords,
+        lambda page: print(f'Page {page} written', file=sys.stderr),
+        args.measures,
+        args.transpose
+    )
+    print(f'{output_path} ({page_count} pages in {time.perf_counter() - start:.1f}s)')
+    return 0
+
+
+def export_all_formats(args):
+    start = time.perf_counter()
+    file_name = os.path.splitext(os.path.basename(args.source))[0]
+    result = pipeline.convert(args.source, file_name, harmonica_options(args), args.part, args.measures)
+
+    def progress(done, total, export_format, error):
+        bar = '#' * (done * 20 // total)
+        end = '\n' if done == total else ''
+        print(f'\r[{bar:<20}] {done}/{total} {export_format:<9}', end=end, file=sys.stderr, flush=True)
+
+    try:
+        results = export_all(
+            result,
+            # A folder of its own by default: the song name is reused for the outputs
+            args.output or os.path.join(os.path.dirname(os.path.abspath(args.source)), f'{file_name}_export'),
+            file_name,
+            args.formats,
+            args.instrument,
+            args.audio_format,
+            progress,
+            source_path=args.source
+        )
+    finally:
+        shutdown_engraver()
+
+    print(export_summary(results))
+    print(f'Done in {time.perf_counter() - start:.1f}s')
+    return 1 if any(result['error'] for result in results) else 0
+
+
+def follow(args):
+    from core.follower import PracticeFollower, WavBlocks, iter_microphone_blocks
+    from handlers.score import ScoreEditor
+
+    options = harmonica_options(args)
+    events, _ = pipeline.load_events(args.source, args.part, args.measures)
+    score_editor = ScoreEditor()
+    events = score_editor.transpose(events, options['transpose'])
+    tokens = events.tokens(score_editor.harp_map(options['key'], options['tuning'], options['type'].lower()))
+
+    try:
+        blocks = WavBlocks(args.wav) if args.wav else iter_microphone_blocks(device=args.device)
+    except (OSError, ValueError) as e:
+        print(f'Failed to read {args.wav}. Reason: {e}')
+        return 1
+    sample_rate = blocks.sample_rate if args.wav else 44100
+    follower = PracticeFollower.from_events(events, tokens, sample_rate=sample_rate, method=args.method, look_ahead=args.look_ahead)
+
+    def expected_label(index):
+        note = follower.expected[index]
+        return f"m{note['measure']} {note['label'] or int(note['pitch'])}"
+
+    if not follower.expected:
+        print('The part has no notes to follow')
+        return 1
+    if not args.wav:
+        print(f'Listening... first note: {expected_label(0)} (Ctrl+C to stop)')
+
+    try:
+        for block in blocks:
+            for event in follower.feed(block):
+                if event['result'] == 'hit':
+                    print(f"{event['time']:7.2f}s  hit     {expected_label(event['index'])} ({event['cents']:+d} cents)")
+                elif event['result'] == 'missed':
+                    print(f"{event['time']:7.2f}s  missed  {expected_label(event['index'])}")
+                else:
+                    print(f"{event['time']:7.2f}s  wrong   {round(event['pitch'])} instead of {expected_label(event['index'])}")
+            if follower.finished:
+                break
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        print(f'Failed to open the microphone. Reason: {e}')
+        return 1
+
+    summary = follower.summary()
+    print(
+        f"Accuracy {summary['accuracy']:.0%}: {summary['hits']} hit, {summary['missed']} missed, {summary['wrong']} wrong, "
+        f"{summary['remaining']} not reached of {summary['notes']}; intonation within {summary['mean_cents']:.0f} cents on average"
+    )
+    return 0
+
+
+def library(args):
+    song_library = SongLibrary(args.db)
+    try:
+        if args.action == 'index':
+            start = time.perf_counter()
+            stats = song_library.index(args.folder, args.workers, lambda done, total, path: print(f'[{done}/{total}] {path}', file=sys.stderr))
+            print(', '.join(f'{count} {name}' for name, count in stats.items()) + f' in {time.perf_counter() - start:.1f}s')
+            return 1 if stats['failed'] else 0
+
+        results = song_library.search(
+            args.type, args.tuning, args.key, args.max_bends, args.max_overblows, args.max_missing, args.text, limit=args.limit
+        )
+        print(f"{'Song':<40}  {'Part':>4}  {'Harp':<34}  {'Bends':>5}  {'Overblows':>9}  {'Missing':>7}")
+        for result in results:
+            harp = f"{result['type']} {result['tuning']} {result['key_name']}"
+            print(f"{result['title'][:40]:<40}  {result['part']:>4}  {harp:<34}  {result['bends']:>5}  {result['overblows']:>9}  {result['missing']:>7}")
+        print(f'{len(results)} results')
+        return 0
+    finally:
+        song_library.close()
+
+
+def build_songbook(args):
+    from handlers.songbook import build_songbook as build, SONGBOOK_FORMATS
+
+    start = time.perf_counter()
+    output_format = args.format or os.path.splitext(args.output or '')[1].lstrip('.').lower() or 'pdf'
+    if output_format not in SONGBOOK_FORMATS:
+        print(f"Unsupported songbook format '{output_format}'")
+        return 1
+    output_path = args.output or f"{os.path.splitext(args.manifest)[0]}.{output_format}"
+
+    def progress(done, total, title, error):
+        if error:
+            print(f'Failed to engrave {title}. Reason: {error}', file=sys.stderr)
+        else:
+            print(f'[{done}/{total}] {title}', file=sys.stderr)
+
+    try:
+        result = build(args.manifest, output_path, output_format, args.workers, progress)
+    except (OSError, ValueError) as e:
+        print(f'Failed to build the songbook. Reason: {e}')
+        return 1
+
+    print(f"{result['output_path']} ({result['songs']} songs, {result['pages']} pages in {time.perf_counter() - start:.1f}s)")
+    return 1 if result['failed'] else 0
+
+
+def run_server(args):
+    from server import serve
+
+    try:
+        asyncio.run(serve(
+            args.host,
+            args.port,
+            workers=args.workers,
+            max_queue=args.queue,
+            cache_bytes=args.cache_mb * 1024 * 1024,
+            root=args.root
+        ))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def memory_check(args):
+    from core import memory_check as check
+
+    budgets = check.load_budgets(args.budgets)
+    results = []
+    failures = []
+
+    for note_count in args.sizes:
+        start = time.perf_counter()
+        result = check.measure(note_count)
+        results.append(result)
+        print(f"{note_count} notes: peak RSS {format_bytes(result['peak_rss'])} in {time.perf_counter() - start:.1f}s")
+        print(result['report'])
+        failures += check.check_budget(result, budgets, args.tolerance)
+
+    if args.record:
+        check.record_budgets(results, args.budgets)
+        print(f'Budgets recorded in {args.budgets}')
+        return 0
+
+    for failure in failures:
+        print(f'Over budget: {failure}')
+    return 1 if failures else 0
+
+
+def tab_check(args):
+    from core import tab_check as check
+
+    combos = list(check.combinations())
+    failed = False
+
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            sources = list(check.iter_sources(args.seeds, temp_dir))
+
+            if args.record:
+                start = time.perf_counter()
+                check.record_goldens(sources, combos, args.goldens)
+                print(f'{len(sources)} sources recorded in {args.goldens} in {time.perf_counter() - start:.1f}s')
+                return 0
+
+            goldens = check.load_goldens(args.goldens)
+            for engine in args.engines:
+                run, accepts = check.ENGINES[engine]
+                start = time.perf_counter()
+                checked, source_count, failures = 0, 0, []
+
+                for source in filter(accepts, sources):
+                    source_count += 1
+                    record = goldens.get(source['name'])
+                    if record is None:
+                        failures.append(f"{engine} {source['name']}: not recorded")
+                        continue
+                    count, source_failures = check.check_source(engine, source, combos, record)
+                    checked += count
+                    failures += source_failures
+
+                print(f'{engine}: {checked} tabs of {source_count} sources checked in {time.perf_counter() - start:.1f}s, {len(failures)} difference(s)')
+                for failure in failures[:args.max_failures]:
+                    print(f'  {failure}')
+                if len(failures) > args.max_failures:
+                    print(f'  ... and {len(failures) - args.max_failures} more')
+                failed = failed or bool(failures)
+    finally:
+        if 'parallel' in args.engines:
+            shutdown_part_pool()
+
+    return 1 if failed else 0
+
+
+def measure_range(value):
+    try:
+        start, end = (int(number) for number in value.split('-'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a range like 9-16, got '{value}'")
+
+    return min(start, end), max(start, end)
+
+
+def harmonica_options(args):
+    return pipeline.harmonica_options(args.type, args.tuning, args.key, not args.keep_chords, args.transpose)
+
+
+def print_tab(args):
+    file_name = os.path.splitext(os.path.basename(args.source))[0]
+    options = harmonica_options(args)
+
+    if args.all_parts:
+        try:
+            results = process_all_parts(pipeline.load(args.source), file_name, options, engrave=False, measures=args.measures)
+        finally:
+            shutdown_part_pool()
+        print(combine_tabs(results))
+    else:
+        result = pipeline.convert(args.source, file_name, options, args.part, args.measures, engrave_score=False)
+        print(result['tab_in_text'].strip())
+        if args.stats:
+            stats = result['measure_stats']
+            print(
+                f"{stats['measures']} measures, {stats['distinct']} distinct, "
+                f"{stats['repeated']} reused ({stats['hit_rate']:.0%} hit rate)",
+                file=sys.stderr
+            )
+    return 0
+
+
+def auto_fit(args):
+    if is_musicxml(args.source):
+        piece, _ = pipeline.load_events(args.source, args.part, args.measures)
+    else:
+        piece, _ = pipeline.load_part(args.source, args.part, args.measures)
+
+    start = time.perf_counter()
+    candidates = get_auto_fit().search(pitch_histogram(piece), args.top, args.type)
+    elapsed = (time.perf_counter() - start) * 1000
+
+    print(f"{'Transpose':>9}  {'Type':<9}  {'Tuning':<16}  {'Key':<7}  {'Bends':>5}  {'Overblows':>9}  {'Missing':>7}")
+    for candidate in candidates:
+        print(
+            f"{candidate['transpose']:>+9d}  {candidate['type']:<9}  {candidate['tuning']:<16}  {candidate['key_name']:<7}  "
+            f"{candidate['bends']:>5}  {candidate['overblows']:>9}  {candidate['missing']:>7}"
+        )
+    print(f'Searched in {elapsed:.1f} ms')
+    return 0
+
+
+def list_parts(args):
+    if not is_midi(args.source):
+        print('Failed to list the parts. Reason: only MIDI files are scanned')
+        return 1
+
+    start = time.perf_counter()
+    parts = scan_midi(args.source)
+    elapsed = (time.perf_counter() - start) * 1000
+
+    for part in parts:
+        channels = ', '.join(str(channel + 1) for channel in part['channels'])
+        print(f"{part_label(part)}  [track {part['track']}, channel {channels}]")
+    print(f'Scanned {len(parts)} part(s) in {elapsed:.1f} ms')
+    return 0
+
+
+def import_tab(args):
+    start = time.perf_counter()
+    output_path = args.output or f"{os.path.splitext(args.source)[0]}.musicxml"
+    key = dict(HARMONICA_KEYS)[args.key] if args.type != 'Chromatic' else 'C4'
+
+    score, unknown = load_tab(args.source, args.type, args.tuning, key)
+    with open(output_path, 'w', encoding='utf-8') as file:
+        file.write(pipeline.to_musicxml(score))
+
+    measure_count = len(score.parts[0].getElementsByClass('Measure'))
+    print(f'{output_path} ({measure_count} measures in {time.perf_counter() - start:.1f}s)')
+    if unknown:
+        print(f"Skipped tokens not found in the tuning: {' '.join(unknown)}")
+    return 0
+
+
+def convert_tab(args):
+    from core import tab_convert
+
+    start = time.perf_counter()
+    from_tuning = args.from_tuning or ('Standard Richter' if args.from_type == 'Diatonic' else 'Solo')
+    source = (args.from_type, from_tuning, args.from_key if args.from_type == 'Diatonic' else 'C')
+    type = args.type or args.from_type
+    tuning = args.tuning or (from_tuning if type == args.from_type else ('Standard Richter' if type == 'Diatonic' else 'Solo'))
+    targets = [harp for harp in tab_convert.harps(type, tuning) if args.keys is None or harp[2] in args.keys]
+    if not targets:
+        print(f'Failed to convert. Reason: no {type} {tuning} harp in the keys {args.keys}')
+        return 1
+
+    if os.path.isfile(args.source) and len(targets) == 1 and not args.output:
+        with open(args.source, 'r', encoding='utf-8') as file:
+            converted, stats = tab_convert.convert_data(args.source, file.read(), source, targets[0], not args.no_octaves)
+        print(converted.rstrip())
+        return 0
+
+    if os.path.isdir(args.source):
+        output_dir = args.output or os.path.join(args.source, 'converted')
+        results = tab_convert.convert_folder(args.source, output_dir, source, targets, not args.no_octaves)
+    else:
+        output_dir = args.output or os.path.dirname(os.path.abspath(args.source))
+        results = tab_convert.convert_files([args.source], output_dir, source, targets, not args.no_octaves)
+
+    written, failed = 0, 0
+    for file_path, target, result in results:
+        if isinstance(result, Exception):
+            failed += 1
+            print(f'Failed to convert {file_path} for {target[2]}. Reason: {result}')
+        else:
+            written += 1
+            path, stats = result
+            print(f"{path} ({stats['notes']} notes, {stats['shifted']} moved by octaves, {stats['missing']} missing)")
+    print(f'{written} file(s) written in {time.perf_counter() - start:.2f}s')
+    return 1 if failed else 0
+
+
+def add_harmonica_arguments(parser):
+    tunings = sorted({tuning for tunings in HARMONICA_TUNINGS.values() for tuning in tunings})
+    parser.add_argument('--type', choices=['Diatonic', 'Chromatic'], default='Diatonic')
+    parser.add_argument('--tuning', choices=tunings, default='Standard Richter')
+    parser.add_argument('--key', choices=[key for key, _ in HARMONICA_KEYS], default='C')
+    parser.add_argument('--part', type=int, default=1)
+    parser.add_argument('--keep-chords', action='store_true', help='Do not reduce chords to their highest note')
+    parser.add_argument('--measures', type=measure_range, help='Only process a range of measures, e.g. 9-16')
+    parser.add_argument('--transpose', type=int, default=0, help='Transpose the score by a number of semitones')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='harmonica-tabtool', description='Harmonica TabTool command line')
+    parser.add_argument('--memory-budget', type=int, metavar='MB', help='Soft limit on memory use; fewer workers and smaller caches are used to stay under it')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    audio = commands.add_parser('export-audio', help='Render the MIDI preview of a song or song folder to audio')
+    audio.add_argument('source', help='MIDI/MusicXML file or folder of songs')
+    audio.add_argument('-o', '--output', help='Output file (or folder when rendering a folder)')
+    audio.add_argument('--instrument', choices=list(SOUNDFONTS), default='Harmonica')
+    audio.add_argument('--format', choices=['wav', 'flac'], default='wav')
+    audio.add_argument('--part', type=int, default=1)
+    audio.add_argument('--measures', type=measure_range, help='Only render a range of measures, e.g. 9-16')
+    audio.add_argument('-j', '--jobs', type=int, default=None, help='Worker processes for folders (default: CPU count)')
+    audio.set_defaults(func=export_audio)
+
+    tab = commands.add_parser('tab', help='Print the tablature of a song as text')
+    tab.add_argument('source', help='MIDI/MusicXML file')
+    tab.add_argument('--all-parts', action='store_true', help='Tab every part in parallel')
+    tab.add_argument('--stats', action='store_true', help='Report how many repeated measures were tabbed from memory')
+    add_harmonica_arguments(tab)
+    tab.set_defaults(func=print_tab)
+
+    parts = commands.add_parser('parts', help='List the parts of a MIDI file with their names, ranges and note counts')
+    parts.add_argument('source', help='MIDI file')
+    parts.set_defaults(func=list_parts)
+
+    tunings = sorted({tuning for tunings in HARMONICA_TUNINGS.values() for tuning in tunings})
+    tab_import = commands.add_parser('import-tab', help='Turn a text tab into MusicXML, to engrave, play or tab for another harp')
+    tab_import.add_argument('source', help='Text tab (.txt or .tab)')
+    tab_import.add_argument('-o', '--output', help='Output MusicXML file')
+    tab_import.add_argument('--type', choices=['Diatonic', 'Chromatic'], help='Harmonica the tab is written for (default: guessed from the tab)')
+    tab_import.add_argument('--tuning', choices=tunings, help='Default: Standard Richter or Solo')
+    tab_import.add_argument('--key', choices=[key for key, _ in HARMONICA_KEYS], default='C', help='Harp key the tab is written for')
+    tab_import.set_defaults(func=import_tab)
+
+    tab_convert = commands.add_parser('convert-tab', help='Rewrite text tabs or tabbed MusicXML for other harp keys and tunings, one file or a whole folder')
+    tab_convert.add_argument('source', help='Text tab, MusicXML exported by the app, or a folder of them')
+    tab_convert.add_argument('-o', '--output', help='Output folder (default: next to the file, or "converted" inside the folder)')
+    tab_convert.add_argument('--from-type', choices=['Diatonic', 'Chromatic'], default='Diatonic')
+    tab_convert.add_argument('--from-tuning', choices=tunings, help='Default: Standard Richter or Solo')
+    tab_convert.add_argument('--from-key', choices=[key for key, _ in HARMONICA_KEYS], default='C')
+    tab_convert.add_argument('--type', choices=['Diatonic', 'Chromatic'], help='Target type (default: the source type)')
+    tab_convert.add_argument('--tuning', choices=tunings, help='Target tuning (default: the source tuning)')
+    tab_convert.add_argument('--keys', nargs='+', choices=[key for key, _ in HARMONICA_KEYS], help='Target keys (default: every key)')
+    tab_convert.add_argument('--no-octaves', action='store_true', help='Write ? instead of moving out of reach notes by octaves')
+    tab_convert.set_defaults(func=convert_tab)
+
+    fit = commands.add_parser('autofit', help='Rank transpositions and harps by how playable a song becomes')
+    fit.add_argument('source', help='MIDI/MusicXML file')
+    fit.add_argument('--part', type=int, default=1)
+    fit.add_argument('--measures', type=measure_range, help='Only consider a range of measures, e.g. 9-16')
+    fit.add_argument('--type', choices=['Diatonic', 'Chromatic'], help='Only consider one type of harmonica')
+    fit.add_argument('--top', type=int, default=10, help='Number of candidates to show')
+    fit.set_defaults(func=auto_fit)
+
+    pdf = commands.add_parser('export-pdf', help='Export the tablature of a song to a multi-page PDF')
+    pdf.add_argument('source', help='MIDI/MusicXML file')
+    pdf.add_argument('-o', '--output', help='Output PDF file')
+    add_harmonica_arguments(pdf)
+    pdf.set_defaults(func=export_pdf)
+
+    everything = commands.add_parser('export-all', help='Write MusicXML, MXL, PDF, SVG pages, MIDI, tab text and audio of a song at once')
+    everything.add_argument('source', help='MIDI/MusicXML file')
+    everything.add_argument('-o', '--output', help='Output folder (default: <song>_export next to the song)')
+    everything.add_argument('--formats', nargs='+', choices=EXPORT_FORMATS, default=list(EXPORT_FORMATS), help='Formats to write (default: all)')
+    everything.add_argument('--instrument', choices=list(SOUNDFONTS), default='Harmonica')
+    everything.add_argument('--audio-format', choices=AUDIO_FORMATS, default='wav')
+    add_harmonica_arguments(everything)
+    everything.set_defaults(func=export_all_formats)
+
+    practice = commands.add_parser('follow', help='Follow a performance (microphone or WAV file) through a song and score it')
+    practice.add_argument('source', help='MIDI/MusicXML file')
+    practice.add_argument('--wav', help='Recorded performance to follow instead of the microphone')
+    practice.add_argument('--device', help='Input device for live following (needs the sounddevice package)')
+    practice.add_argument('--method', choices=['yin', 'autocorrelation'], default='yin', help='Pitch detection method')
+    practice.add_argument('--look-ahead', type=int, default=2, help='Expected notes that may be skipped to match a played one')
+    add_harmonica_arguments(practice)
+    practice.set_defaults(func=follow)
+
+    song_library = commands.add_parser('library', help='Index song folders and search them by playability')
+    library_actions = song_library.add_subparsers(dest='action', required=True)
+    library_index = library_actions.add_parser('index', help='Add or refresh a folder of songs (only changed files are analysed)')
+    library_index.add_argument('folder')
+    library_index.add_argument('-w', '--workers', type=int, default=None, help='Analysis processes (default: CPU count)')
+    library_search = library_actions.add_parser('search', help='List song parts playable on a harp, easiest first')
+    library_search.add_argument('--type', choices=['Diatonic', 'Chromatic'])
+    library_search.add_argument('--tuning', choices=sorted({tuning for tunings in HARMONICA_TUNINGS.values() for tuning in tunings}))
+    library_search.add_argument('--key', choices=[key for key, _ in HARMONICA_KEYS])
+    library_search.add_argument('--max-bends', type=int)
+    library_search.add_argument('--max-overblows', type=int)
+    library_search.add_argument('--max-missing', type=int, default=0)
+    library_search.add_argument('--text', help='Part of the song title or path')
+    library_search.add_argument('--limit', type=int, default=50)
+    for library_parser in (library_index, library_search):
+        library_parser.add_argument('--db', default=DEFAULT_LIBRARY_PATH, help='Library database (default: %(default)s)')
+        library_parser.set_defaults(func=library)
+
+    songbook = commands.add_parser('songbook', help='Engrave the songs of a JSON manifest into one book with a table of contents')
+    songbook.add_argument('manifest', help='JSON manifest listing the file, part and harmonica of every song')
+    songbook.add_argument('-o', '--output', help='Output file (default: next to the manifest)')
+    songbook.add_argument('--format', choices=['pdf', 'html', 'svg'], help='Book format (default: from the output extension, else pdf)')
+    songbook.add_argument('-w', '--workers', type=int, default=None, help='Engraving processes (default: CPU count)')
+    songbook.set_defaults(func=build_songbook)
+
+    server = commands.add_parser('serve', help='Run a local HTTP conversion service')
+    server.add_argument('--host', default='127.0.0.1')
+    server.add_argument('--port', type=int, default=8765)
+    server.add_argument('-w', '--workers', type=int, default=None, help='Conversion worker processes (default: CPU count)')
+    server.add_argument('--queue', type=int, default=32, help='Pending conversions before requests are rejected with 503')
+    server.add_argument('--cache-mb', type=int, default=256, help='Size of the result cache in MB')
+    server.add_argument('--root', help='Folder of songs that GET /convert?path=... may read')
+    server.set_defaults(func=run_server)
+
+    memcheck = commands.add_parser('memcheck', help='Check peak memory on synthetic scores against recorded budgets')
+    memcheck.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='Numbers of notes to test')
+    memcheck.add_argument('--budgets', default=BUDGETS_PATH)
+    memcheck.add_argument('--tolerance', type=float, default=0.15, help='Allowed growth over the budget (0.15 = 15%%)')
+    memcheck.add_argument('--record', action='store_true', help='Record the measured peaks as the new budgets')
+    memcheck.set_defaults(func=memory_check)
+
+    tabcheck = commands.add_parser('tabcheck', help='Check the tabs of every engine against recorded golden outputs')
+    tabcheck.add_argument('--engines', nargs='+', choices=list(ENGINES), default=['plain', 'memo', 'streaming'])
+    tabcheck.add_argument('--seeds', type=int, default=DEFAULT_SEEDS, help='Number of random scores')
+    tabcheck.add_argument('--goldens', default=GOLDENS_PATH)
+    tabcheck.add_argument('--max-failures', type=int, default=10, help='Differences printed per engine')
+    tabcheck.add_argument('--record', action='store_true', help='Record the plain path as the new golden outputs')
+    tabcheck.set_defaults(func=tab_check)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.memory_budget:
+        set_memory_budget(args.memory_budget)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
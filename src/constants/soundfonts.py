@@ -0,0 +1,4 @@
+SOUNDFONTS = {
+    'Piano': ('florestan-piano.sf2', 0, 0),
+    'Harmonica': ('florestan-harmonica.sf2', 0, 22)
+}
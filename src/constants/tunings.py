@@ -66,3 +66,14 @@ HARMONICA_TUNINGS = {
         ]
     }
 }
+
+
+HARMONICA_KEYS = [
+    ("Low G", "G2"), ("Low Ab", "Ab2"), ("Low A", "A2"), ("Low Bb", "Bb2"),
+    ("Low B", "B2"), ("Low C", "C3"), ("Low C#", "C#3"), ("Low D", "D3"),
+    ("Low Eb", "Eb3"), ("Low E", "E3"), ("Low F", "F3"), ("Low F#", "F#3"),
+    ("G", "G3"), ("Ab", "Ab3"), ("A", "A3"), ("Bb", "Bb3"),
+    ("B", "B3"), ("C", "C4"), ("Db", "Db4"), ("D", "D4"),
+    ("Eb", "Eb4"), ("E", "E4"), ("F", "F4"), ("F#", "F#4"),
+    ("High G", "G4"), ("High C", "C5")
+]
@@ -0,0 +1,377 @@
+"""
+Crash-isolated verovio workers.
+
+Some MEI data makes verovio abort the whole process (`renderToMIDI` in
+particular), and a toolkit stuck in `loadData` never returns. Here every
+verovio call runs in a small pool of worker processes that talk to the caller
+over pipes: results (MEI, SVG pages, MIDI bytes, timemaps) come back as
+messages, never through temporary files. A worker that crashes or stays
+silent past its timeout is killed and replaced, and the job is retried on a
+fresh worker, so the app only ever sees an `EngraveError`.
+
+Several threads can use the pool at once, one worker each, which renders
+parts or songs in parallel (see `EngraverPool.map`).
+"""
+import base64
+import threading
+import multiprocessing
+from queue import LifoQueue, Empty
+from concurrent.futures import ThreadPoolExecutor
+
+from core import memory
+
+DEFAULT_TIMEOUT = 120
+DEFAULT_RETRIES = 1
+MAX_WORKERS = 4
+XML_ID_SEED = 1
+
+_engraver = None
+
+class EngraveError(RuntimeError):
+    """
+    A verovio job failed, crashed its worker or timed out on every attempt.
+    """
+
+
+def load_data(toolkit, data):
+    """
+    Load data into a verovio toolkit.
+
+    The IDs verovio gives to new elements are random unless seeded, and the
+    seed only takes effect when set, so it is set again before every load:
+    the same data then always gets the same IDs, and pages that did not
+    change engrave to the same SVG (see `ScoreView.place_page`).
+
+    Raises
+    ------
+    ValueError
+        If verovio cannot read the data. It would otherwise leave the toolkit
+        empty and render nothing; in a worker the error is sent back, so the
+        job fails with an `EngraveError` without being retried.
+    """
+    toolkit.setOptions({'xmlIdSeed': XML_ID_SEED})
+    if not toolkit.loadData(data):
+        raise ValueError('verovio could not load the data')
+
+
+def render_timemap(toolkit, mei_data):
+    """
+    Render the verovio timemap of MEI data with the MIDI values of every note.
+
+    Returns
+    -------
+    list of dict
+        Timemap entries: 'tstamp' (ms), 'measureOn' when a measure starts and
+        'notes', the (note ID, duration in ms, MIDI pitch) of the notes starting.
+    """
+    load_data(toolkit, mei_data)
+
+    timemap = []
+    for entry in toolkit.renderToTimemap({'includeMeasures': True}):
+        notes = []
+        for note_id in entry.get('on', []):
+            values = toolkit.getMIDIValuesForElement(note_id)
+            notes.append((note_id, values.get('duration', 0), values.get('pitch', 0)))
+        timemap.append({key: entry[key] for key in ('tstamp', 'measureOn') if key in entry} | {'notes': notes})
+
+    return timemap
+
+
+def run_job(connection, toolkit, operation, data):
+    """
+    Run one job in a worker and send its messages back.
+
+    'svg_pages' sends every page as soon as it is rendered, then 'done'; the
+    other operations send one 'result'. Only verovio is used here, so workers
+    start without loading music21.
+    """
+    if operation == 'svg_pages':
+        load_data(toolkit, data)
+        count = toolkit.getPageCount()
+        for page in range(1, count + 1):
+            connection.send(('page', toolkit.renderToSVG(page)))
+        connection.send(('done', count))
+    elif operation == 'engrave':
+        load_data(toolkit, data)
+        connection.send(('result', toolkit.getMEI()))
+    elif operation == 'midi':
+        load_data(toolkit, data)
+        connection.send(('result', base64.b64decode(toolkit.renderToMIDI())))
+    elif operation == 'timemap':
+        connection.send(('result', render_timemap(toolkit, data)))
+    else:
+        raise ValueError(f"Unknown verovio operation '{operation}'")
+
+
+def worker_main(connection):
+    """
+    Serve verovio jobs from the pipe until it is closed or None is received.
+    """
+    import verovio
+    toolkit = verovio.toolkit()
+
+    while True:
+        try:
+            job = connection.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+
+        try:
+            run_job(connection, toolkit, *job)
+        except Exception as e:
+            connection.send(('error', f'{type(e).__name__}: {e}'))
+
+
+class EngraverWorker:
+    """
+    One verovio worker process and the parent end of its pipe.
+    """
+    def __init__(self, context):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_connection,), daemon=True)
+        self.process.start()
+        child_connection.close()
+
+    def receive(self, timeout):
+        """
+        Return the next message, raising TimeoutError after `timeout` seconds of silence.
+        """
+        if not self.connection.poll(timeout):
+            raise TimeoutError(f'no answer in {timeout:g}s')
+
+        return self.connection.recv()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+    def close(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+
+class EngraverPool:
+    """
+    Pool of crash-isolated verovio workers with a watchdog.
+
+    Workers are started on demand, up to `workers`. Every job is watched:
+    if its worker dies (a verovio crash) or sends nothing for `timeout`
+    seconds, the worker is killed, a new one takes its place and the job is
+    tried again, up to `retries` more times. Errors raised by verovio itself
+    (bad input) are not retried.
+
+    Parameters
+    ----------
+    workers : int, optional
+        Maximum number of worker processes; by default as many as the memory
+        budget allows, at most `MAX_WORKERS`.
+    timeout : float
+        Seconds a job may stay silent; page streams reset it on every page.
+    retries : int
+        Attempts after a crash or timeout.
+    """
+    def __init__(self, workers=None, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES):
+        self.max_workers = workers or memory.parallel_workers(MAX_WORKERS)
+        self.timeout = timeout
+        self.retries = retries
+        # Forked workers lose the verovio fonts when the parent runs threads
+        self.context = multiprocessing.get_context('spawn')
+        self.idle = LifoQueue()
+        self.lock = threading.Lock()
+        self.started = 0
+        self.crashes = 0
+        self.timeouts = 0
+
+    def acquire(self):
+        """
+        Return an idle worker, starting one if the pool is not full, else wait for one.
+        """
+        try:
+            return self.idle.get_nowait()
+        except Empty:
+            pass
+
+        with self.lock:
+            start = self.started < self.max_workers
+            if start:
+                self.started += 1
+        if start:
+            try:
+                return EngraverWorker(self.context)
+            except Exception:
+                with self.lock:
+                    self.started -= 1
+                raise
+
+        return self.idle.get()
+
+    def warm_up(self):
+        """
+        Start a worker ahead of the first job, so it is ready by then.
+        """
+        if self.started == 0:
+            self.release(self.acquire())
+
+    def release(self, worker):
+        self.idle.put(worker)
+
+    def discard(self, worker):
+        worker.kill()
+        with self.lock:
+            self.started -= 1
+
+    def iter_messages(self, operation, data, timeout=None):
+        """
+        Run a job and yield its 'page' and 'result' values.
+
+        When a page stream is retried, the pages already yielded are skipped,
+        so the consumer sees every page exactly once.
+        """
+        timeout = timeout or self.timeout
+        delivered = 0
+        reason = None
+
+        for attempt in range(self.retries + 1):
+            worker = self.acquire()
+            received = 0
+            finished = False
+            try:
+                worker.connection.send((operation, data))
+                while True:
+                    kind, value = worker.receive(timeout)
+                    if kind == 'page':
+                        received += 1
+                        if received > delivered:
+                            delivered += 1
+                            yield value
+                    elif kind == 'result':
+                        finished = True
+                        self.release(worker)
+                        yield value
+                        return
+                    elif kind == 'done':
+                        finished = True
+                        self.release(worker)
+                        return
+                    else:
+                        finished = True
+                        self.release(worker)
+                        raise EngraveError(value)
+            except TimeoutError as e:
+                finished = True
+                self.timeouts += 1
+                self.discard(worker)
+                reason = f'timed out ({e})'
+            except (EOFError, OSError):
+                finished = True
+                self.crashes += 1
+                self.discard(worker)
+                reason = f'the worker crashed (exit code {worker.process.exitcode})'
+            finally:
+                # The consumer stopped reading a page stream: the busy worker cannot be reused
+                if not finished:
+                    self.discard(worker)
+
+        raise EngraveError(f"verovio {operation} failed after {self.retries + 1} attempts: {reason}")
+
+    def run(self, operation, data, timeout=None):
+        """
+        Run a job with a single result and return it.
+        """
+        for value in self.iter_messages(operation, data, timeout):
+            return value
+
+    def engrave(self, musicxml_data):
+        """
+        Convert MusicXML data to MEI.
+        """
+        return self.run('engrave', musicxml_data)
+
+    def iter_svg_pages(self, mei_data):
+        """
+        Yield the SVG pages of MEI data as they are rendered.
+        """
+        return self.iter_messages('svg_pages', mei_data)
+
+    def svg_pages(self, mei_data):
+        return list(self.iter_svg_pages(mei_data))
+
+    def render_midi(self, mei_data):
+        """
+        Render MEI data to the bytes of a MIDI file.
+        """
+        return self.run('midi', mei_data)
+
+    def timemap(self, mei_data):
+        """
+        Return the timemap of MEI data, as built by `render_timemap`.
+        """
+        return self.run('timemap', mei_data)
+
+    def map(self, operation, items):
+        """
+        Run the same operation on several inputs in parallel, one worker each.
+
+        Returns
+        -------
+        list
+            The results in input order; 'svg_pages' gives a list of pages per
+            input. A failed job gives its EngraveError instead of a result.
+        """
+        def run(data):
+            try:
+                if operation == 'svg_pages':
+                    return self.svg_pages(data)
+                return self.run(operation, data)
+            except EngraveError as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(run, items))
+
+    def stats(self):
+        return {'workers': self.started, 'crashes': self.crashes, 'timeouts': self.timeouts}
+
+    def shutdown(self):
+        """
+        Stop the idle workers; busy ones are daemons and end with the app.
+        """
+        while True:
+            try:
+                worker = self.idle.get_nowait()
+            except Empty:
+                break
+            worker.close()
+            with self.lock:
+                self.started -= 1
+
+
+def get_engraver():
+    """
+    Return the verovio worker pool of this process, creating it on first use.
+
+    Worker processes of other pools (parts, library, server) run one job at
+    a time, so their own engraver gets a single verovio worker.
+    """
+    global _engraver
+    if _engraver is None:
+        _engraver = EngraverPool(1 if multiprocessing.parent_process() is not None else None)
+
+    return _engraver
+
+
+def shutdown_engraver():
+    global _engraver
+    if _engraver is not None:
+        _engraver.shutdown()
+        _engraver = None
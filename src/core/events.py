@@ -0,0 +1,602 @@
+from array import array
+from collections import deque
+
+import numpy as np
+from music21 import note, chord, harmony, stream
+
+CHANNEL_MESSAGE_SIZES = {0x80: 2, 0x90: 2, 0xA0: 2, 0xB0: 2, 0xC0: 1, 0xD0: 1, 0xE0: 2}
+
+def read_variable_length(data, position):
+    value = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, position
+
+
+def split_midi_tracks(data):
+    """
+    Return the ticks per beat of a standard MIDI file and the byte span of each track.
+    """
+    if data[:4] != b'MThd':
+        raise ValueError('Not a standard MIDI file')
+
+    header_length = int.from_bytes(data[4:8], 'big')
+    division = int.from_bytes(data[12:14], 'big')
+    if division & 0x8000:
+        raise ValueError('SMPTE time division is not supported')
+
+    tracks = []
+    position = 8 + header_length
+    while position + 8 <= len(data):
+        chunk_length = int.from_bytes(data[position + 4:position + 8], 'big')
+        if data[position:position + 4] == b'MTrk':
+            tracks.append((position + 8, min(len(data), position + 8 + chunk_length)))
+        position += 8 + chunk_length
+
+    return division, tracks
+
+
+def iter_midi_events(data, position, end):
+    """
+    Yield `(ticks, status, data_1, data_2, meta)` for the events of one track.
+
+    Channel messages give their data bytes (`data_2` is 0 for one-byte
+    messages); meta events give status 0xFF, their type as `data_1` and their
+    payload as `meta`. Nothing is kept between events, so tracks of any length
+    are read in constant memory.
+    """
+    ticks = 0
+    running_status = 0
+
+    while position < end:
+        delta, position = read_variable_length(data, position)
+        ticks += delta
+        status = data[position]
+
+        if status == 0xFF:
+            meta_type = data[position + 1]
+            length, position = read_variable_length(data, position + 2)
+            yield ticks, status, meta_type, 0, data[position:position + length]
+            position += length
+        elif status in (0xF0, 0xF7):
+            length, position = read_variable_length(data, position + 1)
+            position += length
+        else:
+            if status & 0x80:
+                running_status = status
+                position += 1
+            size = CHANNEL_MESSAGE_SIZES.get(running_status & 0xF0, 0)
+            if size == 0:
+                return
+            yield ticks, running_status, data[position], data[position + 1] if size == 2 else 0, None
+            position += size
+
+
+class NoteEvents:
+    """
+    Compact note event model of one part, stored as parallel NumPy arrays.
+
+    Every pitch played is one event with its onset and duration (quarter
+    lengths from the start of the part), MIDI pitch, chord ID (shared by the
+    notes of a chord), measure index and voice (0 for notes placed directly in
+    the measure). The score graph is walked once; chord reduction, labeling and
+    key filtering then run over the arrays, and results are written back to
+    the music21 objects only when the score is going to be engraved.
+
+    Events built from a part keep a reference to their music21 note or chord
+    for that write-back. Events read straight from a MIDI file have none and
+    are meant for analysis only.
+    """
+    __slots__ = ('onset', 'duration', 'pitch', 'chord', 'measure', 'voice', 'in_chord', 'elements', 'measure_numbers')
+
+    def __init__(self, onset, duration, pitch, chord, measure, voice, in_chord, elements=None, measure_numbers=None):
+        self.onset = np.asarray(onset, dtype=np.float64)
+        self.duration = np.asarray(duration, dtype=np.float64)
+        self.pitch = np.asarray(pitch, dtype=np.float64)
+        self.chord = np.asarray(chord, dtype=np.int32)
+        self.measure = np.asarray(measure, dtype=np.int32)
+        self.voice = np.asarray(voice, dtype=np.int16)
+        self.in_chord = np.asarray(in_chord, dtype=bool)
+        self.elements = elements
+        self.measure_numbers = measure_numbers or []
+
+    def __len__(self):
+        return len(self.pitch)
+
+    @classmethod
+    def from_part(cls, part):
+        """
+        Build the events of a music21 part (or any stream of measures).
+
+        Notes and chords placed directly in a measure come first, in document
+        order, followed by the notes of its `Voice` streams. Chord symbols
+        are harmony annotations, not played notes, and are skipped like
+        `<harmony>` is by `core.musicxml`.
+        """
+        onsets, durations, pitches, chords, measures, voices, in_chord = [], [], [], [], [], [], []
+        elements = []
+        measure_numbers = []
+        chord_id = 0
+
+        def add(container, offset, measure_index, voice):
+            nonlocal chord_id
+            # Plain element tuples and stored offsets avoid the iterator and
+            # active-site machinery of music21, which dominates on long scores
+            for element in container.elements:
+                if isinstance(element, note.Note):
+                    members = ((element, element),)
+                elif isinstance(element, chord.Chord) and not isinstance(element, harmony.ChordSymbol):
+                    members = tuple((element, component) for component in element.notes)
+                else:
+                    continue
+
+                onset = offset + float(container.elementOffset(element))
+                duration = float(element.duration.quarterLength)
+                for owner, component in members:
+                    onsets.append(onset)
+                    durations.append(duration)
+                    pitches.append(component.pitch.ps)
+                    chords.append(chord_id)
+                    measures.append(measure_index)
+                    voices.append(voice)
+                    in_chord.append(owner is not component)
+                    elements.append((owner, component))
+                chord_id += 1
+
+        for measure_index, measure in enumerate(part.getElementsByClass('Measure')):
+            measure_numbers.append(measure.number)
+            measure_offset = float(part.elementOffset(measure))
+            add(measure, measure_offset, measure_index, 0)
+
+            voice_index = 0
+            for element in measure.elements:
+                if isinstance(element, stream.Voice):
+                    voice_index += 1
+                    add(element, measure_offset + float(measure.elementOffset(element)), measure_index, voice_index)
+
+        return cls(onsets, durations, pitches, chords, measures, voices, in_chord, elements, measure_numbers)
+
+    @classmethod
+    def from_midi(cls, file_path, track=None):
+        """
+        Build analysis-only events straight from a MIDI file, without music21.
+
+        Notes starting together on the same channel form a chord, every note is
+        in voice 0, and measures follow the time signature messages (4/4 until
+        the first one). The file is scanned byte by byte into flat arrays, so
+        memory stays proportional to the number of notes.
+
+        Parameters
+        ----------
+        file_path : str
+            MIDI file to read.
+        track : int, optional
+            Only read this track (0-based); all tracks by default.
+        """
+        with open(file_path, 'rb') as file:
+            data = file.read()
+
+        ticks_per_beat, tracks = split_midi_tracks(data)
+        starts, ends, pitches, channels = array('q'), array('q'), array('h'), array('h')
+        signatures = [(0, 4.0)]
+
+        for track_index, (track_start, track_end) in enumerate(tracks):
+            started = {}
+            read_notes = track is None or track == track_index
+            for ticks, status, data_1, data_2, meta in iter_midi_events(data, track_start, track_end):
+                kind = status & 0xF0
+                if kind == 0x90 and data_2 > 0:
+                    if read_notes:
+                        started.setdefault((status, data_1), deque()).append(ticks)
+                elif kind == 0x80 or kind == 0x90:
+                    onsets = started.get((status | 0x10, data_1))
+                    if onsets:
+                        starts.append(onsets.popleft())
+                        ends.append(ticks)
+                        pitches.append(data_1)
+                        channels.append(status & 0x0F)
+                elif status == 0xFF and data_1 == 0x58 and len(meta) >= 2:
+                    signatures.append((ticks / ticks_per_beat, meta[0] * 4 / 2 ** meta[1]))
+        signatures.sort()
+
+        onset = np.frombuffer(starts, dtype=np.int64) / ticks_per_beat
+        duration = (np.frombuffer(ends, dtype=np.int64) - np.frombuffer(starts, dtype=np.int64)) / ticks_per_beat
+        pitch = np.frombuffer(pitches, dtype=np.int16)
+        channel = np.frombuffer(channels, dtype=np.int16)
+
+        order = np.lexsort((pitch, channel, onset))
+        onset, duration, pitch, channel = onset[order], duration[order], pitch[order], channel[order]
+
+        # A new chord starts whenever the onset or the channel changes
+        new_chord = np.ones(len(onset), dtype=bool)
+        new_chord[1:] = (np.diff(onset) != 0) | (np.diff(channel) != 0)
+        chord_ids = np.cumsum(new_chord) - 1
+        chord_sizes = np.bincount(chord_ids, minlength=1)
+
+        # Measure index from the time signature changes
+        measure = np.zeros(len(onset), dtype=np.int32)
+        first_measure = 0
+        for index, (start, length) in enumerate(signatures):
+            end = signatures[index + 1][0] if index + 1 < len(signatures) else np.inf
+            inside = (onset >= start) & (onset < end)
+            measure[inside] = first_measure + ((onset[inside] - start) // length).astype(np.int32)
+            if end != np.inf:
+                first_measure += int(np.ceil((end - start) / length))
+
+        return cls(
+            onset,
+            duration,
+            pitch,
+            chord_ids,
+            measure,
+            np.zeros(len(onset)),
+            chord_sizes[chord_ids] > 1,
+            measure_numbers=list(range(1, int(measure.max()) + 2)) if len(onset) else []
+        )
+
+    def select(self, mask):
+        """
+        Return the events where `mask` is True, as a new model.
+        """
+        indexes = np.flatnonzero(mask)
+        elements = [self.elements[index] for index in indexes] if self.elements is not None else None
+
+        return NoteEvents(
+            self.onset[indexes],
+            self.duration[indexes],
+            self.pitch[indexes],
+            self.chord[indexes],
+            self.measure[indexes],
+            self.voice[indexes],
+            self.in_chord[indexes],
+            elements,
+            self.measure_numbers
+        )
+
+    def direct(self):
+        """
+        Mask of the events placed directly in their measure (not in a voice).
+        """
+        return self.voice == 0
+
+    def chord_reduction(self, memo=None):
+        """
+        Find the notes kept when every chord is reduced to its highest note.
+
+        Only chords placed directly in a measure are reduced; on equal pitches
+        the first note of the chord is kept. With a `MeasureMemo` of these
+        events, only the distinct measures are reduced.
+
+        Returns
+        -------
+        tuple
+            Boolean mask of the kept events, number of reduced chords and
+            number of removed notes.
+        """
+        chord_members = np.flatnonzero(self.in_chord & self.direct())
+        keep = np.ones(len(self), dtype=bool)
+        if not len(chord_members):
+            return keep, 0, 0
+
+        if memo is not None:
+            keep = memo.expand(memo.distinct.chord_reduction()[0])
+            removed_chords = len(np.unique(self.chord[chord_members]))
+            return keep, removed_chords, len(chord_members) - removed_chords
+
+        order = np.lexsort((chord_members, -self.pitch[chord_members], self.chord[chord_members]))
+        sorted_members = chord_members[order]
+        first_of_chord = np.ones(len(sorted_members), dtype=bool)
+        first_of_chord[1:] = self.chord[sorted_members][1:] != self.chord[sorted_members][:-1]
+
+        keep[sorted_members[~first_of_chord]] = False
+        removed_chords = int(first_of_chord.sum())
+
+        return keep, removed_chords, len(chord_members) - removed_chords
+
+    def write_reduction(self, keep):
+        """
+        Remove the dropped chord notes from the music21 chords.
+        """
+        for index in np.flatnonzero(~keep):
+            owner, component = self.elements[index]
+            owner.remove(component)
+
+    def tokens(self, harmonica_mapping, missing=' ?'):
+        """
+        Return the harmonica token of every event.
+
+        Parameters
+        ----------
+        harmonica_mapping : dict
+            Pitch (`ps`) to token, as built by `ScoreEditor.harp_map`.
+        missing : str
+            Token of the pitches the harmonica cannot play.
+        """
+        unique_pitches, inverse = np.unique(self.pitch, return_inverse=True)
+        unique_tokens = [harmonica_mapping.get(pitch, missing) for pitch in unique_pitches.tolist()]
+
+        return [unique_tokens[index] for index in inverse.tolist()]
+
+    def chord_groups(self, mask):
+        """
+        Yield the event indexes of every note or chord selected by `mask`.
+
+        Chord notes are yielded in reverse of their stored order (top note
+        first), as the tablature reads them.
+        """
+        indexes = np.flatnonzero(mask).tolist()
+        chords = self.chord[mask].tolist()
+        in_chord = self.in_chord[mask].tolist()
+
+        group_start = 0
+        for position in range(1, len(indexes) + 1):
+            if position == len(indexes) or chords[position] != chords[group_start]:
+                if in_chord[group_start]:
+                    yield indexes[position - 1:group_start - 1 if group_start else None:-1]
+                else:
+                    yield indexes[group_start:position]
+                group_start = position
+
+    def write_labels(self, tokens):
+        """
+        Add the tokens as lyrics, one lyric line per chord note.
+        """
+        for group in self.chord_groups(self.direct()):
+            for line, index in enumerate(group, start=1):
+                owner, component = self.elements[index]
+                if owner is component:
+                    owner.addLyric(tokens[index])
+                else:
+                    owner.addLyric(tokens[index], lyricNumber=line)
+
+    def group_tabs(self, tokens, reduce_chords):
+        """
+        Yield the first event index and the tab of every note or chord.
+        """
+        for group in self.chord_groups(self.direct()):
+            if not self.in_chord[group[0]]:
+                yield group[0], tokens[group[0]]
+            elif reduce_chords:
+                yield group[0], ''.join(tokens[index] for index in group)
+            else:
+                yield group[0], ' (' + tokens[group[0]][1:] + ''.join(tokens[index] for index in group[1:]) + ')'
+
+    def tab_text(self, tokens, reduce_chords):
+        """
+        Return the tablature as text, with unreduced chords in parentheses.
+        """
+        return ''.join(text for _, text in self.group_tabs(tokens, reduce_chords))
+
+    def measure_tabs(self, tokens, reduce_chords):
+        """
+        Return the tablature of every measure as `(measure number, text)`.
+
+        Measures without notes are included, so the list follows the measures
+        of the engraved sheet one to one.
+        """
+        texts = [[] for _ in self.measure_numbers]
+        measures = self.measure.tolist()
+        for index, text in self.group_tabs(tokens, reduce_chords):
+            while measures[index] >= len(texts):
+                texts.append([])
+            texts[measures[index]].append(text)
+
+        numbers = list(self.measure_numbers) + list(range(len(self.measure_numbers) + 1, len(texts) + 1))
+        return [(number, ''.join(measure).strip()) for number, measure in zip(numbers, texts)]
+
+
+class MeasureMemo:
+    """
+    Repeated measures of an event model, found by fingerprint.
+
+    The fingerprint of a measure is the rhythm (onsets from the first event of
+    the measure and durations), pitches, voices and chord layout of its events,
+    so two measures with the same fingerprint get the same chord reduction,
+    tabs and key feasibility. That work runs once over `distinct`, the events
+    of the first occurrence of every measure, and is copied to the repeats.
+
+    Parameters
+    ----------
+    events : NoteEvents
+        The events, in measure order.
+    span_ids : ndarray, optional
+        Known ID of every measure (see `reduced`); fingerprinted when omitted.
+
+    Attributes
+    ----------
+    distinct : NoteEvents
+        Events of the distinct measures, without music21 elements; built on
+        first use, like the indexes `expand` and `tab_text` copy results with.
+    hits : int
+        Measures that repeat an earlier one.
+    misses : int
+        Distinct measures.
+    """
+    def __init__(self, events, span_ids=None):
+        count = len(events)
+        boundaries = np.flatnonzero(np.diff(events.measure)) + 1
+        self.starts = np.concatenate(([0], boundaries)) if count else np.zeros(0, dtype=np.int64)
+        self.ends = np.concatenate((boundaries, [count])) if count else np.zeros(0, dtype=np.int64)
+        self.events = events
+
+        if span_ids is None:
+            self.span_ids, self.first_spans = self.fingerprint(events, self.starts, self.ends)
+        else:
+            self.span_ids = span_ids
+            self.first_spans = np.unique(span_ids, return_index=True)[1]
+
+        self.misses = len(self.first_spans)
+        self.hits = len(self.starts) - self.misses
+        # Built on first use, so a memo below the hit rate threshold costs only its IDs
+        self._unique = None
+        self._source = None
+        self._distinct_spans = None
+        self._distinct = None
+
+    def build(self):
+        """
+        Index the events of the first occurrences and the event every event repeats.
+        """
+        starts, ends, first_spans = self.starts, self.ends, self.first_spans
+        span_of_event = np.repeat(np.arange(len(starts)), ends - starts)
+        first_event = starts[span_of_event]
+
+        is_first_span = np.zeros(len(starts), dtype=bool)
+        is_first_span[first_spans] = True
+        self._unique = is_first_span[span_of_event]
+        # Event of the first occurrence that every event repeats
+        self._source = starts[first_spans[self.span_ids]][span_of_event] + np.arange(len(self.events)) - first_event
+        self._distinct_spans = np.repeat(np.arange(len(first_spans)), (ends - starts)[first_spans])
+
+        events = self.events
+        indexes = np.flatnonzero(self._unique)
+        self._distinct = NoteEvents(
+            events.onset[indexes],
+            events.duration[indexes],
+            events.pitch[indexes],
+            events.chord[indexes],
+            events.measure[indexes],
+            events.voice[indexes],
+            events.in_chord[indexes],
+            measure_numbers=events.measure_numbers
+        )
+
+    @property
+    def unique(self):
+        if self._source is None:
+            self.build()
+        return self._unique
+
+    @property
+    def source(self):
+        if self._source is None:
+            self.build()
+        return self._source
+
+    @property
+    def distinct_spans(self):
+        if self._source is None:
+            self.build()
+        return self._distinct_spans
+
+    @property
+    def distinct(self):
+        if self._distinct is None:
+            self.build()
+        return self._distinct
+
+    @staticmethod
+    def layout_columns(events, first_event):
+        """
+        Yield the fingerprinted values of every event, one column at a time.
+        """
+        yield events.onset - events.onset[first_event]
+        yield events.duration
+        yield events.pitch
+        yield events.voice.astype(np.float64)
+        yield events.in_chord.astype(np.float64)
+        yield (events.chord - events.chord[first_event]).astype(np.float64)
+
+    @classmethod
+    def fingerprint(cls, events, starts, ends):
+        """
+        Number the measures of the events by content, in order of first appearance.
+
+        Events are hashed to 64 bits column by column and combined per measure
+        with a position weight, then every repeat is checked column by column
+        against its first occurrence; a hash collision falls back to comparing
+        the measure bytes.
+
+        Returns
+        -------
+        tuple
+            ID of every measure and index of the first measure of every ID.
+        """
+        if not len(starts):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        def mix(values):
+            # splitmix64 finalizer: every input bit reaches every output bit
+            values = (values ^ (values >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+            values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+            return values ^ (values >> np.uint64(31))
+
+        span_of_event = np.repeat(np.arange(len(starts)), ends - starts)
+        first_event = starts[span_of_event]
+
+        with np.errstate(over='ignore'):
+            rows = (np.arange(len(events)) - first_event).astype(np.uint64)
+            for column in cls.layout_columns(events, first_event):
+                rows = mix(rows ^ np.ascontiguousarray(column, dtype=np.float64).view(np.uint64))
+            hashes = mix(np.add.reduceat(rows, starts) ^ (ends - starts).astype(np.uint64))
+        del rows
+
+        _, first_index, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+        order = np.argsort(first_index)
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        span_ids = rank[inverse.ravel()]
+        first_spans = first_index[order]
+
+        if (ends - starts)[first_spans[span_ids]].tolist() == (ends - starts).tolist():
+            source = starts[first_spans[span_ids]][span_of_event] + np.arange(len(events)) - first_event
+            if all(np.array_equal(column, column[source]) for column in cls.layout_columns(events, first_event)):
+                return span_ids, first_spans
+
+        layout = np.column_stack(tuple(cls.layout_columns(events, first_event)))
+        fingerprints = {}
+        span_ids = np.array([
+            fingerprints.setdefault(layout[start:end].tobytes(), len(fingerprints))
+            for start, end in zip(starts.tolist(), ends.tolist())
+        ], dtype=np.int64)
+        return span_ids, np.unique(span_ids, return_index=True)[1]
+
+    def reduced(self, events):
+        """
+        Return the memo of `events`, a chord reduction of the memoized events.
+
+        Repeated measures stay repeated after the reduction, so the measure
+        IDs are kept instead of fingerprinting the reduced events again.
+        """
+        return MeasureMemo(events, self.span_ids)
+
+    @property
+    def hit_rate(self):
+        return self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0
+
+    def stats(self):
+        """
+        Return the number of measures, distinct measures, repeats and the hit rate.
+        """
+        return {
+            'measures': self.hits + self.misses,
+            'distinct': self.misses,
+            'repeated': self.hits,
+            'hit_rate': self.hit_rate
+        }
+
+    def expand(self, values):
+        """
+        Copy per-event values of `distinct` (array or list) to every event.
+        """
+        positions = (np.cumsum(self.unique) - 1)[self.source]
+        if isinstance(values, np.ndarray):
+            return values[positions]
+        return [values[position] for position in positions.tolist()]
+
+    def tab_text(self, tokens, reduce_chords):
+        """
+        Return the tablature as text from the tokens of `distinct`.
+
+        Every distinct measure is written once and its text repeated.
+        """
+        distinct_spans = self.distinct_spans.tolist()
+        texts = [[] for _ in range(self.misses)]
+        for index, text in self.distinct.group_tabs(tokens, reduce_chords):
+            texts[distinct_spans[index]].append(text)
+        texts = [''.join(measure) for measure in texts]
+
+        return ''.join(texts[span_id] for span_id in self.span_ids.tolist())
@@ -0,0 +1,402 @@
+"""
+Practice follower: listen to the player and follow along in the score.
+
+Audio arrives in small blocks, from a microphone or a WAV file. Each block
+is added to a short analysis window and its pitch is found with YIN (or a
+cheaper plain autocorrelation), all in NumPy. A pitch held for a few blocks
+counts as a played note. It is then matched against the next expected notes:
+a match advances the cursor (expected notes jumped over count as missed) and
+anything else counts as a wrong note. The running accuracy is
+hits / (hits + missed + wrong).
+"""
+import struct
+
+import numpy as np
+
+DEFAULT_SAMPLE_RATE = 44100
+BLOCK_SIZE = 1024
+WINDOW_SIZE = 2048
+MIN_FREQUENCY = 80.0
+MAX_FREQUENCY = 3200.0
+YIN_THRESHOLD = 0.15
+MIN_RMS = 0.01
+PITCH_METHODS = ('yin', 'autocorrelation')
+
+def frequency_to_midi(frequency):
+    return 69 + 12 * np.log2(frequency / 440.0)
+
+
+def detect_pitch(samples, sample_rate=DEFAULT_SAMPLE_RATE, method='yin', min_frequency=MIN_FREQUENCY, max_frequency=MAX_FREQUENCY, threshold=YIN_THRESHOLD):
+    """
+    Estimate the fundamental frequency of a mono block.
+
+    Parameters
+    ----------
+    samples : ndarray
+        Mono samples in [-1, 1]; at least twice the longest period long.
+    sample_rate : int
+        Samples per second.
+    method : str
+        'yin' (cumulative mean normalized difference, robust to octave
+        errors) or 'autocorrelation' (normalized autocorrelation peak).
+    min_frequency, max_frequency : float
+        Search range in Hz.
+    threshold : float
+        YIN dip threshold; lower is stricter.
+
+    Returns
+    -------
+    tuple
+        Frequency in Hz (0.0 when no clear pitch) and confidence in [0, 1].
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    samples = samples - samples.mean()
+    window = len(samples) // 2
+    tau_min = max(2, int(sample_rate / max_frequency))
+    tau_max = min(window - 1, int(sample_rate / min_frequency) + 1)
+    if tau_max <= tau_min:
+        return 0.0, 0.0
+
+    # r(tau) = sum x[j] x[j + tau] over the first half, for every lag at once
+    size = 1 << int(np.ceil(np.log2(window + tau_max + window)))
+    spectrum = np.fft.rfft(samples[:window + tau_max], size)
+    head = np.fft.rfft(samples[:window], size)
+    correlation = np.fft.irfft(spectrum * np.conj(head), size)[:tau_max + 1]
+
+    if method == 'autocorrelation':
+        if correlation[0] <= 0:
+            return 0.0, 0.0
+        normalized = correlation / correlation[0]
+
+        # Every multiple of the period peaks as high: take the first strong
+        # peak after the main lobe around lag 0
+        negative = np.flatnonzero(normalized[:tau_max] < 0)
+        start = max(tau_min, int(negative[0]) if len(negative) else tau_max)
+        segment = normalized[start - 1:tau_max + 1]
+        if len(segment) < 3:
+            return 0.0, 0.0
+        peaks = np.flatnonzero((segment[1:-1] >= segment[:-2]) & (segment[1:-1] >= segment[2:])) + 1
+        if not len(peaks):
+            return 0.0, 0.0
+        best = segment[peaks].max()
+        if best < 1 - 2 * threshold:
+            return 0.0, max(0.0, float(best))
+
+        tau = start - 1 + int(peaks[np.argmax(segment[peaks] >= 0.9 * best)])
+        return float(sample_rate / refine_lag(normalized, tau, peak=True)), float(normalized[tau])
+
+    energy = np.concatenate(([0.0], np.cumsum(samples[:window + tau_max] ** 2)))
+    difference = energy[window] + (energy[window:window + tau_max + 1] - energy[:tau_max + 1]) - 2 * correlation
+    difference[0] = 0.0
+
+    cumulative = np.cumsum(difference[1:])
+    normalized = np.ones(tau_max + 1)
+    normalized[1:] = difference[1:] * np.arange(1, tau_max + 1) / np.where(cumulative > 0, cumulative, 1)
+
+    below = np.flatnonzero(normalized[tau_min:tau_max] < threshold)
+    if not len(below):
+        return 0.0, max(0.0, 1 - float(normalized[tau_min:tau_max].min()))
+
+    # Walk down to the bottom of the first dip under the threshold
+    tau = tau_min + int(below[0])
+    while tau + 1 < tau_max and normalized[tau + 1] < normalized[tau]:
+        tau += 1
+
+    return float(sample_rate / refine_lag(normalized, tau)), 1 - float(normalized[tau])
+
+
+def refine_lag(curve, tau, peak=False):
+    """
+    Refine a lag with a parabola through its neighbours.
+    """
+    if tau <= 0 or tau + 1 >= len(curve):
+        return float(tau)
+
+    left, middle, right = curve[tau - 1], curve[tau], curve[tau + 1]
+    denominator = left - 2 * middle + right
+    if denominator == 0 or (denominator > 0) == peak:
+        return float(tau)
+
+    return tau + 0.5 * (left - right) / denominator
+
+
+class PracticeFollower:
+    """
+    Follow a player through a list of expected notes.
+
+    Parameters
+    ----------
+    expected : list of dict
+        Notes to play in order, each with 'pitch' (MIDI number) and optionally
+        'label' (tab token), 'note_id' and 'measure'.
+    sample_rate : int
+        Sample rate of the blocks passed to `feed`.
+    method : str
+        Pitch detection method, see `detect_pitch`.
+    look_ahead : int
+        How many expected notes may be skipped to match a played one.
+    stable_blocks : int
+        Blocks a pitch must be held before it counts as played.
+    """
+    def __init__(self, expected, sample_rate=DEFAULT_SAMPLE_RATE, method='yin', look_ahead=2, stable_blocks=2, window_size=WINDOW_SIZE, min_rms=MIN_RMS):
+        if method not in PITCH_METHODS:
+            raise ValueError(f"Unknown pitch detection method '{method}'")
+
+        self.expected = expected
+        self.sample_rate = sample_rate
+        self.method = method
+        self.look_ahead = look_ahead
+        self.stable_blocks = stable_blocks
+        self.min_rms = min_rms
+        self.buffer = np.zeros(window_size, dtype=np.float32)
+        self.reset()
+
+    @classmethod
+    def from_timeline(cls, timeline, **settings):
+        """
+        Expect the top sounding note of every onset of a `PlaybackTimeline`.
+        """
+        expected = []
+        for index in range(len(timeline)):
+            if not timeline.sounding[index]:
+                continue
+            note = {'pitch': timeline.pitches[index], 'note_id': timeline.note_ids[index], 'measure': timeline.measures[index], 'time': timeline.onsets[index]}
+            if expected and expected[-1]['time'] == note['time']:
+                if note['pitch'] > expected[-1]['pitch']:
+                    expected[-1] = note
+            else:
+                expected.append(note)
+
+        return cls(expected, **settings)
+
+    @classmethod
+    def from_events(cls, events, tokens=None, **settings):
+        """
+        Expect the top note of every note or chord placed directly in the measures of `NoteEvents`.
+
+        Parameters
+        ----------
+        tokens : list of str, optional
+            Tab token of every event (see `NoteEvents.tokens`), used as labels.
+        """
+        expected = []
+        for group in events.chord_groups(events.direct()):
+            index = max(group, key=lambda index: events.pitch[index])
+            expected.append({
+                'pitch': float(events.pitch[index]),
+                'label': tokens[index].strip() if tokens else '',
+                'measure': events.measure_numbers[events.measure[index]] if events.measure_numbers else int(events.measure[index]) + 1
+            })
+
+        return cls(expected, **settings)
+
+    def reset(self):
+        self.buffer[:] = 0
+        self.cursor = 0
+        self.results = [None] * len(self.expected)
+        self.hits = 0
+        self.missed = 0
+        self.wrong = 0
+        self.cents = []
+        self.time = 0.0
+        self.candidate = None
+        self.candidate_blocks = 0
+        self.last_note = None
+        self.last_rms = 0.0
+
+    @property
+    def finished(self):
+        return self.cursor >= len(self.expected)
+
+    @property
+    def accuracy(self):
+        attempts = self.hits + self.missed + self.wrong
+        return self.hits / attempts if attempts else 1.0
+
+    def current(self):
+        """
+        Return the next expected note, or None when the piece is finished.
+        """
+        return None if self.finished else self.expected[self.cursor]
+
+    def feed(self, block):
+        """
+        Analyse one block of mono samples.
+
+        Returns
+        -------
+        list of dict
+            What happened in this block, in order. Each item has a 'result'
+            of 'hit', 'missed' or 'wrong', plus 'index', 'time', 'pitch' and,
+            for hits, 'cents' (intonation).
+        """
+        block = np.asarray(block, dtype=np.float32)
+        if block.ndim > 1:
+            block = block.mean(axis=1)
+
+        size = min(len(block), len(self.buffer))
+        self.buffer[:-size] = self.buffer[size:]
+        self.buffer[-size:] = block[-size:]
+        self.time += len(block) / self.sample_rate
+
+        rms = float(np.sqrt(np.mean(block.astype(np.float64) ** 2))) if len(block) else 0.0
+        attack = rms > 2 * self.last_rms + self.min_rms
+        self.last_rms = rms
+
+        if rms < self.min_rms:
+            self.candidate, self.candidate_blocks, self.last_note = None, 0, None
+            return []
+
+        frequency, _ = detect_pitch(self.buffer, self.sample_rate, self.method)
+        if not frequency:
+            self.candidate, self.candidate_blocks = None, 0
+            return []
+
+        pitch = float(frequency_to_midi(frequency))
+        note = int(round(pitch))
+        if attack:
+            # A new breath or tongued attack may repeat the same note
+            self.last_note = None
+        if note == self.candidate:
+            self.candidate_blocks += 1
+        else:
+            self.candidate, self.candidate_blocks = note, 1
+
+        if self.candidate_blocks != self.stable_blocks or note == self.last_note:
+            return []
+
+        self.last_note = note
+        return self.play(pitch)
+
+    def play(self, pitch):
+        """
+        Match one played pitch (MIDI number, fractional) against the expected notes.
+        """
+        if self.finished:
+            return []
+
+        note = int(round(pitch))
+        window = self.expected[self.cursor:self.cursor + 1 + self.look_ahead]
+        for offset, expected in enumerate(window):
+            if int(round(expected['pitch'])) != note:
+                continue
+
+            events = []
+            for index in range(self.cursor, self.cursor + offset):
+                self.results[index] = 'missed'
+                self.missed += 1
+                events.append({'result': 'missed', 'index': index, 'time': self.time, 'pitch': None})
+
+            index = self.cursor + offset
+            cents = round((pitch - expected['pitch']) * 100)
+            self.results[index] = 'hit'
+            self.hits += 1
+            self.cents.append(cents)
+            self.cursor = index + 1
+            events.append({'result': 'hit', 'index': index, 'time': self.time, 'pitch': pitch, 'cents': cents})
+            return events
+
+        self.wrong += 1
+        return [{'result': 'wrong', 'index': self.cursor, 'time': self.time, 'pitch': pitch}]
+
+    def summary(self):
+        """
+        Return the score so far as a dict.
+        """
+        return {
+            'notes': len(self.expected),
+            'hits': self.hits,
+            'missed': self.missed,
+            'wrong': self.wrong,
+            'remaining': len(self.expected) - self.cursor,
+            'accuracy': self.accuracy,
+            'mean_cents': float(np.mean(np.abs(self.cents))) if self.cents else 0.0
+        }
+
+
+class WavBlocks:
+    """
+    Read a WAV file as mono float blocks, one block at a time.
+
+    Integer PCM (8, 16, 24 and 32 bit) and 32/64-bit float files are
+    supported, including the float files written by `AudioExporter`.
+    """
+    def __init__(self, path, block_size=BLOCK_SIZE):
+        self.path = path
+        self.block_size = block_size
+
+        with open(path, 'rb') as file:
+            header = file.read(12)
+            if header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+                raise ValueError('Not a WAV file')
+
+            self.format = None
+            while True:
+                chunk = file.read(8)
+                if len(chunk) < 8:
+                    raise ValueError('WAV file without audio data')
+                chunk_id, chunk_size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+                if chunk_id == b'fmt ':
+                    fmt = file.read(chunk_size + chunk_size % 2)
+                    format_tag, self.channels, self.sample_rate = struct.unpack('<HHI', fmt[:8])
+                    bits = struct.unpack('<H', fmt[14:16])[0]
+                    if format_tag == 0xFFFE and len(fmt) >= 26:
+                        format_tag = struct.unpack('<H', fmt[24:26])[0]
+                    self.format = (format_tag, bits)
+                elif chunk_id == b'data':
+                    if self.format is None:
+                        raise ValueError('WAV data before its format')
+                    self.data_offset, self.data_size = file.tell(), chunk_size
+                    break
+                else:
+                    file.seek(chunk_size + chunk_size % 2, 1)
+
+        format_tag, bits = self.format
+        if format_tag not in (1, 3) or (format_tag == 3 and bits not in (32, 64)) or bits not in (8, 16, 24, 32, 64):
+            raise ValueError(f'Unsupported WAV encoding (format {format_tag}, {bits} bit)')
+        self.frame_size = self.channels * bits // 8
+
+    @property
+    def duration(self):
+        return self.data_size / self.frame_size / self.sample_rate
+
+    def decode(self, data):
+        format_tag, bits = self.format
+        if format_tag == 3:
+            samples = np.frombuffer(data, dtype=np.float32 if bits == 32 else np.float64)
+        elif bits == 8:
+            samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+        elif bits == 24:
+            raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+            samples = (raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8) | (raw[:, 2].astype(np.int8).astype(np.int32) << 16)) / 8388608.0
+        else:
+            dtype = np.int16 if bits == 16 else np.int32
+            samples = np.frombuffer(data, dtype=dtype) / float(np.iinfo(dtype).max + 1)
+
+        return samples.reshape(-1, self.channels).mean(axis=1).astype(np.float32)
+
+    def __iter__(self):
+        with open(self.path, 'rb') as file:
+            file.seek(self.data_offset)
+            remaining = self.data_size - self.data_size % self.frame_size
+            while remaining > 0:
+                data = file.read(min(remaining, self.block_size * self.frame_size))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield self.decode(data[:len(data) - len(data) % self.frame_size])
+
+
+def iter_microphone_blocks(sample_rate=DEFAULT_SAMPLE_RATE, block_size=BLOCK_SIZE, device=None):
+    """
+    Yield mono float blocks from the default (or given) input device until interrupted.
+    """
+    try:
+        import sounddevice
+    except ImportError as e:
+        raise RuntimeError("Live input requires the 'sounddevice' package") from e
+
+    with sounddevice.InputStream(samplerate=sample_rate, blocksize=block_size, channels=1, dtype='float32', device=device) as stream:
+        while True:
+            block, _ = stream.read(block_size)
+            yield block[:, 0]
@@ -0,0 +1,158 @@
+"""
+Memory budget and per-stage memory instrumentation.
+
+The budget is a soft limit on the resident memory of the process. It is set
+with `set_memory_budget` (the command line `--memory-budget` option) or the
+`HARMONICA_TABTOOL_MEMORY_MB` environment variable, and the pipeline asks it
+how many workers to start, how large caches may grow and whether cached
+results should be dropped.
+"""
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Rough resident size of a worker once music21 and verovio are imported
+WORKER_ESTIMATE = 200 * 1024 * 1024
+PRESSURE_FRACTION = 0.8
+
+_budget_bytes = None
+_budget_loaded = False
+
+def set_memory_budget(megabytes):
+    """
+    Set the memory budget in MB; None or 0 removes it.
+    """
+    global _budget_bytes, _budget_loaded
+    _budget_bytes = int(megabytes * 1024 * 1024) if megabytes else None
+    _budget_loaded = True
+
+    # Worker processes read the budget from the environment
+    if _budget_bytes:
+        os.environ['HARMONICA_TABTOOL_MEMORY_MB'] = str(megabytes)
+    else:
+        os.environ.pop('HARMONICA_TABTOOL_MEMORY_MB', None)
+
+
+def get_memory_budget():
+    """
+    Return the memory budget in bytes, or None when there is none.
+    """
+    global _budget_bytes, _budget_loaded
+    if not _budget_loaded:
+        megabytes = os.environ.get('HARMONICA_TABTOOL_MEMORY_MB')
+        _budget_bytes = int(float(megabytes) * 1024 * 1024) if megabytes else None
+        _budget_loaded = True
+
+    return _budget_bytes
+
+
+def current_rss():
+    """
+    Return the resident memory of this process in bytes (0 if unknown).
+    """
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return peak_rss()
+
+
+def peak_rss():
+    """
+    Return the peak resident memory of this process in bytes (0 if unknown).
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS, in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def under_pressure():
+    """
+    Return True when the process uses most of its memory budget.
+    """
+    budget = get_memory_budget()
+
+    return budget is not None and current_rss() > budget * PRESSURE_FRACTION
+
+
+def parallel_workers(requested=None):
+    """
+    Return how many worker processes fit in the remaining budget.
+
+    Parameters
+    ----------
+    requested : int, optional
+        Wanted number of workers, the CPU count by default.
+    """
+    requested = requested or os.cpu_count() or 1
+    budget = get_memory_budget()
+    if budget is None:
+        return requested
+
+    return max(1, min(requested, int((budget - current_rss()) // WORKER_ESTIMATE)))
+
+
+def cache_bytes(default):
+    """
+    Return the size a cache may use: its default, capped at an eighth of the budget.
+    """
+    budget = get_memory_budget()
+
+    return default if budget is None else min(default, budget // 8)
+
+
+class StageProfiler:
+    """
+    Record time, Python allocation peak and resident memory of pipeline stages.
+
+    The allocation peak comes from tracemalloc, which is started on first use
+    if it is not running; it only sees Python allocations, so the resident
+    size is reported as well for native libraries such as verovio.
+    """
+    def __init__(self):
+        self.stages = []
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        tracemalloc.reset_peak()
+        start_traced = tracemalloc.get_traced_memory()[0]
+        start_rss = current_rss()
+        start = time.perf_counter()
+
+        yield
+
+        traced, traced_peak = tracemalloc.get_traced_memory()
+        self.stages.append({
+            'stage': name,
+            'seconds': time.perf_counter() - start,
+            'traced_peak': traced_peak - start_traced,
+            'traced_kept': traced - start_traced,
+            'rss': current_rss(),
+            'rss_growth': current_rss() - start_rss
+        })
+
+    def report(self):
+        lines = [f"{'Stage':<12}  {'Time':>8}  {'Peak alloc':>10}  {'Kept':>10}  {'RSS':>10}"]
+        for stage in self.stages:
+            lines.append(
+                f"{stage['stage']:<12}  {stage['seconds']:>7.2f}s  {format_bytes(stage['traced_peak']):>10}  "
+                f"{format_bytes(stage['traced_kept']):>10}  {format_bytes(stage['rss']):>10}"
+            )
+        return '\n'.join(lines)
+
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB'):
+        if abs(size) < 1024:
+            return f'{size:.0f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GB'
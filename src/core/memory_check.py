@@ -0,0 +1,182 @@
+"""
+Memory regression check over synthetic scores.
+
+Each size runs in a fresh process: a random single-part MIDI file is written,
+then taken through the pipeline stage by stage under `StageProfiler`. The
+Python allocation peak of every stage and the peak resident size of the
+process are compared with the budgets recorded in `assets/memory_budgets.json`.
+
+Very large scores only run the stages that scale to them: the event model
+stages always run, music21 stages up to `MUSIC21_LIMIT` notes and verovio
+stages up to `ENGRAVE_LIMIT` notes.
+"""
+import os
+import json
+import random
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+MUSIC21_LIMIT = 10_000
+ENGRAVE_LIMIT = 10_000
+BUDGETS_PATH = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', '..', 'assets', 'memory_budgets.json'))
+
+def variable_length(value):
+    encoded = [value & 0x7F]
+    value >>= 7
+    while value:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(reversed(encoded))
+
+
+def write_synthetic_midi(file_path, note_count, seed=0):
+    """
+    Write a single-track MIDI file with `note_count` notes.
+
+    The melody is a random walk in the range of a C harmonica, with a triad
+    every eighth note so chord reduction has work to do. Bytes are written
+    directly, so building the file does not weigh on the measured peak.
+    """
+    rng = random.Random(seed)
+    ticks_per_beat = 480
+    track = bytearray()
+    track += b'\x00\xff\x58\x04\x04\x02\x18\x08'  # 4/4
+    track += b'\x00\xff\x51\x03\x07\xa1\x20'  # 120 BPM
+
+    pitch = 72
+    written = 0
+    event = 0
+    while written < note_count:
+        pitch = min(96, max(60, pitch + rng.choice((-2, -1, 1, 2))))
+        duration = rng.choice((240, 480))
+        chord = [pitch, pitch - 4, pitch - 7] if event % 8 == 7 else [pitch]
+        chord = chord[:note_count - written]
+
+        for note in chord:
+            track += bytes((0, 0x90, note, 80))
+        for index, note in enumerate(chord):
+            track += variable_length(duration if index == 0 else 0) + bytes((0x80, note, 0))
+
+        written += len(chord)
+        event += 1
+    track += b'\x00\xff\x2f\x00'
+
+    with open(file_path, 'wb') as file:
+        file.write(b'MThd' + (6).to_bytes(4, 'big') + (0).to_bytes(2, 'big') + (1).to_bytes(2, 'big') + ticks_per_beat.to_bytes(2, 'big'))
+        file.write(b'MTrk' + len(track).to_bytes(4, 'big') + bytes(track))
+
+
+def profile_size(note_count):
+    """
+    Run the pipeline stages on a synthetic score and return the measurements.
+
+    Meant to run in its own process, so the peak resident size belongs to this
+    score alone.
+    """
+    from core import pipeline
+    from core.engraver import get_engraver, shutdown_engraver
+    from core.events import NoteEvents
+    from core.memory import StageProfiler, peak_rss
+    from handlers.score import ScoreEditor
+
+    if note_count <= ENGRAVE_LIMIT:
+        # verovio runs on the engraver workers: starting one is not part of any stage
+        get_engraver().warm_up()
+    profiler = StageProfiler()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, f'synthetic_{note_count}.mid')
+        write_synthetic_midi(file_path, note_count)
+
+        with profiler.stage('events'):
+            events = NoteEvents.from_midi(file_path)
+        with profiler.stage('tab'):
+            events = events.select(events.chord_reduction()[0])
+            events.tab_text(events.tokens(ScoreEditor().harp_map('C4', 'Standard Richter', 'diatonic')), True)
+        del events
+
+        if note_count <= MUSIC21_LIMIT:
+            with profiler.stage('parse'):
+                piece = pipeline.select_part(pipeline.load(file_path))
+            with profiler.stage('label'):
+                piece = pipeline.label(piece, 'Synthetic', pipeline.harmonica_options())['piece']
+            with profiler.stage('musicxml'):
+                musicxml_data = pipeline.to_musicxml(piece)
+            del piece
+
+            if note_count <= ENGRAVE_LIMIT:
+                with profiler.stage('engrave'):
+                    mei_data = pipeline.engrave(musicxml_data)
+                with profiler.stage('pages'):
+                    for _ in pipeline.iter_svg_pages(mei_data):
+                        pass
+    shutdown_engraver()
+
+    return {
+        'notes': note_count,
+        'stages': {stage['stage']: stage for stage in profiler.stages},
+        'peak_rss': peak_rss(),
+        'report': profiler.report()
+    }
+
+
+def measure(note_count):
+    """
+    Profile one size in a fresh spawned process.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(profile_size, note_count).result()
+
+
+def load_budgets(path=BUDGETS_PATH):
+    if not os.path.exists(path):
+        return {}
+
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def record_budgets(results, path=BUDGETS_PATH):
+    """
+    Store the measured peaks as the new budgets, keeping other sizes.
+    """
+    budgets = load_budgets(path)
+    for result in results:
+        budgets[str(result['notes'])] = {
+            'peak_rss': result['peak_rss'],
+            'stages': {name: stage['traced_peak'] for name, stage in result['stages'].items()}
+        }
+
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(budgets, file, indent=2, sort_keys=True)
+        file.write('\n')
+
+
+def check_budget(result, budgets, tolerance=0.15):
+    """
+    Compare one measurement with its recorded budget.
+
+    Returns
+    -------
+    list of str
+        One message per value over budget (plus tolerance); empty when it passes
+        or when no budget was recorded for that size.
+    """
+    budget = budgets.get(str(result['notes']))
+    if budget is None:
+        return []
+
+    failures = []
+    limit = budget['peak_rss'] * (1 + tolerance)
+    if result['peak_rss'] > limit:
+        failures.append(f"{result['notes']} notes: peak RSS {result['peak_rss']} > {limit:.0f}")
+
+    for name, stage in result['stages'].items():
+        if name in budget['stages']:
+            limit = budget['stages'][name] * (1 + tolerance)
+            if stage['traced_peak'] > limit:
+                failures.append(f"{result['notes']} notes: stage {name} peak {stage['traced_peak']} > {limit:.0f}")
+
+    return failures
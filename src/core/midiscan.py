@@ -0,0 +1,180 @@
+"""
+Pre-scan of MIDI files, and parsing of a single track.
+
+music21 turns every track of a MIDI file into a full `Part` (drums, strings,
+everything) just to show one of them. Here `mido` reads the raw messages
+instead: `scan_midi` lists the parts with their names, channels, note
+counts and ranges without building any notation, and `load_part` hands only
+the chosen track (plus the tracks holding tempo, time and key signatures) to
+music21. Parse time and memory then follow the selected part, not the whole
+arrangement.
+
+Parts are numbered like music21 numbers them: one part per track with notes,
+in file order.
+"""
+import io
+import os
+
+import mido
+
+MIDI_EXTENSIONS = ('.mid', '.midi')
+NOTE_NAMES = ('C', 'C#', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'Ab', 'A', 'Bb', 'B')
+DRUM_CHANNEL = 9
+
+def is_midi(file_path):
+    return os.path.splitext(file_path)[1].lower() in MIDI_EXTENSIONS
+
+
+def note_name(midi_pitch):
+    return f'{NOTE_NAMES[midi_pitch % 12]}{midi_pitch // 12 - 1}'
+
+
+def has_notes(track):
+    # The same test as music21, so both agree on which tracks are parts
+    return any(message.type == 'note_on' for message in track)
+
+
+def scan_track(track):
+    """
+    Summarize the notes of one track.
+
+    Returns
+    -------
+    dict
+        'name' (track or instrument name, '' if none), 'channels' (sorted),
+        'notes' (sounding note-ons), 'low' and 'high' (MIDI pitches, None
+        without notes) and 'drums' (only the percussion channel is used).
+    """
+    name, instrument = '', ''
+    channels = set()
+    notes, low, high = 0, None, None
+
+    for message in track:
+        if message.type == 'note_on':
+            channels.add(message.channel)
+            if message.velocity:
+                notes += 1
+                low = message.note if low is None else min(low, message.note)
+                high = message.note if high is None else max(high, message.note)
+        elif message.type == 'track_name' and not name:
+            name = message.name.strip()
+        elif message.type == 'instrument_name' and not instrument:
+            instrument = message.name.strip()
+
+    return {
+        'name': name or instrument,
+        'channels': sorted(channels),
+        'notes': notes,
+        'low': low,
+        'high': high,
+        'drums': channels == {DRUM_CHANNEL}
+    }
+
+
+def scan_midi(file_path):
+    """
+    List the parts of a MIDI file without parsing its notation.
+
+    Parameters
+    ----------
+    file_path : str
+        MIDI file.
+
+    Returns
+    -------
+    list of dict
+        One entry per part, as returned by `scan_track`, plus 'part' (number
+        of the part, starting at 1) and 'track' (index of its MIDI track).
+    """
+    midi_file = mido.MidiFile(file_path)
+    parts = []
+
+    for track_index, track in enumerate(midi_file.tracks):
+        if has_notes(track):
+            parts.append(dict(scan_track(track), part=len(parts) + 1, track=track_index))
+
+    return parts
+
+
+def part_label(part):
+    """
+    Return the Choose Part label of a scanned part, e.g. '2° Violin (G3-E6, 412 notes)'.
+    """
+    name = part['name'] or ('Drums' if part['drums'] else f"Channel {', '.join(str(channel + 1) for channel in part['channels'])}")
+    if part['low'] is None:
+        return f"{part['part']}° {name} (no notes)"
+
+    return f"{part['part']}° {name} ({note_name(part['low'])}-{note_name(part['high'])}, {part['notes']} notes)"
+
+
+def extract_part(file_path, part=1):
+    """
+    Return a MIDI file holding only one part and the tracks without notes.
+
+    Parameters
+    ----------
+    file_path : str
+        MIDI file.
+    part : int
+        Number of the part, starting at 1.
+
+    Returns
+    -------
+    tuple
+        The bytes of the smaller MIDI file and the number of parts of the
+        original one.
+    """
+    midi_file = mido.MidiFile(file_path)
+    note_tracks = [track for track in midi_file.tracks if has_notes(track)]
+    if not 1 <= part <= len(note_tracks):
+        raise IndexError(f'Part {part} not found, the file has {len(note_tracks)} part(s)')
+
+    chosen = note_tracks[part - 1]
+    # Tempo, time and key signatures live in the tracks without notes
+    extracted = mido.MidiFile(type=1, ticks_per_beat=midi_file.ticks_per_beat)
+    extracted.tracks = [track for track in midi_file.tracks if track is chosen or not has_notes(track)]
+
+    buffer = io.BytesIO()
+    extracted.save(file=buffer)
+
+    return buffer.getvalue(), len(note_tracks)
+
+
+def load_part(file_path, part=1):
+    """
+    Parse only one part of a MIDI file with music21.
+
+    The tracks are translated the way `converter.parse` translates them, so
+    the part matches `score.parts[part - 1]` of the whole parsed file (music21
+    only shows the tempo marks of the tracks without notes on the first part).
+
+    Returns
+    -------
+    tuple
+        A `Score` with the single part and the number of parts in the file.
+    """
+    from music21 import stream
+    from music21.midi import MidiFile
+    from music21.midi.translate import midiTrackToStream
+
+    midi_data, part_count = extract_part(file_path, part)
+    midi_file = MidiFile()
+    midi_file.readstr(midi_data)
+
+    score = stream.Score()
+    conductor_part = stream.Part()
+    for track in midi_file.tracks:
+        if track.hasNotes():
+            target = stream.Part()
+            score.insert(0, target)
+        else:
+            target = conductor_part
+        midiTrackToStream(
+            track,
+            ticksPerQuarter=midi_file.ticksPerQuarterNote,
+            inputM21=target,
+            conductorPart=conductor_part,
+            isFirst=part == 1 and target is not conductor_part
+        )
+
+    return score, part_count
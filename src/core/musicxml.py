@@ -0,0 +1,212 @@
+"""
+Streaming MusicXML reader for the note event model.
+
+Plain `.musicxml`/`.xml` files and compressed `.mxl` archives are read with
+lxml's `iterparse`, straight from the zip member for `.mxl` (nothing is
+extracted to disk). Only the selected part is turned into events, measure by
+measure, and every parsed measure is freed right away, so memory stays
+proportional to the notes of that part. music21 is not involved; it is only
+needed when the score is engraved.
+"""
+import os
+import zipfile
+from contextlib import contextmanager
+
+import numpy as np
+from lxml import etree
+
+from core.events import NoteEvents
+
+MUSICXML_EXTENSIONS = ('.musicxml', '.xml', '.mxl')
+STEP_PITCH_CLASSES = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+
+def is_musicxml(file_path):
+    return os.path.splitext(file_path)[1].lower() in MUSICXML_EXTENSIONS
+
+
+@contextmanager
+def open_musicxml(file_path):
+    """
+    Open the score document of a MusicXML file or `.mxl` archive as a binary stream.
+    """
+    if not zipfile.is_zipfile(file_path):
+        with open(file_path, 'rb') as file:
+            yield file
+        return
+
+    with zipfile.ZipFile(file_path) as archive:
+        names = archive.namelist()
+        root_path = None
+        if 'META-INF/container.xml' in names:
+            container = etree.fromstring(archive.read('META-INF/container.xml'))
+            root_files = [element.get('full-path') for element in container.iter() if local_name(element) == 'rootfile']
+            root_path = next((path for path in root_files if path in names), None)
+        if root_path is None:
+            root_path = next(name for name in names if name.lower().endswith(('.xml', '.musicxml')) and not name.startswith('META-INF/'))
+
+        with archive.open(root_path) as file:
+            yield file
+
+
+def local_name(element):
+    tag = element.tag
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else ''
+
+
+def child_text(element, name, default=None):
+    for child in element:
+        if local_name(child) == name:
+            return child.text
+    return default
+
+
+def has_child(element, name):
+    return any(local_name(child) == name for child in element)
+
+
+def read_part_events(file_path, part=1):
+    """
+    Read the events of one part of a partwise MusicXML file.
+
+    Notes joined by `<chord/>` share a chord ID, grace notes get a zero
+    duration, and measures with several `<voice>` values put each voice in
+    its own event voice (numbered by first appearance, rests included), as
+    music21 does; a single-voice measure is voice 0. Chord symbols
+    (`<harmony>`) are not notes and are left out, as in `NoteEvents.from_part`.
+
+    Parameters
+    ----------
+    file_path : str
+        `.musicxml`, `.xml` or `.mxl` file.
+    part : int
+        Number of the part, starting at 1.
+
+    Returns
+    -------
+    tuple
+        The `NoteEvents` of the part and the number of parts in the score.
+    """
+    onsets, durations, pitches, chords, measures, voices, chord_sizes = [], [], [], [], [], [], []
+    measure_numbers = []
+    part_count = 0
+    divisions = 1.0
+    measure_offset = 0.0
+    chord_id = -1
+
+    with open_musicxml(file_path) as file:
+        for event, element in etree.iterparse(file, events=('start', 'end'), remove_comments=True, resolve_entities=False):
+            name = local_name(element)
+
+            if event == 'start':
+                if name == 'part':
+                    part_count += 1
+                continue
+
+            if name == 'measure' and part_count == part:
+                measure_events, measure_length, divisions, voice_ids = read_measure(element, divisions)
+
+                measure_index = len(measure_numbers)
+                number = element.get('number', '')
+                measure_numbers.append(int(number) if number.isdigit() else measure_index + 1)
+
+                # Voices follow each other, each in time order, as in `NoteEvents.from_part`
+                measure_events.sort(key=lambda event: (voice_ids.index(event[4]), event[0]))
+                for onset, duration, pitch, new_chord, voice_id in measure_events:
+                    if new_chord:
+                        chord_id += 1
+                        chord_sizes.append(0)
+                    chord_sizes[-1] += 1
+                    onsets.append(measure_offset + onset)
+                    durations.append(duration)
+                    pitches.append(pitch)
+                    chords.append(chord_id)
+                    measures.append(measure_index)
+                    voices.append(voice_ids.index(voice_id) + 1 if len(voice_ids) > 1 else 0)
+
+                measure_offset += measure_length
+
+            if name in ('measure', 'part'):
+                # Free what has been read; the document never builds up in memory
+                element.clear()
+                parent = element.getparent()
+                if parent is not None:
+                    while element.getprevious() is not None:
+                        del parent[0]
+
+    chord_ids = np.asarray(chords, dtype=np.int32)
+    sizes = np.asarray(chord_sizes, dtype=np.int32)
+
+    events = NoteEvents(
+        onsets,
+        durations,
+        pitches,
+        chord_ids,
+        measures,
+        voices,
+        sizes[chord_ids] > 1 if len(chord_ids) else [],
+        measure_numbers=measure_numbers
+    )
+
+    return events, part_count
+
+
+def read_measure(measure, divisions):
+    """
+    Read the pitched notes of one measure.
+
+    Returns
+    -------
+    tuple
+        A list of `(onset, duration, ps, starts_chord, voice)` with times in
+        quarter lengths from the start of the measure, the measure length in
+        quarter lengths, the divisions in effect at its end and the voices of
+        its notes and rests in order of appearance.
+    """
+    notes = []
+    voice_ids = []
+    cursor = 0.0
+    longest = 0.0
+    chord_onset = 0.0
+
+    for child in measure:
+        name = local_name(child)
+
+        if name == 'attributes':
+            value = child_text(child, 'divisions')
+            if value:
+                divisions = float(value)
+        elif name == 'backup':
+            cursor -= float(child_text(child, 'duration', 0)) / divisions
+        elif name == 'forward':
+            cursor += float(child_text(child, 'duration', 0)) / divisions
+            longest = max(longest, cursor)
+        elif name == 'note':
+            is_grace = has_child(child, 'grace')
+            duration = 0.0 if is_grace else float(child_text(child, 'duration', 0)) / divisions
+            in_chord = has_child(child, 'chord')
+
+            if in_chord:
+                onset = chord_onset
+            else:
+                onset = chord_onset = cursor
+                cursor += duration
+                longest = max(longest, cursor)
+
+            voice_id = child_text(child, 'voice', '1')
+            if voice_id not in voice_ids:
+                voice_ids.append(voice_id)
+
+            pitch = next((item for item in child if local_name(item) == 'pitch'), None)
+            if pitch is None:
+                continue
+
+            step = child_text(pitch, 'step', 'C')
+            alter = float(child_text(pitch, 'alter', 0) or 0)
+            octave = int(child_text(pitch, 'octave', 4))
+            ps = (octave + 1) * 12 + STEP_PITCH_CLASSES[step.strip().upper()] + alter
+
+            # A chord note whose first note was a rest starts a chord of its own
+            starts_chord = not in_chord or not notes or notes[-1][0] != onset
+            notes.append((onset, duration, ps, starts_chord, voice_id))
+
+    return notes, longest, divisions, voice_ids
@@ -0,0 +1,404 @@
+"""
+Qt-free conversion pipeline: load -> filter keys -> reduce -> label -> engrave -> export.
+
+Every step takes and returns plain data (paths, strings, bytes, lists and
+dicts, with music21 streams passed between the score steps), and nothing here
+imports PySide6, so scripts, workers and servers can use it without a display.
+Only `export_pdf` needs Qt, which it imports when called.
+
+MusicXML files (`.musicxml`, `.xml` and compressed `.mxl`) have a fast path
+for everything short of engraving: `load_events` streams one part straight into
+the note event model and `label_events` tabs it, so music21 is only loaded
+when a sheet has to be drawn. MIDI files are cut down to the chosen track
+before music21 sees them (see `core.midiscan`). Plain-text tabs (`.txt` and
+`.tab`, see `core.tab_import`) are read as a C harp of the type they are
+written for, and take the same fast path.
+"""
+import numpy as np
+from types import SimpleNamespace
+from music21 import converter
+from music21.musicxml.m21ToXml import GeneralObjectExporter
+
+from constants.tunings import HARMONICA_KEYS
+from core.engraver import get_engraver
+from core.events import NoteEvents
+from core.midiscan import is_midi, load_part as load_midi_part
+from core.musicxml import is_musicxml, read_part_events
+from core.tab_import import is_tab, load_tab, load_tab_events
+from handlers.converters import slice_measures
+from handlers.score import ScoreEditor
+
+KEY_FILTERS = {'bends': '\'', 'overblows': 'o', 'missing': '?'}
+
+
+def harmonica_options(type='Diatonic', tuning='Standard Richter', key='C', reduce_chords=True, transpose=0):
+    """
+    Build the options dict used by `process` from a key name.
+
+    Returns
+    -------
+    dict
+        'type', 'tuning', 'key_name', 'key' (pitch of the lowest hole),
+        'reduce_chords' and 'transpose'.
+    """
+    return {
+        'type': type,
+        'tuning': tuning,
+        'key_name': key,
+        'key': dict(HARMONICA_KEYS)[key] if type == 'Diatonic' else 'C4',
+        'reduce_chords': reduce_chords,
+        'transpose': transpose
+    }
+
+
+def load(file_path):
+    """
+    Parse a MIDI, MusicXML, `.mxl` or tab file into a music21 score.
+    """
+    if is_tab(file_path):
+        return load_tab(file_path)[0]
+
+    return converter.parse(file_path)
+
+
+def select_part(score, part=1, measures=None):
+    """
+    Copy one part of a score, optionally only a range of measures.
+
+    Parameters
+    ----------
+    score : Score
+        Score returned by `load`; it is never modified.
+    part : int
+        Number of the part, starting at 1.
+    measures : tuple of int, optional
+        First and last measure numbers, inclusive.
+
+    Returns
+    -------
+    Part
+        A copy the other steps can edit freely.
+    """
+    return slice_measures(score.parts[part - 1], measures)
+
+
+def load_part(file_path, part=1, measures=None):
+    """
+    Parse one part of a song file into a music21 part.
+
+    Only the chosen track of a MIDI file is parsed; MusicXML files are
+    parsed whole.
+
+    Parameters
+    ----------
+    file_path : str
+        MIDI, `.musicxml`, `.xml`, `.mxl`, `.txt` or `.tab` file.
+    part : int
+        Number of the part, starting at 1.
+    measures : tuple of int, optional
+        First and last measure numbers, inclusive.
+
+    Returns
+    -------
+    tuple
+        A copy of the part (as returned by `select_part`) and the number of
+        parts in the score.
+    """
+    if is_midi(file_path):
+        score, part_count = load_midi_part(file_path, part)
+        return select_part(score, 1, measures), part_count
+
+    score = load(file_path)
+    if part > len(score.parts):
+        raise IndexError(f'Part {part} not found, the score has {len(score.parts)} part(s)')
+
+    return select_part(score, part, measures), len(score.parts)
+
+
+def load_events(file_path, part=1, measures=None):
+    """
+    Read one part of a song file into note events.
+
+    MusicXML, `.mxl` and tab files are read without music21; the chosen
+    track of a MIDI file is parsed by music21 (for its quantization and
+    measures) and walked once.
+
+    Parameters
+    ----------
+    file_path : str
+        MIDI, `.musicxml`, `.xml`, `.mxl`, `.txt` or `.tab` file.
+    part : int
+        Number of the part, starting at 1.
+    measures : tuple of int, optional
+        First and last measure numbers, inclusive.
+
+    Returns
+    -------
+    tuple
+        The `NoteEvents` of the part and the number of parts in the score.
+    """
+    if is_tab(file_path):
+        events, part_count = load_tab_events(file_path)[0], 1
+    elif is_musicxml(file_path):
+        events, part_count = read_part_events(file_path, part)
+    else:
+        piece, part_count = load_part(file_path, part, measures)
+        return NoteEvents.from_part(piece), part_count
+
+    if part > part_count:
+        raise IndexError(f'Part {part} not found, the score has {part_count} part(s)')
+
+    if measures is not None and len(events):
+        numbers = np.asarray(events.measure_numbers)[events.measure]
+        events = events.select((numbers >= measures[0]) & (numbers <= measures[1]))
+
+    return events, part_count
+
+
+def measure_bounds(score, part=1):
+    """
+    Return the first and last measure numbers of a part.
+    """
+    part_measures = score.parts[part - 1].getElementsByClass('Measure')
+    if not part_measures:
+        return 1, 1
+
+    return part_measures.first().number, part_measures.last().number
+
+
+def playable_keys(piece, tuning='Standard Richter', bends=True, overblows=True, missing=True, key_options=None):
+    """
+    Return the diatonic keys that can play a piece with the allowed techniques.
+
+    Parameters
+    ----------
+    piece : Part
+        The (transposed) part to check.
+    tuning : str
+        Diatonic tuning name.
+    bends, overblows, missing : bool
+        Whether keys needing bends, overblows or missing notes are kept.
+    key_options : list of tuples, optional
+        `(name, pitch)` keys to filter, `HARMONICA_KEYS` by default.
+
+    Returns
+    -------
+    list of tuples
+        The remaining `(name, pitch)` keys, in the original order.
+    """
+    score_editor = ScoreEditor()
+    keys = list(HARMONICA_KEYS if key_options is None else key_options)
+    allowed = {'bends': bends, 'overblows': overblows, 'missing': missing}
+
+    for name, char in KEY_FILTERS.items():
+        if not allowed[name]:
+            keys = score_editor.filter_keys(piece, tuning, keys, char)
+
+    return keys
+
+
+def reduce(piece):
+    """
+    Keep only the highest note of every chord, in place.
+
+    Returns
+    -------
+    tuple
+        The piece, the number of reduced chords and the number of removed notes.
+    """
+    return ScoreEditor().chords_handler(piece)
+
+
+def label(piece, title, options, write_back=True, measure_tabs=False):
+    """
+    Transpose, title, reduce and label a part with harmonica tabs, in place.
+
+    Parameters
+    ----------
+    piece : Part
+        Part returned by `select_part`.
+    title : str
+        Song name shown on the sheet.
+    options : dict
+        As returned by `harmonica_options`.
+    write_back : bool
+        If False, chord reduction and labels only go to the tablature text and
+        the music21 part keeps its chords and gets no lyrics; enough when it
+        will not be engraved.
+    measure_tabs : bool
+        If True, the result also has 'measure_tabs', the `(measure number,
+        tab text)` of every measure, for previews drawn before engraving.
+
+    Returns
+    -------
+    dict
+        'piece', 'tab_in_text', 'removed_chords', 'removed_notes' and
+        'measure_stats' (repeated measures, see `ScoreEditor.measure_stats`).
+    """
+    score_editor = ScoreEditor()
+    removed_chords, removed_notes = 0, 0
+
+    piece = score_editor.transpose(piece, options.get('transpose', 0))
+    piece = score_editor.edit_metadata(piece, title, options['key_name'])
+    if options['reduce_chords']:
+        piece, removed_chords, removed_notes = score_editor.chords_handler(piece, write_back)
+    piece, tab_in_text = score_editor.label_notes(
+        piece,
+        options['type'],
+        options['tuning'],
+        options['key'],
+        options['reduce_chords'],
+        write_back
+    )
+
+    result = {
+        'piece': piece,
+        'tab_in_text': tab_in_text,
+        'removed_chords': removed_chords,
+        'removed_notes': removed_notes,
+        'measure_stats': score_editor.measure_stats()
+    }
+    if measure_tabs:
+        result['measure_tabs'] = score_editor.measure_tabs(piece, options['reduce_chords'])
+
+    return result
+
+
+def label_events(events, options):
+    """
+    Transpose, reduce and tab note events; the event model twin of `label`.
+
+    Parameters
+    ----------
+    events : NoteEvents
+        Events returned by `load_events`; they are transposed in place.
+    options : dict
+        As returned by `harmonica_options`.
+
+    Returns
+    -------
+    dict
+        'tab_in_text', 'removed_chords', 'removed_notes' and 'measure_stats'.
+    """
+    score_editor = ScoreEditor()
+    removed_chords, removed_notes = 0, 0
+
+    events = score_editor.transpose(events, options.get('transpose', 0))
+    if options['reduce_chords']:
+        _, removed_chords, removed_notes = score_editor.chords_handler(events, write_back=False)
+    _, tab_in_text = score_editor.label_notes(
+        events,
+        options['type'],
+        options['tuning'],
+        options['key'],
+        options['reduce_chords'],
+        write_lyrics=False
+    )
+
+    return {
+        'tab_in_text': tab_in_text,
+        'removed_chords': removed_chords,
+        'removed_notes': removed_notes,
+        'measure_stats': score_editor.measure_stats()
+    }
+
+
+def to_musicxml(piece):
+    """
+    Serialize a part to a MusicXML string, without temporary files.
+    """
+    return GeneralObjectExporter(piece).parse().decode('utf-8')
+
+
+def engrave(musicxml_data):
+    """
+    Convert MusicXML data to MEI with verovio, on the crash-isolated workers of `core.engraver`.
+    """
+    return get_engraver().engrave(musicxml_data)
+
+
+def iter_svg_pages(mei_data):
+    """
+    Render MEI data page by page on the verovio workers, yielding each SVG page as a string.
+    """
+    return get_engraver().iter_svg_pages(mei_data)
+
+
+def render_midi(mei_data):
+    """
+    Render MEI data to the bytes of a MIDI file on the verovio workers.
+    """
+    return get_engraver().render_midi(mei_data)
+
+
+def export_pdf(svg_pages, output_path, title='', progress=None):
+    """
+    Write SVG pages to a PDF file and return the number of pages.
+
+    This is the only step that needs Qt (QtSvg and QtGui, no widgets); it runs
+    on the offscreen platform when there is no display.
+    """
+    from handlers.pdf import PDFExporter
+
+    return PDFExporter(SimpleNamespace(file_name=title)).export(svg_pages, output_path, progress)
+
+
+def process(piece, title, options, engrave_score=True):
+    """
+    Label and (optionally) engrave a part.
+
+    Returns
+    -------
+    dict
+        'tab_in_text', 'removed_chords', 'removed_notes', 'measure_stats',
+        'musicxml', 'mei_data' and 'svg_pages' (the last three are None
+        without engraving).
+    """
+    result = label(piece, title, options, engrave_score)
+    piece = result.pop('piece')
+    result.update(musicxml=None, mei_data=None, svg_pages=None)
+
+    if engrave_score:
+        result['musicxml'] = to_musicxml(piece)
+        result['mei_data'] = engrave(result['musicxml'])
+        result['svg_pages'] = list(iter_svg_pages(result['mei_data']))
+
+    return result
+
+
+def convert(file_path, title, options, part=1, measures=None, engrave_score=True):
+    """
+    Run the whole pipeline on one part of a song file.
+
+    Parameters
+    ----------
+    file_path : str
+        MIDI or MusicXML file.
+    title : str
+        Song name shown on the sheet.
+    options : dict
+        As returned by `harmonica_options`.
+    part : int
+        Number of the part, starting at 1.
+    measures : tuple of int, optional
+        First and last measure numbers, inclusive.
+    engrave_score : bool
+        If False, only the tablature text is produced; MusicXML and tab
+        files then take the fast path and are never parsed by music21.
+
+    Returns
+    -------
+    dict
+        As returned by `process`, plus 'part_count'.
+    """
+    if not engrave_score and (is_musicxml(file_path) or is_tab(file_path)):
+        events, part_count = load_events(file_path, part, measures)
+        result = label_events(events, options)
+        result.update(musicxml=None, mei_data=None, svg_pages=None, part_count=part_count)
+        return result
+
+    piece, part_count = load_part(file_path, part, measures)
+    result = process(piece, title, options, engrave_score)
+    result['part_count'] = part_count
+
+    return result
@@ -0,0 +1,414 @@
+"""
+Differential check of the tablature against recorded golden outputs.
+
+The golden outputs are the tabs of the plain `ScoreEditor` path (no measure
+memo): for every source and every type, tuning, key and chord setting, the
+digest of the tab text, plus the chord reduction counts and the keys kept by
+`filter_keys` for every diatonic tuning and key filter. They are recorded in
+`assets/tab_goldens.json`.
+
+Sources are the parts of the bundled songs, the MusicXML export of each of
+them, the parts of a few music21 corpus scores (chord symbols, several
+voices per measure) and seeded random scores (chords, unplayable and equal pitches, voices,
+empty and repeated measures, pickup numbering). An engine is any other way
+of producing the same results: the measure memo, the streaming MusicXML
+reader or the part worker pool. Each one is run over its sources and checked
+against the records. A differing tab is compared with the plain path again to
+report its first differing measure.
+"""
+import os
+import json
+import glob
+import random
+import hashlib
+
+from constants.tunings import HARMONICA_TUNINGS, HARMONICA_KEYS
+from core import pipeline
+from core.events import NoteEvents
+from handlers.score import ScoreEditor
+
+GOLDENS_PATH = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', '..', 'assets', 'tab_goldens.json'))
+SONGS_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', '..', 'songs'))
+DEFAULT_SEEDS = 8
+RANDOM_MEASURES = 48
+DIGEST_SIZE = 5
+CORPUS_SCORES = ('monteverdi/madrigal.4.11.mxl',)
+
+def combinations():
+    """
+    Yield every `(type, tuning, key name, key pitch)` of the tuning tables.
+
+    Chromatic harps are tabbed from C4 only, as the app does.
+    """
+    for tuning in HARMONICA_TUNINGS['diatonic']:
+        for key_name, key in HARMONICA_KEYS:
+            yield 'Diatonic', tuning, key_name, key
+    for tuning in HARMONICA_TUNINGS['chromatic']:
+        yield 'Chromatic', tuning, 'C', 'C4'
+
+
+def digest(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=DIGEST_SIZE).hexdigest()
+
+
+def random_events(seed, measure_count=RANDOM_MEASURES):
+    """
+    Build a random part as note events, the same for every run of a seed.
+
+    Measures hold notes, rests and chords (single-note chords and repeated
+    pitches included) over a range wider than any harp, sometimes extra
+    voices; some are empty and about a third repeat an earlier measure, so
+    the measure memo has hits to take.
+    """
+    rng = random.Random(seed)
+    beats = rng.choice((3.0, 4.0))
+    pitch = rng.randint(55, 80)
+    measures = []
+
+    for _ in range(measure_count):
+        if measures and rng.random() < 0.35:
+            measures.append(rng.choice(measures))
+            continue
+
+        groups = []
+        if rng.random() > 0.1:
+            position = 0.0
+            while position < beats:
+                duration = min(rng.choice((0.25, 0.5, 1.0, 1.5, 2.0)), beats - position)
+                if rng.random() > 0.15:
+                    pitch = min(105, max(30, pitch + rng.randint(-5, 5)))
+                    size = rng.choice((2, 3, 4)) if rng.random() < 0.25 else 1
+                    pitches = [pitch + rng.choice((0, -3, -4, -5, -7, -12)) for _ in range(size)]
+                    pitches[0] = pitch
+                    rng.shuffle(pitches)
+                    if rng.random() < 0.01:
+                        pitches[-1] += 0.5
+                    groups.append((position, duration, tuple(pitches), size > 1 or rng.random() < 0.05, 0))
+                position += duration
+
+        for voice in range(1, 3 if rng.random() < 0.2 else 1):
+            for position in (0.0, beats / 2):
+                groups.append((position, beats / 2, (rng.randint(40, 90),), False, voice))
+
+        measures.append(tuple(groups))
+
+    onsets, durations, pitches, chords, measure_indexes, voices, in_chord = [], [], [], [], [], [], []
+    chord_id = 0
+    for measure_index, groups in enumerate(measures):
+        for position, duration, group_pitches, is_chord, voice in groups:
+            for group_pitch in group_pitches:
+                onsets.append(measure_index * beats + position)
+                durations.append(duration)
+                pitches.append(group_pitch)
+                chords.append(chord_id)
+                measure_indexes.append(measure_index)
+                voices.append(voice)
+                in_chord.append(is_chord)
+            chord_id += 1
+
+    first_number = rng.choice((0, 1))
+    measure_numbers = list(range(first_number, first_number + measure_count))
+
+    return NoteEvents(onsets, durations, pitches, chords, measure_indexes, voices, in_chord, measure_numbers=measure_numbers)
+
+
+def song_sources(songs_dir=SONGS_DIR):
+    """
+    Yield every part of the bundled MIDI songs as a source.
+    """
+    for file_path in sorted(glob.glob(os.path.join(songs_dir, '*.mid'))):
+        part_count = 1
+        part_number = 1
+        while part_number <= part_count:
+            piece, part_count = pipeline.load_part(file_path, part_number)
+            yield {
+                'name': f'{os.path.basename(file_path)}#{part_number}',
+                'events': NoteEvents.from_part(piece),
+                'piece': piece
+            }
+            part_number += 1
+
+
+def musicxml_sources(sources, temp_dir):
+    """
+    Yield the MusicXML export of every source with a music21 part.
+
+    The events come from music21 reading the file back, the reference of the
+    streaming reader, which gets the file itself.
+    """
+    from music21 import converter
+
+    for source in sources:
+        if source.get('piece') is None:
+            continue
+
+        file_path = os.path.join(temp_dir, f"{len(os.listdir(temp_dir))}.musicxml")
+        with open(file_path, 'w', encoding='utf-8') as file:
+            file.write(pipeline.to_musicxml(source['piece']))
+        piece = converter.parse(file_path, forceSource=True).parts[0]
+
+        yield {
+            'name': f"{source['name']}.musicxml",
+            'events': NoteEvents.from_part(piece),
+            'piece': piece,
+            'file': file_path
+        }
+
+
+def corpus_sources(scores=CORPUS_SCORES):
+    """
+    Yield every part of the music21 corpus scores; the streaming reader gets the file.
+    """
+    from music21 import corpus, converter
+
+    for name in scores:
+        file_path = str(corpus.getWork(name))
+        for part_number, piece in enumerate(converter.parse(file_path, forceSource=True).parts, start=1):
+            yield {
+                'name': f'{name}#{part_number}',
+                'events': NoteEvents.from_part(piece),
+                'piece': piece,
+                'file': file_path,
+                'part': part_number
+            }
+
+
+def random_sources(seeds=DEFAULT_SEEDS):
+    for seed in range(seeds):
+        yield {'name': f'random#{seed}', 'events': random_events(seed)}
+
+
+def iter_sources(seeds=DEFAULT_SEEDS, temp_dir=None, songs_dir=SONGS_DIR):
+    """
+    Yield the song parts, then their MusicXML exports (written to `temp_dir`,
+    none without it), the corpus scores and the random scores of the first
+    `seeds` seeds.
+    """
+    songs = list(song_sources(songs_dir))
+    yield from songs
+    if temp_dir is not None:
+        yield from musicxml_sources(songs, temp_dir)
+    yield from corpus_sources()
+    yield from random_sources(seeds)
+
+
+def label_source(events, combos, memo_min_hit_rate=float('inf')):
+    """
+    Tab the events for every combination the way the app does, one editor each.
+
+    Parameters
+    ----------
+    events : NoteEvents
+        Events of the source; they are not modified.
+    combos : list of tuple
+        As yielded by `combinations`.
+    memo_min_hit_rate : float
+        Of the editors; infinite for the plain path, 0 to always take the memo.
+
+    Returns
+    -------
+    dict
+        'tabs' (text per `(type, tuning, key name, reduce chords)`), 'removed'
+        (reduced chords and removed notes) and 'filters' (kept key names per
+        `(tuning, filter name)`).
+    """
+    tabs = {}
+    removed = [0, 0]
+
+    for type, tuning, key_name, key in combos:
+        for reduce_chords in (True, False):
+            editor = ScoreEditor()
+            editor.memo_min_hit_rate = memo_min_hit_rate
+            if reduce_chords:
+                _, removed[0], removed[1] = editor.chords_handler(events, write_back=False)
+            _, tabs[type, tuning, key_name, reduce_chords] = editor.label_notes(events, type, tuning, key, reduce_chords, write_lyrics=False)
+
+    editor = ScoreEditor()
+    editor.memo_min_hit_rate = memo_min_hit_rate
+    filters = {
+        (tuning, name): [key_name for key_name, _ in editor.filter_keys(events, tuning, HARMONICA_KEYS, char)]
+        for tuning in HARMONICA_TUNINGS['diatonic']
+        for name, char in pipeline.KEY_FILTERS.items()
+    }
+
+    return {'tabs': tabs, 'removed': removed, 'filters': filters}
+
+
+def plain_engine(source, combos):
+    return label_source(source['events'], combos)
+
+
+def memo_engine(source, combos):
+    return label_source(source['events'], combos, memo_min_hit_rate=0)
+
+
+def streaming_engine(source, combos):
+    from core.musicxml import read_part_events
+
+    events, _ = read_part_events(source['file'], source.get('part', 1))
+    return label_source(events, combos)
+
+
+def process_combos(piece, title, combos):
+    """
+    Tab a part for every combination through `pipeline.process`, in a part worker.
+    """
+    results = {}
+    for type, tuning, key_name, key in combos:
+        for reduce_chords in (True, False):
+            options = {'type': type, 'tuning': tuning, 'key_name': key_name, 'key': key, 'reduce_chords': reduce_chords}
+            results[type, tuning, key_name, reduce_chords] = pipeline.process(piece, title, options, False)
+
+    return results
+
+
+def parallel_engine(source, combos):
+    """
+    Tab a part on the part worker pool, one task per type and tuning.
+
+    The part makes the same pickled round trip as with `process_all_parts`.
+    """
+    from handlers.parts import get_part_pool
+
+    pool = get_part_pool()
+    tunings = {}
+    for combo in combos:
+        tunings.setdefault(combo[:2], []).append(combo)
+    futures = [pool.submit(process_combos, source['piece'], source['name'], tuning_combos) for tuning_combos in tunings.values()]
+
+    results = {}
+    for future in futures:
+        results.update(future.result())
+    reduced = next(result for (*_, reduce_chords), result in results.items() if reduce_chords)
+    filters = {
+        (tuning, name): [key_name for key_name, _ in pipeline.playable_keys(source['piece'], tuning, **{filter_name: filter_name != name for filter_name in pipeline.KEY_FILTERS})]
+        for tuning in HARMONICA_TUNINGS['diatonic']
+        for name in pipeline.KEY_FILTERS
+    }
+
+    return {
+        'tabs': {combo: result['tab_in_text'] for combo, result in results.items()},
+        'removed': [reduced['removed_chords'], reduced['removed_notes']],
+        'filters': filters
+    }
+
+
+# Engine name: (function, which sources it can tab)
+ENGINES = {
+    'plain': (plain_engine, lambda source: True),
+    'memo': (memo_engine, lambda source: True),
+    'streaming': (streaming_engine, lambda source: 'file' in source),
+    'parallel': (parallel_engine, lambda source: source.get('piece') is not None)
+}
+
+
+def to_record(result):
+    """
+    Return the golden record of an engine result: digests instead of tab texts.
+    """
+    tabs = {}
+    for (type, tuning, key_name, reduce_chords), text in result['tabs'].items():
+        pair = tabs.setdefault(type, {}).setdefault(tuning, {}).setdefault(key_name, [None, None])
+        pair[0 if reduce_chords else 1] = digest(text)
+
+    filters = {}
+    for (tuning, name), keys in result['filters'].items():
+        filters.setdefault(tuning, {})[name] = keys
+
+    return {'removed': result['removed'], 'tabs': tabs, 'filters': filters}
+
+
+def load_goldens(path=GOLDENS_PATH):
+    if not os.path.exists(path):
+        return {}
+
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def record_goldens(sources, combos, path=GOLDENS_PATH):
+    """
+    Record the plain path over the sources as the new golden outputs, keeping other sources.
+    """
+    goldens = load_goldens(path)
+    for source in sources:
+        goldens[source['name']] = to_record(plain_engine(source, combos))
+
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(goldens, file, indent=1, sort_keys=True)
+        file.write('\n')
+
+    return len(goldens)
+
+
+def first_difference(source, combo, text):
+    """
+    Compare a tab text with the plain path and describe its first differing measure.
+
+    Returns
+    -------
+    str
+        Measure number with the expected and the produced text of that measure.
+    """
+    type, tuning, key_name, reduce_chords = combo
+    key = dict(HARMONICA_KEYS)[key_name] if type == 'Diatonic' else 'C4'
+    editor = ScoreEditor()
+    editor.memo_min_hit_rate = float('inf')
+    if reduce_chords:
+        editor.chords_handler(source['events'], write_back=False)
+    _, expected = editor.label_notes(source['events'], type, tuning, key, reduce_chords, write_lyrics=False)
+
+    if expected == text:
+        return 'the plain path gives the same text, so the recorded output changed'
+
+    position = next((index for index, (a, b) in enumerate(zip(expected, text)) if a != b), min(len(expected), len(text)))
+    events = editor.get_events(source['events'])
+    measures = events.measure.tolist()
+    measure, measure_start, measure_end = None, 0, 0
+    for index, group in events.group_tabs(events.tokens(editor.harmonica_mapping), reduce_chords):
+        if measures[index] != measure:
+            if measure_end > position:
+                break
+            measure, measure_start = measures[index], measure_end
+        measure_end += len(group)
+
+    numbers = events.measure_numbers
+    number = numbers[measure] if measure is not None and measure < len(numbers) else (measure or 0) + 1
+    expected_measure = expected[measure_start:measure_end].strip()
+    produced_measure = text[measure_start:measure_end].strip()
+
+    return f'measure {number}: expected "{expected_measure}", got "{produced_measure}"'
+
+
+def check_source(engine, source, combos, record):
+    """
+    Run an engine on one source and compare it with its golden record.
+
+    Returns
+    -------
+    tuple
+        The number of combinations checked and one message per difference.
+    """
+    result = ENGINES[engine][0](source, combos)
+    name = f"{engine} {source['name']}"
+    failures = []
+
+    if list(result['removed']) != list(record['removed']):
+        failures.append(f"{name}: removed chords/notes {result['removed']} instead of {record['removed']}")
+
+    for (tuning, filter_name), keys in result['filters'].items():
+        expected = record['filters'].get(tuning, {}).get(filter_name)
+        if keys != expected:
+            failures.append(f"{name}: {tuning} without {filter_name} keeps {keys} instead of {expected}")
+
+    for combo, text in result['tabs'].items():
+        type, tuning, key_name, reduce_chords = combo
+        expected = record['tabs'].get(type, {}).get(tuning, {}).get(key_name, [None, None])[0 if reduce_chords else 1]
+        if digest(text) != expected:
+            chords = 'reduced chords' if reduce_chords else 'kept chords'
+            if expected is None:
+                failures.append(f"{name} {type}/{tuning}/{key_name}/{chords}: not recorded")
+            else:
+                failures.append(f"{name} {type}/{tuning}/{key_name}/{chords}: {first_difference(source, combo, text)}")
+
+    return len(result['tabs']), failures
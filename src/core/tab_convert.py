@@ -0,0 +1,307 @@
+"""
+Conversion of tabs between harps by table lookup.
+
+A harp is a `(type, tuning, key name)` triple, e.g. `('Diatonic', 'Paddy
+Richter', 'G')`. The token a note gets on a harp only depends on its tuning
+and on how many semitones its key lies from the key of the source harp, so
+one table per pair of tunings and key distance converts every token of the
+source tuning: the table matrix covers all the harps of `HARMONICA_TUNINGS`
+and `HARMONICA_KEYS` with a few thousand small dictionaries, built once.
+Notes out of reach of the target harp are moved by whole octaves when
+`octave_fallback` is on, otherwise they become `?`.
+
+Tab texts, MusicXML files exported by the app and the MEI data of an
+engraved sheet are rewritten with these tables alone: nothing is parsed into
+notes, labeled or engraved again.
+"""
+import os
+import re
+from html import unescape
+
+from music21 import pitch
+
+from constants.tunings import HARMONICA_TUNINGS, HARMONICA_KEYS
+from core.musicxml import is_musicxml
+from core.tab_import import TOKEN_PATTERN, is_tab, reverse_index
+
+MAX_OCTAVE_SHIFT = 3
+MISSING = '?'
+MUSICXML_LYRIC_PATTERN = re.compile(r'(<lyric\b[^>]*>.*?<text>)([^<]*)(</text>)', re.S)
+MEI_SYL_PATTERN = re.compile(r'(<syl\b[^>]*>)([^<]*)(</syl>)')
+KEY_OF_PATTERN = re.compile(r'(<creator type="composer">|<persName role="composer">)Key of [^<]*')
+
+_tables = {}
+
+def harp_key(type, key_name):
+    """
+    Return the pitch (`ps`) of the lowest hole of a harp; chromatic harps are in C4.
+    """
+    return pitch.Pitch(dict(HARMONICA_KEYS)[key_name] if type == 'Diatonic' else 'C4').ps
+
+
+def harps(type=None, tuning=None):
+    """
+    Yield every `(type, tuning, key name)` harp, optionally of one type or tuning.
+    """
+    for harp_type, tunings in (('Diatonic', HARMONICA_TUNINGS['diatonic']), ('Chromatic', HARMONICA_TUNINGS['chromatic'])):
+        if type not in (None, harp_type):
+            continue
+        for harp_tuning in tunings:
+            if tuning not in (None, harp_tuning):
+                continue
+            for key_name in ([key for key, _ in HARMONICA_KEYS] if harp_type == 'Diatonic' else ['C']):
+                yield harp_type, harp_tuning, key_name
+
+
+def conversion_table(source, target, octave_fallback=True):
+    """
+    Return the target token of every token of the source harp.
+
+    Tables are built once per pair of tunings and key distance, so every
+    source and target harp with the same distance share one.
+
+    Parameters
+    ----------
+    source, target : tuple
+        `(type, tuning, key name)` harps.
+    octave_fallback : bool
+        If True, notes out of reach of the target harp get the token of the
+        nearest octave that fits; otherwise they get `?`.
+
+    Returns
+    -------
+    dict
+        Stripped source token to `(target token, octaves)`: the token as
+        the tuning table writes it (diatonic tokens keep their leading space)
+        and the octaves the note was moved by (None for `?`).
+    """
+    shift = int(harp_key(source[0], source[2]) - harp_key(target[0], target[2]))
+    table_key = (source[0], source[1], target[0], target[1], shift, octave_fallback)
+
+    if table_key not in _tables:
+        target_tokens = HARMONICA_TUNINGS[target[0].lower()][target[1]]
+        playable = [step for step, token in enumerate(target_tokens) if token.strip()]
+        table = {}
+
+        for token, step in reverse_index(source[0], source[1]).items():
+            target_step = step + shift
+            octaves = 0
+            if octave_fallback and playable:
+                while target_step + 12 * octaves < playable[0] and octaves < MAX_OCTAVE_SHIFT:
+                    octaves += 1
+                while target_step + 12 * octaves > playable[-1] and octaves > -MAX_OCTAVE_SHIFT:
+                    octaves -= 1
+            target_step += 12 * octaves
+
+            if 0 <= target_step < len(target_tokens) and target_tokens[target_step].strip():
+                table[token] = (target_tokens[target_step], octaves)
+            else:
+                table[token] = (MISSING, None)
+
+        _tables[table_key] = table
+
+    return _tables[table_key]
+
+
+def precompute_tables(sources=None, targets=None, octave_fallback=True):
+    """
+    Build the tables of every source and target harp pair, by default all of them.
+
+    Returns
+    -------
+    int
+        Number of distinct tables built so far.
+    """
+    targets = list(harps() if targets is None else targets)
+    for source in (harps() if sources is None else sources):
+        for target in targets:
+            conversion_table(source, target, octave_fallback)
+
+    return len(_tables)
+
+
+def lookup(table, token):
+    """
+    Return `(target token, octaves)` for a token, as written in a tab or a lyric.
+    """
+    token = token.strip()
+    if token in table:
+        return table[token]
+    if token and token[0] not in '+-':
+        # Chromatic chords lose the sign of their first note
+        return table.get('+' + token, table.get('-' + token, (MISSING, None)))
+
+    return MISSING, None
+
+
+def new_stats():
+    return {'notes': 0, 'shifted': 0, 'missing': 0}
+
+
+def count(stats, octaves):
+    stats['notes'] += 1
+    if octaves is None:
+        stats['missing'] += 1
+    elif octaves:
+        stats['shifted'] += 1
+
+
+def convert_text(text, source, target, octave_fallback=True):
+    """
+    Rewrite a tab text for another harp.
+
+    Everything but the notes is kept as written: spacing, chords, bars, `?`
+    and the lines holding words, which are left alone like `core.tab_import`
+    skips them. Notes the source harp does not have become `?`.
+
+    Returns
+    -------
+    tuple
+        The converted text and its stats: 'notes', 'shifted' (moved by
+        octaves) and 'missing' (written `?`).
+    """
+    table = conversion_table(source, target, octave_fallback)
+    spaced = target[0] == 'Diatonic'
+    pieces, stats = [], new_stats()
+    line, line_stats, line_start, words = [], new_stats(), 0, False
+    end = 0
+
+    for match in TOKEN_PATTERN.finditer(text):
+        separator = text[end:match.start()]
+        line.append(separator)
+        kind = match.lastgroup
+
+        if kind == 'note':
+            token, octaves = lookup(table, match.group())
+            count(line_stats, octaves)
+            # Chromatic tokens are written back to back, diatonic ones are not
+            if spaced and not separator and end and text[end - 1] not in '(\n':
+                line.append(' ')
+            line.append(token.strip())
+        else:
+            if kind == 'missing':
+                count(line_stats, None)
+            words = words or kind == 'word'
+            line.append(match.group())
+        end = match.end()
+
+        if kind == 'line':
+            pieces.append(text[line_start:end] if words else ''.join(line))
+            if not words:
+                for name in stats:
+                    stats[name] += line_stats[name]
+            line, line_stats, line_start, words = [], new_stats(), end, False
+
+    line.append(text[end:])
+    pieces.append(text[line_start:] if words else ''.join(line))
+    if not words:
+        for name in stats:
+            stats[name] += line_stats[name]
+
+    return ''.join(pieces), stats
+
+
+def convert_labels(data, source, target, octave_fallback=True):
+    """
+    Rewrite the tabs of a labeled MusicXML score or MEI sheet for another harp.
+
+    The lyrics (`<lyric>` texts of MusicXML, `<syl>` of MEI) are looked up
+    and the 'Key of' composer line is renamed; the notes are not touched, so
+    an MEI sheet only has to be rendered again.
+
+    Parameters
+    ----------
+    data : str
+        MusicXML written by the app, or the MEI data of its engraved sheet.
+
+    Returns
+    -------
+    tuple
+        The converted data and its stats, as returned by `convert_text`.
+    """
+    table = conversion_table(source, target, octave_fallback)
+    stats = new_stats()
+
+    def replace_lyric(match):
+        token, octaves = lookup(table, unescape(match.group(2)))
+        count(stats, octaves)
+        return match.group(1) + (token if token != MISSING else ' ' + MISSING) + match.group(3)
+
+    data = MUSICXML_LYRIC_PATTERN.sub(replace_lyric, data)
+    data = MEI_SYL_PATTERN.sub(replace_lyric, data)
+    data = KEY_OF_PATTERN.sub(lambda match: f'{match.group(1)}Key of {target[2]}', data, count=1)
+
+    return data, stats
+
+
+def is_convertible(file_path):
+    return is_tab(file_path) or (is_musicxml(file_path) and not file_path.lower().endswith('.mxl'))
+
+
+def convert_data(file_path, data, source, target, octave_fallback=True):
+    """
+    Convert the contents of a tab file or of a MusicXML file labeled by the app.
+    """
+    if is_tab(file_path):
+        return convert_text(data, source, target, octave_fallback)
+
+    return convert_labels(data, source, target, octave_fallback)
+
+
+def output_path(file_path, output_dir, source, target):
+    """
+    Return the file a conversion is written to, e.g. `song_G.txt` or `song_Paddy_Richter_G.txt`.
+    """
+    base, extension = os.path.splitext(os.path.basename(file_path))
+    parts = [base] + ([target[1]] if target[1] != source[1] else []) + [target[2]]
+
+    return os.path.join(output_dir, '_'.join(part.replace(' ', '_') for part in parts) + extension)
+
+
+def convert_files(files, output_dir, source, targets, octave_fallback=True):
+    """
+    Convert tab and labeled MusicXML files for every target harp.
+
+    Each file is read once and rewritten for all the targets.
+
+    Yields
+    ------
+    tuple
+        The source file, the target harp, and either `(output path, stats)`
+        or the exception raised.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    targets = list(targets)
+
+    for file_path in files:
+        try:
+            with open(file_path, 'r', encoding='utf-8') as file:
+                data = file.read()
+        except Exception as e:
+            for target in targets:
+                yield file_path, target, e
+            continue
+
+        for target in targets:
+            try:
+                converted, stats = convert_data(file_path, data, source, target, octave_fallback)
+                path = output_path(file_path, output_dir, source, target)
+                with open(path, 'w', encoding='utf-8') as file:
+                    file.write(converted)
+                yield file_path, target, (path, stats)
+            except Exception as e:
+                yield file_path, target, e
+
+
+def convert_folder(folder, output_dir, source, targets, octave_fallback=True):
+    """
+    Convert every tab and labeled MusicXML file of a folder, as `convert_files`.
+
+    Subfolders are not entered, so the output can live inside the folder.
+    """
+    files = [
+        os.path.join(folder, name) for name in sorted(os.listdir(folder))
+        if is_convertible(name) and os.path.isfile(os.path.join(folder, name))
+    ]
+
+    return convert_files(files, output_dir, source, targets, octave_fallback)
@@ -0,0 +1,254 @@
+"""
+Import of plain-text harmonica tabs.
+
+Tabs like `4 -4 5 -5 6` are turned back into notes with reverse indexes of
+the tuning tables: for every tuning, the hole token of each semitone above
+the key of the harp. The text is read in a single regular expression pass,
+so even long tab collections import in linear time. The app's own tab
+output reads back as is: bends (`'`), overblows (`o`), chromatic slides (`s`),
+missing notes (`?`) and unreduced chords in parentheses.
+
+Tabs have no rhythm, so every note or chord is a quarter note. Measures are
+filled in order and also end at a line break or a `|`; lines holding words
+(titles, lyrics, 'Part 1:' headers) are skipped. `read_tab_events` builds the
+note event model, enough to tab the song for another harp; `load_tab` also
+builds a music21 score to engrave and play.
+"""
+import os
+import re
+
+from music21 import chord, meter, metadata, note, pitch, stream
+
+from constants.tunings import HARMONICA_TUNINGS
+from core.events import NoteEvents
+
+TAB_EXTENSIONS = ('.txt', '.tab')
+TOKEN_PATTERN = re.compile(
+    r"(?P<note>[+-]?\d+(?:'+|o|s)?)|(?P<missing>\?)|(?P<open>\()|(?P<close>\))"
+    r"|(?P<bar>\|)|(?P<line>\n)|(?P<word>[^\s\d()|?+\-]+|[+\-])"
+)
+BEATS_PER_MEASURE = 4
+
+_reverse_indexes = {}
+
+def is_tab(file_path):
+    return os.path.splitext(file_path)[1].lower() in TAB_EXTENSIONS
+
+
+def reverse_index(type, tuning):
+    """
+    Return the semitone offset above the harp key of every token of a tuning.
+
+    Tokens are stripped of their leading space; a token written twice in a
+    table keeps its lower note. Indexes are built once per tuning.
+
+    Parameters
+    ----------
+    type : str
+        'Diatonic' or 'Chromatic'.
+    tuning : str
+        Tuning name in `HARMONICA_TUNINGS`.
+    """
+    if (type, tuning) not in _reverse_indexes:
+        index = {}
+        for step, token in enumerate(HARMONICA_TUNINGS[type.lower()][tuning]):
+            if token.strip():
+                index.setdefault(token.strip(), step)
+        _reverse_indexes[type, tuning] = index
+
+    return _reverse_indexes[type, tuning]
+
+
+def detect_type(text):
+    """
+    Guess the harmonica type of a tab: chromatic tabs mark blows with `+` or use the slide `s`.
+    """
+    for match in TOKEN_PATTERN.finditer(text):
+        token = match.group('note')
+        if token and (token[0] == '+' or token[-1] == 's'):
+            return 'Chromatic'
+
+    return 'Diatonic'
+
+
+def read_tab_events(text, type='Diatonic', tuning='Standard Richter', key='C4', beats=BEATS_PER_MEASURE):
+    """
+    Read a tab text into note events.
+
+    Parameters
+    ----------
+    text : str
+        The tab.
+    type : str
+        'Diatonic' or 'Chromatic'.
+    tuning : str
+        Tuning the tab was written for.
+    key : str
+        Pitch of the harp key the tab was written for, e.g. 'C4'.
+    beats : int
+        Quarter notes per measure.
+
+    Returns
+    -------
+    tuple
+        The `NoteEvents` (missing notes `?` become rests) and the tokens of
+        the tuning that were not found in it, e.g. a 10 hole bend on a
+        chromatic tab.
+    """
+    index = reverse_index(type, tuning)
+    base_ps = pitch.Pitch(key).ps
+    onsets, durations, pitches, chords, measures, in_chord = [], [], [], [], [], []
+    unknown = set()
+
+    # Notes and chords of the current line, as (pitches, is chord); no pitch is a rest
+    line, group, in_group, words = [], None, False, False
+    position = 0
+
+    def flush_line():
+        nonlocal line, words, position
+        if not words:
+            for group_pitches, is_chord in line:
+                # Chords are written top note first and stored the other way round
+                for group_pitch in reversed(group_pitches):
+                    onsets.append(float(position))
+                    durations.append(1.0)
+                    pitches.append(group_pitch)
+                    chords.append(position)
+                    measures.append(position // beats)
+                    in_chord.append(is_chord)
+                position += 1
+            if line and position % beats:
+                position += beats - position % beats
+        line, words = [], False
+
+    for match in TOKEN_PATTERN.finditer(text):
+        kind = match.lastgroup
+        if kind == 'note':
+            token = match.group()
+            step = index.get(token)
+            if step is None and token[0] not in '+-':
+                # Chromatic chords lose the sign of their first note; blows are tried first
+                step = index.get('+' + token, index.get('-' + token))
+            if step is None:
+                unknown.add(token)
+            if in_group:
+                group.extend([] if step is None else [base_ps + step])
+            else:
+                line.append(([] if step is None else [base_ps + step], False))
+        elif kind == 'missing':
+            if not in_group:
+                line.append(([], False))
+        elif kind == 'open':
+            if not in_group:
+                group, in_group = [], True
+        elif kind == 'close':
+            if in_group:
+                line.append((group, True))
+                in_group = False
+        elif kind == 'word':
+            words = True
+        elif not in_group:
+            flush_line()
+
+    if in_group:
+        line.append((group, True))
+    flush_line()
+
+    measure_count = -(-position // beats)
+    events = NoteEvents(
+        onsets, durations, pitches, chords, measures, [0] * len(pitches), in_chord,
+        measure_numbers=list(range(1, measure_count + 1))
+    )
+
+    return events, sorted(unknown)
+
+
+def events_to_part(events, beats=BEATS_PER_MEASURE):
+    """
+    Build a music21 part of quarter notes from imported events.
+
+    Every measure is filled with notes, chords and rests and appended once,
+    so the part is built in linear time.
+    """
+    part = stream.Part()
+    onsets = events.onset.tolist()
+    pitches = events.pitch.tolist()
+    measures = events.measure.tolist()
+    in_chord = events.in_chord.tolist()
+    event_index = 0
+
+    for measure_index, measure_number in enumerate(events.measure_numbers):
+        measure = stream.Measure(number=measure_number)
+        if measure_index == 0:
+            measure.coreInsert(0, meter.TimeSignature(f'{beats}/4'))
+
+        for beat in range(beats):
+            onset = measure_index * beats + beat
+            group_pitches, is_chord = [], False
+            while event_index < len(pitches) and measures[event_index] == measure_index and onsets[event_index] == onset:
+                group_pitches.append(pitches[event_index])
+                is_chord = in_chord[event_index]
+                event_index += 1
+
+            if not group_pitches:
+                element = note.Rest(quarterLength=1)
+            elif not is_chord:
+                element = note.Note(pitch.Pitch(ps=group_pitches[0]), quarterLength=1)
+            else:
+                element = chord.Chord([pitch.Pitch(ps=group_pitch) for group_pitch in group_pitches], quarterLength=1)
+            measure.coreInsert(beat, element)
+
+        measure.coreElementsChanged()
+        part.coreAppend(measure)
+
+    part.coreElementsChanged()
+    return part
+
+
+def load_tab_events(file_path, type=None, tuning=None, key='C4', beats=BEATS_PER_MEASURE):
+    """
+    Read a tab file into note events, without music21.
+
+    Parameters
+    ----------
+    file_path : str
+        Text file holding the tab.
+    type : str, optional
+        'Diatonic' or 'Chromatic'; guessed from the tab when omitted (see `detect_type`).
+    tuning : str, optional
+        Tuning of the tab, Standard Richter or Solo by default.
+    key : str
+        Pitch of the harp key the tab was written for.
+
+    Returns
+    -------
+    tuple
+        As returned by `read_tab_events`.
+    """
+    with open(file_path, 'r', encoding='utf-8') as file:
+        text = file.read()
+
+    type = type or detect_type(text)
+    tuning = tuning or ('Standard Richter' if type == 'Diatonic' else 'Solo')
+
+    return read_tab_events(text, type, tuning, key, beats)
+
+
+def load_tab(file_path, type=None, tuning=None, key='C4', beats=BEATS_PER_MEASURE):
+    """
+    Read a tab file into a single part score, titled after the file.
+
+    Takes the same parameters as `load_tab_events`.
+
+    Returns
+    -------
+    tuple
+        The `Score` and the unknown tokens (see `read_tab_events`).
+    """
+    events, unknown = load_tab_events(file_path, type, tuning, key, beats)
+
+    score = stream.Score()
+    score.insert(0, metadata.Metadata(title=os.path.splitext(os.path.basename(file_path))[0]))
+    score.insert(0, events_to_part(events, beats))
+
+    return score, unknown
@@ -0,0 +1,143 @@
+import re
+
+from core.engraver import get_engraver
+
+MEASURE_TAG_PATTERN = re.compile(r'<measure\b[^>]*>')
+TIE_TAG_PATTERN = re.compile(r'<tie\b[^>]*>')
+XML_ID_PATTERN = re.compile(r'\bxml:id="([^"]+)"')
+NUMBER_PATTERN = re.compile(r'\bn="(\d+)"')
+END_ID_PATTERN = re.compile(r'\bendid="#?([^"]+)"')
+
+MIN_SPEED = 0.25
+MAX_SPEED = 2.0
+
+class PlaybackTimeline:
+    """
+    Precompiled playback timeline of an engraved score.
+
+    Built once per MEI from the verovio timemap, it holds every note in
+    playing order with its onset and duration (seconds at the written tempo),
+    MIDI pitch, SVG element ID and measure number. Changing the speed or the
+    A-B loop only changes how onsets are scaled and which event follows which,
+    so nothing is rendered again while playing.
+    """
+    __slots__ = ('onsets', 'durations', 'pitches', 'note_ids', 'measures', 'sounding', 'measure_starts', 'speed', 'loop')
+
+    def __init__(self, onsets, durations, pitches, note_ids, measures, sounding, measure_starts=None):
+        self.onsets = onsets
+        self.durations = durations
+        self.pitches = pitches
+        self.note_ids = note_ids
+        self.measures = measures
+        self.sounding = sounding
+        self.measure_starts = measure_starts or {}
+        self.speed = 1.0
+        self.loop = None
+
+    def __len__(self):
+        return len(self.onsets)
+
+    @classmethod
+    def from_mei(cls, mei_data, timemap=None):
+        """
+        Build the timeline of MEI data.
+
+        Notes that continue a tie are kept for highlighting but marked as not
+        sounding, so they are not struck again. `timemap` is the output of
+        `EngraverPool.timemap` when it is already rendered; otherwise it is
+        rendered on the verovio workers.
+        """
+        measure_numbers = {}
+        for tag in MEASURE_TAG_PATTERN.findall(mei_data):
+            measure_id, number = XML_ID_PATTERN.search(tag), NUMBER_PATTERN.search(tag)
+            if measure_id and number:
+                measure_numbers[measure_id.group(1)] = int(number.group(1))
+
+        tied = set()
+        for tag in TIE_TAG_PATTERN.findall(mei_data):
+            end_id = END_ID_PATTERN.search(tag)
+            if end_id:
+                tied.add(end_id.group(1))
+
+        if timemap is None:
+            timemap = get_engraver().timemap(mei_data)
+
+        onsets, durations, pitches, note_ids, measures, sounding = [], [], [], [], [], []
+        measure_starts = {}
+        measure = 0
+        for entry in timemap:
+            if 'measureOn' in entry:
+                measure = measure_numbers.get(entry['measureOn'], measure + 1)
+                measure_starts.setdefault(measure, entry['tstamp'] / 1000)
+            for note_id, duration, pitch in entry.get('notes', []):
+                onsets.append(entry['tstamp'] / 1000)
+                durations.append(duration / 1000)
+                pitches.append(pitch)
+                note_ids.append(note_id)
+                measures.append(measure)
+                sounding.append(note_id not in tied)
+
+        return cls(onsets, durations, pitches, note_ids, measures, sounding, measure_starts)
+
+    def set_speed(self, speed):
+        """
+        Set the playback speed as a factor of the written tempo (0.25 to 2).
+        """
+        self.speed = min(MAX_SPEED, max(MIN_SPEED, speed))
+
+    def set_loop(self, first_measure=None, last_measure=None):
+        """
+        Loop playback over a range of measures; without arguments the loop is removed.
+
+        Returns
+        -------
+        bool
+            False when no note falls in the range (the loop is then removed).
+        """
+        self.loop = None
+        if first_measure is None:
+            return True
+
+        first_measure, last_measure = min(first_measure, last_measure), max(first_measure, last_measure)
+        indexes = [index for index, measure in enumerate(self.measures) if first_measure <= measure <= last_measure]
+        if not indexes:
+            return False
+
+        # The loop spans whole measures, including rests at either end
+        loop_start = self.measure_starts.get(first_measure, self.onsets[indexes[0]])
+        loop_end = self.measure_starts.get(
+            last_measure + 1,
+            max(self.onsets[index] + self.durations[index] for index in indexes)
+        )
+        self.loop = (indexes[0], indexes[-1], loop_start, loop_end)
+        return True
+
+    def start_index(self):
+        return self.loop[0] if self.loop else 0
+
+    def next_index(self, index):
+        """
+        Return the event after `index`, wrapping inside the loop; None at the end.
+        """
+        if self.loop and (index >= self.loop[1] or index < self.loop[0]):
+            return self.loop[0]
+        if index + 1 >= len(self):
+            return None
+        return index + 1
+
+    def delay(self, index, next_index):
+        """
+        Return the wait in seconds between two events at the current speed.
+        """
+        if next_index is None:
+            return 0.0
+        if next_index == index + 1:
+            return (self.onsets[next_index] - self.onsets[index]) / self.speed
+        if self.loop and index == self.loop[1]:
+            # Wrapping around the loop: finish the loop, then wait for the first note
+            _, _, loop_start, loop_end = self.loop
+            return (max(0.0, loop_end - self.onsets[index]) + self.onsets[next_index] - loop_start) / self.speed
+
+        # Jumping into a loop set elsewhere: keep the current note's length
+        following = min(index + 1, len(self) - 1)
+        return max(0.0, self.onsets[following] - self.onsets[index]) / self.speed
@@ -0,0 +1,174 @@
+import os
+from PySide6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QLineEdit, QPushButton, QComboBox, QSpinBox,
+    QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView, QFileDialog, QProgressDialog, QApplication
+)
+from PySide6.QtCore import Qt
+
+from constants.tunings import HARMONICA_TUNINGS, HARMONICA_KEYS
+from handlers.library import SongLibrary
+
+ANY = "Any"
+NOTE_NAMES = ['C', 'C#', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'Ab', 'A', 'Bb', 'B']
+RESULT_COLUMNS = ["Song", "Part", "Harp", "Bends", "Overblows", "Missing", "Range", "Best Fit"]
+
+def note_name(midi):
+    return '' if midi is None else f"{NOTE_NAMES[midi % 12]}{midi // 12 - 1}"
+
+
+class LibraryPanel(QDialog):
+    """
+    Search panel of the song library.
+
+    Indexes song folders and lists the parts playable on a harp, easiest
+    first. Double-clicking a result opens the song with that part and harp.
+    """
+    def __init__(self, main_window):
+        super().__init__(main_window)
+        self.main_window = main_window
+        self.library = SongLibrary()
+        self.results = []
+
+        self.setWindowTitle("Song Library")
+        self.resize(960, 560)
+        layout = QVBoxLayout(self)
+
+        folder_layout = QHBoxLayout()
+        self.folder = QLineEdit()
+        self.folder.setPlaceholderText("Folder of MIDI and MusicXML songs")
+        folder_layout.addWidget(self.folder)
+        browse_button = QPushButton("Browse...")
+        browse_button.clicked.connect(self.choose_folder)
+        folder_layout.addWidget(browse_button)
+        index_button = QPushButton("Index")
+        index_button.clicked.connect(self.index_folder)
+        folder_layout.addWidget(index_button)
+        layout.addLayout(folder_layout)
+
+        filters_layout = QFormLayout()
+        self.harmonica_type = QComboBox()
+        self.harmonica_type.addItems([ANY, "Diatonic", "Chromatic"])
+        self.harmonica_tuning = QComboBox()
+        self.harmonica_tuning.addItems([ANY] + sorted({tuning for tunings in HARMONICA_TUNINGS.values() for tuning in tunings}))
+        self.harmonica_key = QComboBox()
+        self.harmonica_key.addItems([ANY] + [key for key, _ in HARMONICA_KEYS])
+        self.max_bends = self.limit_spin_box()
+        self.max_overblows = self.limit_spin_box()
+        self.max_missing = self.limit_spin_box(0)
+        self.text = QLineEdit()
+        self.text.setPlaceholderText("Title or path")
+
+        filters_layout.addRow("Type", self.harmonica_type)
+        filters_layout.addRow("Tuning", self.harmonica_tuning)
+        filters_layout.addRow("Key", self.harmonica_key)
+        filters_layout.addRow("Max Bends", self.max_bends)
+        filters_layout.addRow("Max Overblows", self.max_overblows)
+        filters_layout.addRow("Max Missing Notes", self.max_missing)
+        filters_layout.addRow("Search", self.text)
+        layout.addLayout(filters_layout)
+
+        for combo_box in (self.harmonica_type, self.harmonica_tuning, self.harmonica_key):
+            combo_box.currentIndexChanged.connect(self.search)
+        for spin_box in (self.max_bends, self.max_overblows, self.max_missing):
+            spin_box.valueChanged.connect(self.search)
+        self.text.textChanged.connect(self.search)
+
+        self.table = QTableWidget(0, len(RESULT_COLUMNS))
+        self.table.setHorizontalHeaderLabels(RESULT_COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.cellDoubleClicked.connect(self.open_result)
+        layout.addWidget(self.table)
+
+        self.search()
+
+    def limit_spin_box(self, value=-1):
+        spin_box = QSpinBox()
+        spin_box.setRange(-1, 9999)
+        spin_box.setSpecialValueText(ANY)
+        spin_box.setValue(value)
+        return spin_box
+
+    def choose_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Choose a Song Folder", self.folder.text())
+        if folder:
+            self.folder.setText(folder)
+            self.index_folder()
+
+    def index_folder(self):
+        folder = self.folder.text()
+        if not os.path.isdir(folder):
+            self.main_window.status_bar.showMessage("Choose a song folder to index", 8000)
+            return
+
+        progress_dialog = QProgressDialog("Indexing songs...", None, 0, 0, self)
+        progress_dialog.setWindowModality(Qt.WindowModal)
+        progress_dialog.setMinimumDuration(0)
+
+        def progress(done, total, path):
+            progress_dialog.setMaximum(total)
+            progress_dialog.setValue(done)
+            progress_dialog.setLabelText(os.path.basename(path))
+            QApplication.processEvents()
+
+        try:
+            stats = self.library.index(folder, progress=progress)
+            self.main_window.status_bar.showMessage(
+                f"Library updated: {stats['added']} added, {stats['updated']} updated, {stats['moved']} moved, "
+                f"{stats['removed']} removed, {stats['failed']} failed", 8000
+            )
+        except Exception as e:
+            self.main_window.status_bar.showMessage(f"Failed to index {folder}. Reason: {e}", 8000)
+        finally:
+            progress_dialog.close()
+
+        self.search()
+
+    def filter_value(self, widget):
+        if isinstance(widget, QSpinBox):
+            return None if widget.value() < 0 else widget.value()
+        return None if widget.currentText() == ANY else widget.currentText()
+
+    def search(self):
+        self.results = self.library.search(
+            self.filter_value(self.harmonica_type),
+            self.filter_value(self.harmonica_tuning),
+            self.filter_value(self.harmonica_key),
+            self.filter_value(self.max_bends),
+            self.filter_value(self.max_overblows),
+            self.filter_value(self.max_missing),
+            self.text.text() or None
+        )
+
+        self.table.setRowCount(len(self.results))
+        for row, result in enumerate(self.results):
+            best_fit = ''
+            if result['best_type']:
+                best_fit = f"{result['best_transpose']:+d} {result['best_type']} {result['best_tuning']} {result['best_key']}"
+            cells = [
+                result['title'],
+                str(result['part']),
+                f"{result['type']} {result['tuning']} {result['key_name']}",
+                str(result['bends']),
+                str(result['overblows']),
+                str(result['missing']),
+                f"{note_name(result['low'])}-{note_name(result['high'])}",
+                best_fit
+            ]
+            for column, text in enumerate(cells):
+                item = QTableWidgetItem(text)
+                item.setToolTip(result['path'])
+                self.table.setItem(row, column, item)
+
+        self.table.resizeColumnsToContents()
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+
+    def open_result(self, row, column=0):
+        result = self.results[row]
+        self.main_window.open_library_song(result['path'], result['part'], result['type'], result['tuning'], result['key_name'])
+
+    def closeEvent(self, event):
+        self.library.close()
+        super().closeEvent(event)
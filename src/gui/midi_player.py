@@ -1,9 +1,6 @@
-import os
-import mido
-import tinysoundfont
-from lxml import etree
-from PySide6.QtCore import QUrl, QTimer
-from handlers.converters import FileHandler
+from PySide6.QtCore import QTimer
+
+from handlers.audio import AudioEngine
 
 class MidiPlayer:
     def __init__(self, main_window):
@@ -11,191 +8,110 @@ class MidiPlayer:
         self.frameview = main_window.frameview
         self.file_path = main_window.file_path
         self.file_name = main_window.file_name
-        self.temp_dir = main_window.temp_dir
-        self.mei_data = main_window.mei_data
 
-        self.note_elements = []
-        self.note_times = []
-        self.note_numbers = []
-        self.current_note_index = 0
+        self.timeline = None
+        self.note_pages = {}
+        self.current_note_index = None
+        self.timer = None
 
-        self.synth = tinysoundfont.Synth()
-        soundfont_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'assets', 'soundfont', 'florestan-piano.sf2'))
-        self.sfid = self.synth.sfload(soundfont_path)
-        self.synth.program_select(0, self.sfid, 0, 0)
-        self.synth.start()
+        self.audio_engine = AudioEngine.instance()
+        self.audio_engine.select_instrument(main_window.instrument.currentText())
+        self.audio_engine.start()
 
-        self.file_handler = FileHandler(self)
+        self.sheet_viewer = main_window.sheet_viewer
 
     def play_midi(self):
         """
-        Start playing the MIDI file and highlight notes in the SVG sheet music.
+        Start playing the score and highlight notes in the sheet viewer.
 
-        This method generates a MIDI file from MEI data, extracts note information,
-        loads the SVG sheet music, and starts a timer to highlight notes in sync with the music.
+        This method takes the playback timeline of the current render state
+        (building it from the MEI data only when it is not cached yet), applies
+        the speed and loop settings, and starts a timer to highlight notes in
+        sync with the music.
         """
-        self.svg_sheets = os.path.join(self.temp_dir, f"{self.file_name}.svg")
-        self.midi_path = self.file_handler.mei_to_midi(self.mei_data)
+        self.timeline = self.get_note_timeline()
 
-        if self.midi_path:
-            self.note_numbers, self.note_times = self.extract_notes(self.midi_path)
-            self.load_svg()
+        if len(self.timeline):
+            self.note_pages = {note_id: page_index for page_index, note_id in self.frameview.note_ids()}
+            self.apply_practice_settings()
+            self.current_note_index = self.timeline.start_index()
 
             self.timer = QTimer()
+            self.timer.setSingleShot(True)
             self.timer.timeout.connect(self.highlight_next_note)
-            self.timer.start(100)
-
-    def stop_midi(self):
-        """
-        Stop the MIDI playback and reset the SVG highlighting.
+            self.timer.start(0)
 
-        This method stops the MIDI playback, resets the note highlighting,
-        and updates the SVG sheet music.
+    def get_note_timeline(self):
         """
-        self.main_window.toggle_menus(True)
-        self.main_window.midi_button_stop.setEnabled(False)
-
-        if self.synth:
-            self.synth.stop()
-            self.synth.start()
-
-        #if self.timer:
-        #    self.timer.stop()
-        self.timer = None
-
-        if self.note_elements:
-            try:
-                if self.current_note_index > 0:
-                    previous_note = self.note_elements[self.current_note_index - 1]
-                    previous_note.set('style', self.remove_fill_style(previous_note.get('style', '')))
-                if self.current_note_index < len(self.note_elements):
-                    current_note = self.note_elements[self.current_note_index]
-                    current_note.set('style', self.remove_fill_style(current_note.get('style', '')))
-            except Exception as e:
-                pass
+        Return the playback timeline of the current MEI data, using the viewer cache.
 
-        self.update_svg()
+        The cache lives in the sheet viewer and is dropped whenever the labeled
+        score changes, so repeated plays with the same settings skip building
+        it entirely; speed and loop changes never invalidate it.
 
-    def play_notes(self, note, volume=100):
-        self.synth.noteon(0, note, volume)
-        self.synth.noteoff(0, note)
+        Returns
+        -------
+        PlaybackTimeline
+        """
+        return self.sheet_viewer.get_note_timeline()
 
-    def load_svg(self):
-        with open(self.svg_sheets, 'r') as file:
-            svg_string = file.read()
+    def apply_practice_settings(self):
+        """
+        Apply the speed and A-B loop of the window to the timeline.
 
-        namespaces = {'svg': 'http://www.w3.org/2000/svg'}
-        self.root = etree.fromstring(svg_string)
-        self.note_elements = self.root.findall(".//svg:g[@class='note']", namespaces)
-        self.current_note_index = 0
+        Safe to call while playing: the next note is scheduled with the new
+        speed and, once the loop is set, playback jumps into it.
+        """
+        if self.timeline is None:
+            return
 
-    def extract_notes(self, midi_file_path):
-        mid = mido.MidiFile(midi_file_path)
-        notes_times = []
-        notes_midi = []
-        current_time = 0
+        self.timeline.set_speed(self.main_window.playback_speed.value() / 100)
 
-        for msg in mid:
-            current_time += msg.time
-            if msg.type == 'note_on' and msg.velocity > 0:
-                notes_midi.append(msg.note)
-                notes_times.append((msg.note, current_time))
+        if not self.main_window.loop_enabled.isChecked():
+            self.timeline.set_loop()
+            return
 
-        return notes_midi, notes_times
+        first, last = self.main_window.loop_start.value(), self.main_window.loop_end.value()
+        if not self.timeline.set_loop(first, last):
+            self.main_window.status_bar.showMessage(f"No notes to loop in measures {min(first, last)}-{max(first, last)}", 8000)
 
-    def highlight_next_note(self):
-        if self.current_note_index > 0:
-            previous_note = self.note_elements[self.current_note_index - 1]
-            previous_note.set('style', self.remove_fill_style(previous_note.get('style', '')))
-
-        if self.current_note_index < len(self.note_elements):
-            current_note = self.note_elements[self.current_note_index]
-            current_note.set('style', self.add_fill_style(current_note.get('style', ''), (255, 0, 0)))
-
-            self.update_svg()
-            if self.current_note_index < len(self.note_numbers):
-                self.play_notes(self.note_numbers[self.current_note_index])
-            else:
-                self.stop_midi()
-
-            # Calculate the delay for the next note based on timing
-            if self.current_note_index < len(self.note_times) - 1:
-                current_time = self.note_times[self.current_note_index][1]
-                next_time = self.note_times[self.current_note_index + 1][1]
-                time_interval = next_time - current_time
-                delay = time_interval * 1000
-                self.timer.start(delay)
-
-            self.current_note_index += 1
-
-    def add_fill_style(self, style, color):
+    def stop_midi(self):
         """
-        Add a fill style to an SVG element's existing style.
-
-        Parameters
-        ----------
-        style : str
-            The current style string of the SVG element.
-        color : tuple of int
-            The RGB color values to add to the style (e.g., (255, 0, 0) for red).
-
-        Returns
-        -------
-        new_style : str
-            The updated style string with the fill color added.
+        Stop the playback and reset the note highlighting.
         """
-        fill_style = f'fill: rgb({color[0]}, {color[1]}, {color[2]})'
-
-        if 'fill' in style:
-            new_style_parts = []
-            style_parts = style.split(';')
-
-            for part in style_parts:
-                stripped_part = part.strip()
-                if 'fill' not in stripped_part:
-                    new_style_parts.append(stripped_part)
-            new_style_parts.append(fill_style)
-            new_style = '; '.join(new_style_parts)
+        self.main_window.toggle_menus(True)
+        self.main_window.midi_button_stop.setEnabled(False)
 
-        else:
-            if style:
-                new_style = f'{style}; {fill_style}'
-            else:
-                new_style = fill_style
+        self.audio_engine.silence()
 
-        return new_style
+        if self.timer:
+            self.timer.stop()
+        self.timer = None
 
-    def remove_fill_style(self, style):
-        """
-        Remove the fill style from an SVG element's style.
+        self.frameview.clear_highlight()
 
-        Parameters
-        ----------
-        style : str
-            The current style string of the SVG element.
+    def play_notes(self, note, volume=100):
+        self.audio_engine.play_note(note, volume)
 
-        Returns
-        -------
-        new_style : str
-            The updated style string with the fill color removed.
-        """
-        if 'fill' in style:
-            new_style_parts = []
-            style_parts = style.split(';')
-
-            for part in style_parts:
-                stripped_part = part.strip()
-                if 'fill' not in stripped_part:
-                    new_style_parts.append(stripped_part)
-            new_style = '; '.join(new_style_parts).strip()
+    def highlight_next_note(self):
+        index = self.current_note_index
+        if index is None or self.timer is None:
+            self.stop_midi()
+            return
+
+        note_id = self.timeline.note_ids[index]
+        if note_id in self.note_pages:
+            self.frameview.highlight_note(self.note_pages[note_id], note_id)
+
+        if self.timeline.sounding[index]:
+            self.play_notes(self.timeline.pitches[index])
+
+        next_index = self.timeline.next_index(index)
+        if next_index is None:
+            # Let the last note ring before stopping
+            delay = self.timeline.durations[index] / self.timeline.speed
         else:
-            new_style = style
-
-        return new_style
+            delay = self.timeline.delay(index, next_index)
 
-    def update_svg(self):
-        svg_string = etree.tostring(self.root, encoding='unicode', xml_declaration=False)
-        with open(self.svg_sheets, 'w', encoding='utf-8') as file:
-            file.write(svg_string)
-        url = QUrl.fromLocalFile(self.svg_sheets)
-        self.frameview.load(url)
+        self.current_note_index = next_index
+        self.timer.start(int(delay * 1000))
@@ -0,0 +1,134 @@
+import numpy as np
+
+from core.follower import PracticeFollower, BLOCK_SIZE
+from core.engraver import EngraveError
+
+class LiveFollower:
+    """
+    Follow the player through the sheet from the default microphone.
+
+    The expected notes come from the playback timeline of the current render
+    state, so the highlight moves over the same notes as the preview. Audio is
+    read with Qt Multimedia, which is only imported when following starts.
+    """
+    def __init__(self, main_window):
+        self.main_window = main_window
+        self.frameview = main_window.frameview
+        self.sheet_viewer = main_window.sheet_viewer
+
+        self.follower = None
+        self.audio_source = None
+        self.audio_device = None
+        self.audio_format = None
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.note_pages = {}
+
+    def start(self):
+        """
+        Open the microphone and highlight the first expected note.
+
+        Returns
+        -------
+        bool
+            False when there is no usable input (the reason is shown in the status bar).
+        """
+        try:
+            from PySide6.QtMultimedia import QAudioFormat, QAudioSource, QMediaDevices
+        except ImportError as e:
+            self.main_window.status_bar.showMessage(f"Live following is not available. Reason: {e}", 8000)
+            return False
+
+        device = QMediaDevices.defaultAudioInput()
+        if device.isNull():
+            self.main_window.status_bar.showMessage("No microphone found", 8000)
+            return False
+
+        audio_format = QAudioFormat()
+        audio_format.setSampleRate(44100)
+        audio_format.setChannelCount(1)
+        audio_format.setSampleFormat(QAudioFormat.SampleFormat.Float)
+        if not device.isFormatSupported(audio_format):
+            audio_format = device.preferredFormat()
+
+        try:
+            timeline = self.sheet_viewer.get_note_timeline()
+        except EngraveError as e:
+            self.main_window.status_bar.showMessage(f"Failed to read the notes of the sheet. Reason: {e}", 8000)
+            return False
+        self.follower = PracticeFollower.from_timeline(timeline, sample_rate=audio_format.sampleRate())
+        if not self.follower.expected:
+            self.main_window.status_bar.showMessage("No notes to follow", 8000)
+            return False
+
+        self.note_pages = {note_id: page_index for page_index, note_id in self.frameview.note_ids()}
+        self.audio_format = audio_format
+        self.audio_source = QAudioSource(device, audio_format)
+        self.audio_device = self.audio_source.start()
+        self.audio_device.readyRead.connect(self.read_audio)
+
+        self.highlight_current()
+        return True
+
+    def decode(self, data):
+        from PySide6.QtMultimedia import QAudioFormat
+
+        sample_format = self.audio_format.sampleFormat()
+        if sample_format == QAudioFormat.SampleFormat.Float:
+            samples = np.frombuffer(data, dtype=np.float32)
+        elif sample_format == QAudioFormat.SampleFormat.Int16:
+            samples = np.frombuffer(data, dtype=np.int16) / 32768.0
+        elif sample_format == QAudioFormat.SampleFormat.Int32:
+            samples = np.frombuffer(data, dtype=np.int32) / 2147483648.0
+        else:
+            samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128.0
+
+        channels = max(1, self.audio_format.channelCount())
+        samples = samples[:len(samples) - len(samples) % channels]
+
+        return samples.reshape(-1, channels).mean(axis=1).astype(np.float32)
+
+    def read_audio(self):
+        """
+        Feed the recorded audio to the follower in fixed-size blocks.
+        """
+        self.pending = np.concatenate((self.pending, self.decode(self.audio_device.readAll().data())))
+
+        moved = False
+        while len(self.pending) >= BLOCK_SIZE and not self.follower.finished:
+            block, self.pending = self.pending[:BLOCK_SIZE], self.pending[BLOCK_SIZE:]
+            moved |= any(event['result'] != 'wrong' for event in self.follower.feed(block))
+
+        if moved:
+            self.highlight_current()
+        if self.follower.finished:
+            self.main_window.on_stop_midi()
+
+    def highlight_current(self):
+        summary = self.follower.summary()
+        self.main_window.status_bar.showMessage(
+            f"Accuracy {summary['accuracy']:.0%} ({summary['hits']} hit, {summary['missed']} missed, {summary['wrong']} wrong)"
+        )
+
+        note = self.follower.current()
+        if note is None:
+            self.frameview.clear_highlight()
+        elif note['note_id'] in self.note_pages:
+            self.frameview.highlight_note(self.note_pages[note['note_id']], note['note_id'])
+
+    def stop(self):
+        """
+        Close the microphone and leave the final score in the status bar.
+        """
+        if self.audio_source is not None:
+            self.audio_source.stop()
+            self.audio_source = None
+            self.audio_device = None
+
+        self.frameview.clear_highlight()
+        if self.follower is not None:
+            summary = self.follower.summary()
+            self.main_window.status_bar.showMessage(
+                f"Accuracy {summary['accuracy']:.0%}: {summary['hits']} of {summary['notes']} notes hit, "
+                f"{summary['missed']} missed, {summary['wrong']} wrong",
+                8000
+            )
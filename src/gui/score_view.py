@@ -0,0 +1,391 @@
+import re
+import math
+from html import escape
+from collections import OrderedDict
+from PySide6.QtWidgets import QGraphicsView, QGraphicsScene, QGraphicsItem, QGraphicsRectItem, QGraphicsTextItem, QStyleOptionGraphicsItem
+from PySide6.QtGui import QImage, QPainter, QColor, QBrush, QPen, QPalette, QFont
+from PySide6.QtCore import Qt, QRectF, QByteArray
+from PySide6.QtSvg import QSvgRenderer
+
+from core import memory
+from handlers.svg import prepare_page_for_qt
+
+TILE_SIZE = 512
+PAGE_GAP = 40
+NOTE_TAG_PATTERN = re.compile(r'<g\s[^>]*class="note"[^>]*>')
+ID_PATTERN = re.compile(r'\bid="([^"]+)"')
+ROOT_TAG_PATTERN = re.compile(r'<svg\b[^>]*>')
+WIDTH_PATTERN = re.compile(r'\swidth="([\d.]+)(?:px)?"')
+HEIGHT_PATTERN = re.compile(r'\sheight="([\d.]+)(?:px)?"')
+MEASURE_TAG_PATTERN = re.compile(r'<g\s[^>]*class="measure"')
+# Width of a verovio A4 page, so the preview lines up with the pages replacing it
+PREVIEW_WIDTH = 2100
+
+def tab_preview_html(title, measure_tabs):
+    """
+    Return the HTML of the text preview: the title, then every measure with its number and tabs.
+    """
+    measures = ''.join(
+        f'<span style="color:gray;font-size:24pt">{number}</span>&nbsp;{escape(text) or "&ndash;"}&nbsp;&nbsp;| '
+        for number, text in measure_tabs
+    )
+    return (
+        f'<div style="font-size:40pt;line-height:160%">'
+        f'<p align="center" style="font-size:60pt">{escape(title)}</p><p>{measures}</p></div>'
+    )
+
+
+class TileCache:
+    """
+    Least-recently-used cache of rasterized page tiles, bounded in bytes.
+
+    Keys are `(page_key, zoom, column, row)`, so every zoom level keeps its own
+    tiles and scrolling back to a page does not render it again. The parsed
+    SVG renderers of the most recently painted pages are kept as well, so
+    memory does not grow with the number of pages.
+    """
+    def __init__(self, max_bytes=96 * 1024 * 1024, max_renderers=6):
+        self.max_bytes = max_bytes
+        self.max_renderers = max_renderers
+        self.used_bytes = 0
+        self.tiles = OrderedDict()
+        self.renderer_pages = OrderedDict()
+
+    def touch_renderer(self, page):
+        self.renderer_pages[page.page_key] = page
+        self.renderer_pages.move_to_end(page.page_key)
+        while len(self.renderer_pages) > self.max_renderers:
+            _, evicted = self.renderer_pages.popitem(last=False)
+            evicted.release_renderer()
+
+    def get(self, key):
+        image = self.tiles.get(key)
+        if image is not None:
+            self.tiles.move_to_end(key)
+        return image
+
+    def put(self, key, image):
+        self.tiles[key] = image
+        self.used_bytes += image.sizeInBytes()
+        while self.used_bytes > self.max_bytes and len(self.tiles) > 1:
+            _, evicted = self.tiles.popitem(last=False)
+            self.used_bytes -= evicted.sizeInBytes()
+
+    def drop_page(self, page_key):
+        self.renderer_pages.pop(page_key, None)
+        for key in [key for key in self.tiles if key[0] == page_key]:
+            self.used_bytes -= self.tiles.pop(key).sizeInBytes()
+
+
+class PageItem(QGraphicsItem):
+    """
+    One engraved page, painted from cached tiles rendered on demand.
+
+    Only the tiles intersecting the exposed area are rasterized, at the zoom
+    level of the view, and the SVG renderer itself is built lazily.
+    """
+    page_serial = 0
+
+    def __init__(self, svg_data, width, height, tile_cache):
+        super().__init__()
+        PageItem.page_serial += 1
+        self.page_key = PageItem.page_serial
+        self.svg_data = svg_data
+        self.width = width
+        self.height = height
+        self.tile_cache = tile_cache
+        self.renderer = None
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+
+    def boundingRect(self):
+        return QRectF(0, 0, self.width, self.height)
+
+    def get_renderer(self):
+        if self.renderer is None:
+            self.renderer = QSvgRenderer(QByteArray(self.svg_data))
+        self.tile_cache.touch_renderer(self)
+        return self.renderer
+
+    def release_renderer(self):
+        self.renderer = None
+
+    def render_tile(self, zoom, column, row):
+        image = QImage(TILE_SIZE, TILE_SIZE, QImage.Format_ARGB32_Premultiplied)
+        image.fill(Qt.white)
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.translate(-column * TILE_SIZE, -row * TILE_SIZE)
+        painter.setClipRect(QRectF(column * TILE_SIZE, row * TILE_SIZE, TILE_SIZE, TILE_SIZE))
+        self.get_renderer().render(painter, QRectF(0, 0, self.width * zoom, self.height * zoom))
+        painter.end()
+
+        return image
+
+    def paint(self, painter, option, widget=None):
+        scale = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        zoom = max(0.125, round(scale * 8) / 8)
+        tile_span = TILE_SIZE / zoom
+        exposed = option.exposedRect.intersected(self.boundingRect())
+        painter.setClipRect(self.boundingRect())
+
+        first_column, last_column = int(exposed.left() // tile_span), int(math.ceil(exposed.right() / tile_span))
+        first_row, last_row = int(exposed.top() // tile_span), int(math.ceil(exposed.bottom() / tile_span))
+
+        for row in range(first_row, last_row):
+            for column in range(first_column, last_column):
+                key = (self.page_key, zoom, column, row)
+                image = self.tile_cache.get(key)
+                if image is None:
+                    image = self.render_tile(zoom, column, row)
+                    self.tile_cache.put(key, image)
+                painter.drawImage(QRectF(column * tile_span, row * tile_span, tile_span, tile_span), image)
+
+    def note_bounds(self, note_id):
+        """
+        Return the bounds of a note element in item coordinates.
+        """
+        renderer = self.get_renderer()
+        if not renderer.elementExists(note_id):
+            return QRectF()
+
+        bounds = renderer.transformForElement(note_id).mapRect(renderer.boundsOnElement(note_id))
+        view_box = renderer.viewBoxF()
+        scale_x = self.width / view_box.width()
+        scale_y = self.height / view_box.height()
+
+        return QRectF(
+            (bounds.x() - view_box.x()) * scale_x,
+            (bounds.y() - view_box.y()) * scale_y,
+            bounds.width() * scale_x,
+            bounds.height() * scale_y
+        )
+
+
+class ScoreView(QGraphicsView):
+    """
+    Native sheet viewer showing verovio pages stacked vertically.
+
+    Pages whose SVG did not change between updates keep their item and their
+    cached tiles; the playback highlight is a single overlay item that is moved
+    from note to note instead of re-rendering the page.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tile_cache = TileCache(memory.cache_bytes(96 * 1024 * 1024))
+        self.page_items = []
+        self.page_sources = []
+        self.page_notes = []
+        self.message_item = None
+        self.preview_item = None
+        self.preview_title = ''
+        self.preview_measures = []
+
+        self.setScene(QGraphicsScene(self))
+        self.setBackgroundBrush(self.palette().color(QPalette.Window))
+        self.setDragMode(QGraphicsView.ScrollHandDrag)
+        self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
+        self.setViewportUpdateMode(QGraphicsView.SmartViewportUpdate)
+
+        self.highlight = QGraphicsRectItem()
+        self.highlight.setBrush(QBrush(QColor(255, 0, 0, 110)))
+        self.highlight.setPen(QPen(Qt.NoPen))
+        self.highlight.setZValue(1)
+        self.highlight.hide()
+        self.scene().addItem(self.highlight)
+
+        self.setZoomFactor(0.5)
+
+    def setZoomFactor(self, factor):
+        self.resetTransform()
+        self.scale(factor, factor)
+
+    def wheelEvent(self, event):
+        if event.modifiers() & Qt.ControlModifier:
+            factor = 1.25 if event.angleDelta().y() > 0 else 0.8
+            self.scale(factor, factor)
+        else:
+            super().wheelEvent(event)
+
+    def page_size(self, svg_string, svg_data):
+        root_tag = ROOT_TAG_PATTERN.search(svg_string)
+        width = root_tag and WIDTH_PATTERN.search(root_tag.group(0))
+        height = root_tag and HEIGHT_PATTERN.search(root_tag.group(0))
+        if width and height:
+            return float(width.group(1)), float(height.group(1))
+
+        size = QSvgRenderer(QByteArray(svg_data)).defaultSize()
+        return float(size.width()), float(size.height())
+
+    def find_notes(self, svg_string):
+        notes = []
+        for tag in NOTE_TAG_PATTERN.findall(svg_string):
+            match = ID_PATTERN.search(tag)
+            if match:
+                notes.append(match.group(1))
+        return notes
+
+    def clear_message(self):
+        if self.message_item is not None:
+            self.scene().removeItem(self.message_item)
+            self.message_item = None
+
+    def show_message(self, text):
+        """
+        Replace the sheet with a centered message (start screen, no keys...).
+        """
+        self.show_pages([])
+        self.message_item = QGraphicsTextItem(text)
+        font = QFont()
+        font.setPointSize(48)
+        self.message_item.setFont(font)
+        self.message_item.setDefaultTextColor(self.palette().color(QPalette.WindowText))
+        self.scene().addItem(self.message_item)
+        self.scene().setSceneRect(self.message_item.boundingRect())
+        self.centerOn(self.message_item)
+
+    def show_svg_file(self, svg_file_path):
+        with open(svg_file_path, 'r', encoding='utf-8') as file:
+            self.show_pages([file.read()])
+
+    def show_pages(self, svg_pages):
+        """
+        Display SVG pages, touching only the pages that changed.
+
+        Parameters
+        ----------
+        svg_pages : iterable of str
+            SVG pages in display order.
+        """
+        self.clear_message()
+        self.clear_highlight()
+        count = 0
+
+        for index, svg_page in enumerate(svg_pages):
+            self.place_page(index, svg_page)
+            count = index + 1
+
+        self.finish_pages(count)
+
+    def show_page(self, index, svg_page):
+        """
+        Display one page as soon as it is engraved (see `show_tab_preview`).
+
+        Pages must arrive in order; the pages after `index` are left as they
+        are until `finish_pages` is called.
+        """
+        self.clear_message()
+        self.clear_highlight()
+        self.place_page(index, svg_page)
+
+        if self.preview_item is not None:
+            # The measures now engraved leave the preview, which moves below the pages
+            del self.preview_measures[:len(MEASURE_TAG_PATTERN.findall(svg_page))]
+            self.preview_item.setHtml(tab_preview_html(self.preview_title, self.preview_measures))
+            self.preview_item.setPos(0, self.pages_bottom(index + 1) + PAGE_GAP)
+        self.update_scene_rect()
+
+    def place_page(self, index, svg_page):
+        """
+        Put a page at its position, reusing the item if its SVG did not change.
+        """
+        if index < len(self.page_sources) and self.page_sources[index] == svg_page:
+            item = self.page_items[index]
+        else:
+            svg_data = prepare_page_for_qt(svg_page)
+            width, height = self.page_size(svg_page, svg_data)
+            item = PageItem(svg_data, width, height, self.tile_cache)
+            self.scene().addItem(item)
+
+            if index < len(self.page_items):
+                self.remove_page(self.page_items[index])
+                self.page_items[index] = item
+                self.page_sources[index] = svg_page
+                self.page_notes[index] = self.find_notes(svg_page)
+            else:
+                self.page_items.append(item)
+                self.page_sources.append(svg_page)
+                self.page_notes.append(self.find_notes(svg_page))
+
+        item.setPos(0, self.pages_bottom(index) + (PAGE_GAP if index else 0))
+
+    def pages_bottom(self, count):
+        """
+        Return the bottom of the first `count` pages in scene coordinates.
+        """
+        if not count:
+            return 0
+        item = self.page_items[count - 1]
+        return item.pos().y() + item.height
+
+    def finish_pages(self, count):
+        """
+        Keep the first `count` pages, drop the rest and the preview.
+        """
+        for item in self.page_items[count:]:
+            self.remove_page(item)
+        del self.page_items[count:]
+        del self.page_sources[count:]
+        del self.page_notes[count:]
+        self.clear_preview()
+        self.update_scene_rect()
+
+    def update_scene_rect(self):
+        bottom = self.pages_bottom(len(self.page_items))
+        width = max((item.width for item in self.page_items), default=0)
+        if self.preview_item is not None:
+            bottom = self.preview_item.pos().y() + self.preview_item.boundingRect().height()
+            width = max(width, self.preview_item.boundingRect().width())
+        self.scene().setSceneRect(QRectF(0, 0, width, bottom))
+
+    def show_tab_preview(self, title, measure_tabs):
+        """
+        Show the tabs as text until the engraved pages arrive.
+
+        Parameters
+        ----------
+        title : str
+            Song name shown above the tabs.
+        measure_tabs : list of tuple
+            `(measure number, tab text)` of every measure; measures leave the
+            preview as `show_page` displays the pages holding them.
+        """
+        self.show_pages([])
+        self.preview_title = title
+        self.preview_measures = list(measure_tabs)
+        self.preview_item = QGraphicsTextItem()
+        self.preview_item.setTextWidth(PREVIEW_WIDTH)
+        self.preview_item.setDefaultTextColor(self.palette().color(QPalette.WindowText))
+        self.preview_item.setHtml(tab_preview_html(title, self.preview_measures))
+        self.scene().addItem(self.preview_item)
+        self.update_scene_rect()
+        self.centerOn(PREVIEW_WIDTH / 2, 0)
+
+    def clear_preview(self):
+        if self.preview_item is not None:
+            self.scene().removeItem(self.preview_item)
+            self.preview_item = None
+            self.preview_measures = []
+
+    def remove_page(self, item):
+        self.tile_cache.drop_page(item.page_key)
+        self.scene().removeItem(item)
+
+    def note_ids(self):
+        """
+        Return every note of the sheet as `(page_index, note_id)`, in document order.
+        """
+        return [(page_index, note_id) for page_index, notes in enumerate(self.page_notes) for note_id in notes]
+
+    def highlight_note(self, page_index, note_id):
+        item = self.page_items[page_index]
+        bounds = item.note_bounds(note_id)
+        if bounds.isEmpty():
+            self.clear_highlight()
+            return
+
+        self.highlight.setRect(item.mapRectToScene(bounds))
+        self.highlight.show()
+        self.ensureVisible(self.highlight, 50, 150)
+
+    def clear_highlight(self):
+        self.highlight.hide()
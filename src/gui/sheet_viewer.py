@@ -1,9 +1,71 @@
-import os
-from PySide6.QtCore import QUrl
+import threading
+from PySide6.QtCore import QObject, Signal
 
+from core import memory, pipeline
+from core.engraver import get_engraver, EngraveError
+from core.timeline import PlaybackTimeline
 from handlers.converters import FileHandler
+from handlers.autofit import get_auto_fit, pitch_histogram
+from handlers.parts import process_all_parts, combine_tabs
 from handlers.score import ScoreEditor
-from handlers.svg import SVGHandler
+
+class EngravingJob(QObject):
+    """
+    Engrave a labeled part in a background thread, one page at a time.
+
+    The signals are delivered on the GUI thread, so the pages can be shown
+    while the next ones are rendered by the verovio workers.
+    """
+    page_ready = Signal(int, str)
+    finished = Signal()
+    failed = Signal(str, str)
+
+    def __init__(self, piece):
+        super().__init__()
+        self.piece = piece
+        self.musicxml_data = None
+        self.mei_data = None
+        self.pages = []
+        self.error = None
+        self.cancelled = False
+        self.applied = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def wait(self):
+        self.thread.join()
+
+    def run(self):
+        try:
+            self.musicxml_data = pipeline.to_musicxml(self.piece)
+            self.mei_data = get_engraver().engrave(self.musicxml_data)
+        except Exception as e:
+            self.error = ('engrave', str(e))
+            self.failed.emit(*self.error)
+            return
+
+        svg_pages = get_engraver().iter_svg_pages(self.mei_data)
+        try:
+            for svg_page in svg_pages:
+                if self.cancelled:
+                    return
+                self.pages.append(svg_page)
+                self.page_ready.emit(len(self.pages) - 1, svg_page)
+        except EngraveError as e:
+            self.error = ('render', str(e))
+            self.failed.emit(*self.error)
+            return
+        finally:
+            # Closing a stream left early discards its busy worker
+            svg_pages.close()
+
+        self.finished.emit()
+
 
 class SheetViewer:
 
@@ -17,12 +79,21 @@ class SheetViewer:
         self.harmonica_type = main_window.harmonica_type
         self.harmonica_tuning = main_window.harmonica_tuning
         self.harmonica_key_options = main_window.harmonica_key_options
+        self.musicxml_data = None
+        self.mei_data = None
+        self.midi_data = None
+        self.note_timeline = None
+        self.part_results = None
+        self.part_results_key = None
+        self.engraving = None
+        self.displayed_part = None
+        self.transposition = 0
+        self.preferred_key = None
 
         self.file_handler = FileHandler(self)
         self.score_editor = ScoreEditor(self)
-        self.svg_handler = SVGHandler(self)
 
-    def get_score(self, first_use, choose_part):
+    def get_score(self, first_use, choose_part, measure_range=None):
         """
         Load the musical score based on the use context.
 
@@ -31,15 +102,44 @@ class SheetViewer:
         first_use : bool
             If True, load the first part. If False, use the selected part.
         choose_part : QComboBox
-            Widget for selecting the musical part (degree symbol "°" is removed).
+            Widget for selecting the musical part; each entry holds its part
+            number as item data. The "All" entry of the all-parts mode (no
+            data) loads the first part.
+        measure_range : tuple of int, optional
+            First and last measure to process. None processes the whole part.
 
         Returns
         -------
         None
-            Updates `self.piece` and `self.parts_num`.
+            Updates `self.piece`, `self.parts_num`, `self.selected_part` and
+            `self.measure_bounds`.
         """
-        selected_part = 1 if first_use else int(choose_part.currentText().rstrip("°"))
-        self.piece, self.parts_num = self.file_handler.midi_to_musicxml(selected_part)
+        if first_use:
+            selected_part = self.selected_part = 1
+        elif choose_part.currentData() is None:
+            selected_part, self.selected_part = 1, None
+        else:
+            selected_part = self.selected_part = choose_part.currentData()
+
+        self.measure_range = None if first_use else measure_range
+        self.measure_bounds = self.file_handler.measure_bounds(selected_part)
+        self.piece, self.parts_num = self.file_handler.midi_to_musicxml(selected_part, self.measure_range)
+        self.piece = self.score_editor.transpose(self.piece, self.transposition)
+
+        # The full parsed score is parsed again on the next part change instead
+        if memory.under_pressure():
+            self.file_handler.score = None
+
+    def part_labels(self):
+        """
+        Return the Choose Part label of every part: track names, ranges and
+        note counts for MIDI files (see `core.midiscan`), else '1°', '2°'...
+        """
+        labels = self.file_handler.scan_part_labels()
+        if labels is None or len(labels) != self.parts_num:
+            labels = [f'{part}°' for part in range(1, self.parts_num + 1)]
+
+        return labels
 
     def update_key_options(self, tabs_with_bend, tabs_with_overblow, tabs_with_missing_notes, harmonica_key, key_index, key_options_copy):
         """
@@ -68,33 +168,43 @@ class SheetViewer:
         if self.harmonica_type.currentText() != 'Diatonic':
             return key_index
         
-        self.harmonica_key_options = key_options_copy.copy()
-        
-        filters = [
-            (tabs_with_bend.isChecked(), '\''),
-            (tabs_with_overblow.isChecked(), 'o'),
-            (tabs_with_missing_notes.isChecked(), '?')
-        ]
-
-        for should_filter, char in filters:
-            if not should_filter:
-                self.harmonica_key_options = self.score_editor.filter_keys(
-                    self.piece, 
-                    self.harmonica_tuning.currentText(), 
-                    self.harmonica_key_options, 
-                    char
-                )
+        self.harmonica_key_options = pipeline.playable_keys(
+            self.piece,
+            self.harmonica_tuning.currentText(),
+            tabs_with_bend.isChecked(),
+            tabs_with_overblow.isChecked(),
+            tabs_with_missing_notes.isChecked(),
+            key_options_copy
+        )
         
         harmonica_key.blockSignals(True)
         harmonica_key.clear()
         for key, value in self.harmonica_key_options:
             harmonica_key.addItem(key, value)
+
+        key_names = [key for key, _ in self.harmonica_key_options]
+        if self.preferred_key in key_names:
+            key_index = key_names.index(self.preferred_key)
+        self.preferred_key = None
         
         harmonica_key.setCurrentIndex(max(0, min(key_index, harmonica_key.count() - 1)))
         harmonica_key.blockSignals(False)
         
         return harmonica_key.currentIndex()
 
+    def label_options(self, key_index, reduce_chords):
+        """
+        Return the current settings as the plain options dict of the core pipeline.
+        """
+        return {
+            'type': self.harmonica_type.currentText(),
+            'tuning': self.harmonica_tuning.currentText(),
+            'key_name': self.harmonica_key_options[key_index][0],
+            'key': self.harmonica_key_options[key_index][1],
+            'reduce_chords': reduce_chords.isChecked(),
+            'transpose': self.transposition
+        }
+
     def update_sheets_viewer(self, key_index, reduce_chords):
         """
         Update the sheet music viewer with the selected options.
@@ -119,34 +229,28 @@ class SheetViewer:
             - 'removed_notes': list
                 List of removed notes.
             - 'mei_data': str
-                MEI data as a string.
+                MEI data as a string, of the previous sheet while the new one
+                is engraved in the background (see `wait_for_engraving`).
         """
         if not self.harmonica_key_options:
+            self.cancel_engraving()
             self.load_default_scene()
             return {}
 
-        self.piece = self.score_editor.edit_metadata(
-            self.piece, 
-            self.file_name, 
-            self.harmonica_key_options[key_index][0]
-        )
-        
-        if reduce_chords.isChecked():
-            self.piece, self.removed_chords, self.removed_notes = self.score_editor.chords_handler(self.piece)
-
-        self.piece, self.tab_in_text = self.score_editor.label_notes(
-            self.piece, 
-            self.harmonica_type.currentText(), 
-            self.harmonica_tuning.currentText(), 
-            self.harmonica_key_options[key_index][1],
-            reduce_chords
-        )
+        # The piece is already transposed by get_score
+        options = dict(self.label_options(key_index, reduce_chords), transpose=0)
+        result = pipeline.label(self.piece, self.file_name, options, measure_tabs=True)
+        self.piece, self.tab_in_text = result['piece'], result['tab_in_text']
+        self.removed_chords, self.removed_notes = result['removed_chords'], result['removed_notes']
 
-        self.svgs_pages_path, self.mei_data = self.file_handler.musicxml_to_svg(self.piece)
-        self.svg_sheets = self.svg_handler.svg_stacker(self.svgs_pages_path)
+        # Another part shows its tabs until its pages are engraved; new
+        # settings for the same part replace the pages in place instead
+        part = (self.selected_part, self.measure_range, self.transposition)
+        if part != self.displayed_part or not self.frameview.page_items:
+            self.frameview.show_tab_preview(self.piece.metadata.movementName, result['measure_tabs'])
+        self.displayed_part = part
+        self.start_engraving()
 
-        self.display_sheets_file()
-        
         return {
             'tab_in_text': self.tab_in_text,
             'parts_num': self.parts_num,
@@ -155,15 +259,193 @@ class SheetViewer:
             'mei_data': self.mei_data
         }
 
-    def load_default_scene(self):
-        nokeys = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'assets', 'screens', 'nokeys.html'))
-        nokeys_url = QUrl.fromLocalFile(nokeys)
-        self.frameview.load(nokeys_url)
+    def start_engraving(self):
+        """
+        Engrave the labeled piece in the background, showing each page as it is rendered.
+        """
+        self.cancel_engraving()
+        self.musicxml_data = None
+        self.engraving = job = EngravingJob(self.piece)
+        job.page_ready.connect(lambda index, svg_page: self.on_page_ready(job, index, svg_page))
+        job.finished.connect(lambda: self.apply_engraving(job))
+        job.failed.connect(lambda stage, reason: self.apply_engraving(job))
+        job.start()
+
+    def cancel_engraving(self):
+        if self.engraving is not None:
+            self.engraving.cancel()
+            self.engraving = None
+
+    def wait_for_engraving(self):
+        """
+        Finish the running engraving now, for the actions that need its results.
+        """
+        if self.engraving is not None:
+            self.engraving.wait()
+            self.apply_engraving(self.engraving)
+
+    def on_page_ready(self, job, index, svg_page):
+        if job is self.engraving and not job.applied:
+            self.frameview.show_page(index, svg_page)
+
+    def apply_engraving(self, job):
+        """
+        Make the results of a finished engraving job the current sheet.
+
+        Signals still queued for a job applied early (see `wait_for_engraving`)
+        or replaced by a newer one are ignored.
+        """
+        if job is not self.engraving or job.applied:
+            return
+        job.applied = True
+        self.engraving = None
+
+        if job.error is not None and job.error[0] == 'engrave':
+            self.main_window.status_bar.showMessage(f"Failed to engrave the sheet. Reason: {job.error[1]}", 8000)
+            self.mei_data = self.midi_data = self.note_timeline = None
+            self.frameview.show_message("The sheet could not be engraved")
+            return
+
+        self.musicxml_data = job.musicxml_data
+        if job.mei_data != self.mei_data:
+            self.mei_data = job.mei_data
+            self.midi_data = None
+            self.note_timeline = None
+
+        if job.error is not None:
+            self.main_window.status_bar.showMessage(f"Failed to render the sheet. Reason: {job.error[1]}", 8000)
+        self.frameview.show_pages(job.pages)
+
+    def update_all_parts_viewer(self, key_index, reduce_chords):
+        """
+        Tab every part of the score and show the combined or selected part.
+
+        All parts are processed in parallel once per settings combination; switching
+        between "All" and a single part afterwards only changes what is displayed.
+
+        Parameters
+        ----------
+        key_index : int
+            Index of the harmonica key to use.
+        reduce_chords : QCheckBox
+            Checkbox to determine if chords should be reduced.
+
+        Returns
+        -------
+        dict
+            Same keys as `update_sheets_viewer`, plus 'combined' (bool).
+        """
+        if not self.harmonica_key_options:
+            self.load_default_scene()
+            return {}
+
+        self.cancel_engraving()
+        self.displayed_part = None
+        options = self.label_options(key_index, reduce_chords)
+        settings = (*options.values(), self.measure_range)
+
+        if self.part_results_key != settings:
+            self.part_results = process_all_parts(self.file_handler.parse_score(), self.file_name, options, measures=self.measure_range)
+            self.part_results_key = settings
+
+        if self.selected_part is None:
+            results = self.part_results
+        else:
+            results = [self.part_results[self.selected_part - 1]]
+
+        self.tab_in_text = combine_tabs(results) if len(results) > 1 else results[0]['tab_in_text']
+        self.removed_chords = sum(result['removed_chords'] for result in results)
+        self.removed_notes = sum(result['removed_notes'] for result in results)
+
+        self.musicxml_data = None
+        if results[0]['mei_data'] != self.mei_data:
+            self.mei_data = results[0]['mei_data']
+            self.midi_data = None
+            self.note_timeline = None
+
+        self.frameview.show_pages(page for result in results for page in result['svg_pages'])
+
+        # Under memory pressure keep only what is displayed; other parts and
+        # settings are processed again when requested
+        if memory.under_pressure():
+            self.part_results = None
+            self.part_results_key = None
+            self.file_handler.score = None
+
+        return {
+            'tab_in_text': self.tab_in_text,
+            'parts_num': self.parts_num,
+            'removed_chords': self.removed_chords,
+            'removed_notes': self.removed_notes,
+            'mei_data': self.mei_data,
+            'combined': len(results) > 1
+        }
 
-    def display_sheets_file(self):
-        if self.svg_sheets:
-            svgs_url = QUrl.fromLocalFile(self.svg_sheets)
-            self.frameview.load(svgs_url)
+    def auto_fit(self):
+        """
+        Find the transposition and harp that best fit the current part.
+
+        The search runs on the part as currently shown (measure range and
+        transposition included). The winning shift is added to `self.transposition`
+        and its key is selected on the next update.
+
+        Returns
+        -------
+        dict or None
+            The best candidate of `AutoFit.search`, with 'transpose' relative to the
+            original score, or None if the part has no notes.
+        """
+        histogram = pitch_histogram(self.piece)
+        if not histogram.any():
+            return None
+
+        best = get_auto_fit().search(histogram, limit=1)[0]
+        self.transposition += best['transpose']
+        self.preferred_key = best['key_name']
+
+        return dict(best, transpose=self.transposition)
+
+    def get_midi_data(self):
+        self.wait_for_engraving()
+        if self.midi_data is None:
+            self.midi_data = get_engraver().render_midi(self.mei_data)
+
+        return self.midi_data
+
+    def render_state(self):
+        """
+        Return what is already computed for the current part, for `export_all`.
+
+        The displayed pages are the SVG pages of the current MEI data, so they
+        are passed on instead of being rendered again.
 
-    def create_sheets_to_pdf(self):
-        return self.svg_handler.svg_stacker_to_pdfprint(self.svgs_pages_path)
+        Returns
+        -------
+        dict or None
+            None when there is no single engraved part (combined view or
+            engraving failure).
+        """
+        self.wait_for_engraving()
+        if self.musicxml_data is None or self.mei_data is None:
+            return None
+
+        return {
+            'musicxml': self.musicxml_data,
+            'mei_data': self.mei_data,
+            'svg_pages': list(self.frameview.page_sources),
+            'midi_data': self.midi_data,
+            'tab_in_text': self.tab_in_text
+        }
+
+    def get_note_timeline(self):
+        """
+        Return the playback timeline of the current MEI data, building it once.
+        """
+        self.wait_for_engraving()
+        if self.note_timeline is None:
+            self.note_timeline = PlaybackTimeline.from_mei(self.mei_data, get_engraver().timemap(self.mei_data))
+
+        return self.note_timeline
+
+    def load_default_scene(self):
+        self.frameview.show_message("No keys available")
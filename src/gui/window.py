@@ -1,17 +1,25 @@
 import os
 import shutil
 import tempfile
-from PySide6.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QComboBox, QFileDialog, QCheckBox, QFormLayout, QStatusBar
-from PySide6.QtGui import QAction, QIcon, QPageSize, QPageLayout, QGuiApplication
-from PySide6.QtCore import Qt, QUrl, QByteArray, QMarginsF
-from PySide6.QtWebEngineWidgets import QWebEngineView
+from PySide6.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QComboBox, QFileDialog, QCheckBox, QFormLayout, QStatusBar, QSpinBox, QProgressDialog, QApplication
+from PySide6.QtGui import QAction, QIcon, QGuiApplication
+from PySide6.QtCore import Qt
 
 from constants.styles import STYLES
+from constants.soundfonts import SOUNDFONTS
+from constants.tunings import HARMONICA_KEYS
+from core.engraver import EngraveError, get_engraver, shutdown_engraver
+from gui.score_view import ScoreView
 from gui.sheet_viewer import SheetViewer
+from gui.library_panel import LibraryPanel
 from gui.midi_player import MidiPlayer
+from gui.practice_follower import LiveFollower
+from handlers.audio import AudioEngine, AudioExporter
 from handlers.converters import FileHandler
+from handlers.export import export_all
+from handlers.parts import shutdown_part_pool
+from handlers.pdf import PDFExporter
 from handlers.score import ScoreEditor
-from handlers.svg import SVGHandler
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -23,6 +31,8 @@ class MainWindow(QMainWindow):
         self.create_right_frame()
         self.create_menu()
         self.make_temp_directory()
+        # Sheets are engraved in worker processes; the first one starts while the window opens
+        get_engraver().warm_up()
 
     def init_ui(self):
         self.setWindowTitle("Harmonica TabTool")
@@ -78,15 +88,7 @@ class MainWindow(QMainWindow):
         self.harmonica_key_layout = QFormLayout(harmonica_key_widget)
         self.harmonica_key_label = QLabel("Key:")
         self.harmonica_key_layout.addRow(self.harmonica_key_label)
-        self.harmonica_key_options = [
-            ("Low G", "G2"), ("Low Ab", "Ab2"), ("Low A", "A2"), ("Low Bb", "Bb2"),
-            ("Low B", "B2"), ("Low C", "C3"), ("Low C#", "C#3"), ("Low D", "D3"),
-            ("Low Eb", "Eb3"), ("Low E", "E3"), ("Low F", "F3"), ("Low F#", "F#3"),
-            ("G", "G3"), ("Ab", "Ab3"), ("A", "A3"), ("Bb", "Bb3"), 
-            ("B", "B3"), ("C", "C4"), ("Db", "Db4"), ("D", "D4"), 
-            ("Eb", "Eb4"), ("E", "E4"), ("F", "F4"), ("F#", "F#4"),
-            ("High G", "G4"), ("High C", "C5")
-        ]
+        self.harmonica_key_options = HARMONICA_KEYS.copy()
         self.harmonica_key = QComboBox()
         for gui, _ in self.harmonica_key_options:
             self.harmonica_key.addItem(gui)
@@ -103,12 +105,28 @@ class MainWindow(QMainWindow):
         self.choose_part_layout.addRow(self.choose_part_label)
         self.choose_part_options = ["1°"]
         self.choose_part = QComboBox()
-        self.choose_part.addItems(self.choose_part_options)
+        self.choose_part.addItem(self.choose_part_options[0], 1)
+        # Track names can be long; they must not widen the side panel
+        self.choose_part.setSizeAdjustPolicy(QComboBox.AdjustToMinimumContentsLengthWithIcon)
         self.choose_part.setEnabled(False)
         self.choose_part_layout.addRow(self.choose_part)
         self.choose_part.currentIndexChanged.connect(self.on_part_change)
         self.left_layout.addWidget(choose_part_widget)
 
+        measures_widget = QWidget()
+        self.measures_layout = QFormLayout(measures_widget)
+        self.measures_label = QLabel("Measures:")
+        self.measures_layout.addRow(self.measures_label)
+        self.measure_start = QSpinBox()
+        self.measure_end = QSpinBox()
+        for measure_spin in (self.measure_start, self.measure_end):
+            measure_spin.setKeyboardTracking(False)
+            measure_spin.setEnabled(False)
+            measure_spin.valueChanged.connect(self.on_measures_change)
+        self.measures_layout.addRow("From", self.measure_start)
+        self.measures_layout.addRow("To", self.measure_end)
+        self.left_layout.addWidget(measures_widget)
+
         reduce_chords_widget = QWidget()
         self.reduce_chords_layout = QFormLayout(reduce_chords_widget)
         self.reduce_chords_label = QLabel("Reduce Chords:")
@@ -135,7 +153,36 @@ class MainWindow(QMainWindow):
         self.midi_button_stop.setEnabled(False)
         self.midi_button_stop.clicked.connect(self.on_stop_midi)
         self.midi_buttons_layout.addWidget(self.midi_button_stop)
+        self.follow_button = QPushButton("Follow")
+        self.follow_button.setToolTip("Play along on your harmonica; the sheet follows you and scores your accuracy")
+        self.follow_button.setEnabled(False)
+        self.follow_button.clicked.connect(self.on_follow)
+        self.midi_buttons_layout.addWidget(self.follow_button)
         self.midi_player_layout.addLayout(self.midi_buttons_layout)
+        self.instrument = QComboBox()
+        self.instrument.addItems(list(SOUNDFONTS))
+        self.instrument.currentIndexChanged.connect(self.on_instrument_change)
+        self.midi_player_layout.addWidget(self.instrument)
+
+        # Practice settings stay enabled while playing and apply immediately
+        self.practice_layout = QFormLayout()
+        self.playback_speed = QSpinBox()
+        self.playback_speed.setRange(25, 200)
+        self.playback_speed.setSingleStep(5)
+        self.playback_speed.setValue(100)
+        self.playback_speed.setSuffix("%")
+        self.loop_enabled = QCheckBox("A-B Loop")
+        self.loop_start = QSpinBox()
+        self.loop_end = QSpinBox()
+        for practice_spin in (self.playback_speed, self.loop_start, self.loop_end):
+            practice_spin.setKeyboardTracking(False)
+            practice_spin.valueChanged.connect(self.on_practice_change)
+        self.loop_enabled.stateChanged.connect(self.on_practice_change)
+        self.practice_layout.addRow("Speed", self.playback_speed)
+        self.practice_layout.addRow(self.loop_enabled)
+        self.practice_layout.addRow("A", self.loop_start)
+        self.practice_layout.addRow("B", self.loop_end)
+        self.midi_player_layout.addLayout(self.practice_layout)
         self.left_layout.addWidget(midi_player_widget)
 
         self.main_layout.addWidget(self.left_frame)
@@ -148,11 +195,8 @@ class MainWindow(QMainWindow):
         self.right_frame.setLayout(self.right_layout)
         self.main_layout.addWidget(self.right_frame, 2)
 
-        self.frameview = QWebEngineView()
-        start = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'assets', 'screens', 'start.html'))
-        start_url = QUrl.fromLocalFile(start)
-        self.frameview.load(start_url)
-        self.frameview.setZoomFactor(0.5)
+        self.frameview = ScoreView()
+        self.frameview.show_message("File > Open .musicxml or .midi")
         self.frameview.setContextMenuPolicy(Qt.NoContextMenu)
         self.right_layout.addWidget(self.frameview)
 
@@ -168,6 +212,11 @@ class MainWindow(QMainWindow):
         self.open_file_menu.triggered.connect(self.open_file)
         file_menu.addAction(self.open_file_menu)
 
+        self.song_library = QAction("Song Library...", self)
+        self.song_library.setEnabled(True)
+        self.song_library.triggered.connect(self.open_song_library)
+        file_menu.addAction(self.song_library)
+
         self.save_as_musicxml = QAction(f"Export File as .musicxml", self)
         self.save_as_musicxml.setEnabled(False)
         self.save_as_musicxml.triggered.connect(self.save_file_as_musicxml)
@@ -178,6 +227,16 @@ class MainWindow(QMainWindow):
         self.print_pdf.triggered.connect(self.save_file_as_pdf)
         file_menu.addAction(self.print_pdf)
 
+        self.export_audio = QAction(f"Export Audio...", self)
+        self.export_audio.setEnabled(False)
+        self.export_audio.triggered.connect(self.save_file_as_audio)
+        file_menu.addAction(self.export_audio)
+
+        self.export_everything = QAction(f"Export All...", self)
+        self.export_everything.setEnabled(False)
+        self.export_everything.triggered.connect(self.save_all_formats)
+        file_menu.addAction(self.export_everything)
+
         self.tabs_with_bend = QAction("Show Tabs with Bends", self)
         self.tabs_with_bend.setEnabled(False)
         self.tabs_with_bend.setCheckable(True) 
@@ -199,6 +258,23 @@ class MainWindow(QMainWindow):
         self.tabs_with_missing_notes.triggered.connect(self.toggle_tabs_with_missing_notes)
         tools_menu.addAction(self.tabs_with_missing_notes)
 
+        self.all_parts = QAction("Tab All Parts", self)
+        self.all_parts.setEnabled(False)
+        self.all_parts.setCheckable(True)
+        self.all_parts.setChecked(False)
+        self.all_parts.triggered.connect(self.toggle_all_parts)
+        tools_menu.addAction(self.all_parts)
+
+        self.auto_fit = QAction("Auto-Fit Transposition", self)
+        self.auto_fit.setEnabled(False)
+        self.auto_fit.triggered.connect(self.auto_fit_transposition)
+        tools_menu.addAction(self.auto_fit)
+
+        self.reset_transposition = QAction("Reset Transposition", self)
+        self.reset_transposition.setEnabled(False)
+        self.reset_transposition.triggered.connect(self.undo_transposition)
+        tools_menu.addAction(self.reset_transposition)
+
         self.copy_tab_to_clipboard = QAction("Copy Tab to Clipboard", self)
         self.copy_tab_to_clipboard.setEnabled(False)
         self.copy_tab_to_clipboard.triggered.connect(self.copy_to_clipboard)
@@ -225,14 +301,23 @@ class MainWindow(QMainWindow):
             self.harmonica_tuning,
             self.harmonica_key,
             self.choose_part,
+            self.measure_start,
+            self.measure_end,
             self.reduce_chords,
             self.midi_button_play,
+            self.follow_button,
             self.open_file_menu,
+            self.song_library,
             self.save_as_musicxml,
             self.print_pdf,
+            self.export_audio,
+            self.export_everything,
             self.tabs_with_bend,
             self.tabs_with_overblow,
             self.tabs_with_missing_notes,
+            self.all_parts,
+            self.auto_fit,
+            self.reset_transposition,
             self.copy_tab_to_clipboard,
             self.harp_keys,
             self.tab_rulers,
@@ -248,34 +333,84 @@ class MainWindow(QMainWindow):
             if self.file_name:
                 self.save_as_musicxml.setText(f"Export {self.file_name} as .musicxml")
                 self.print_pdf.setText(f"Export {self.file_name} as .pdf")
+                self.export_audio.setText(f"Export {self.file_name} as Audio...")
+                self.export_everything.setText(f"Export All Formats of {self.file_name}...")
                 self.setWindowTitle(f"Harmonica TabTool - {self.file_path}")
     
     def close_instances(self):
         if hasattr(self, 'sheet_viewer') and isinstance(self.sheet_viewer, SheetViewer):
+            self.sheet_viewer.cancel_engraving()
             if hasattr(self.sheet_viewer, 'file_handler') and isinstance(self.sheet_viewer.file_handler, FileHandler):
                 del self.sheet_viewer.file_handler
             if hasattr(self.sheet_viewer, 'score_editor') and isinstance(self.sheet_viewer.score_editor, ScoreEditor):
                 del self.sheet_viewer.score_editor
-            if hasattr(self.sheet_viewer, 'svg_handler') and isinstance(self.sheet_viewer.svg_handler, SVGHandler):
-                del self.sheet_viewer.svg_handler
             del self.sheet_viewer
         if hasattr(self, 'midi_player') and isinstance(self.midi_player, MidiPlayer):
             del self.midi_player
+        if hasattr(self, 'live_follower') and isinstance(self.live_follower, LiveFollower):
+            self.live_follower.stop()
+            del self.live_follower
 
     def open_file(self):
         file_dialog = QFileDialog(self)
-        self.file_path = file_dialog.getOpenFileName(self, "Open MIDI or MUSICXML File", "", "MIDI and MUSICXML files (*.mid *.midi *.musicxml)")[0]
+        self.file_path = file_dialog.getOpenFileName(self, "Open MIDI, MUSICXML or Tab File", "", "MIDI, MUSICXML and tab files (*.mid *.midi *.musicxml *.mxl *.xml *.txt *.tab)")[0]
         if self.file_path:
-            try:
-                self.update_file_name()
-                self.toggle_menus(True)
-                self.close_instances()
-                self.sheet_viewer = SheetViewer(self)
-                self.start_sheets(True)
-                self.update_part_change()
+            self.load_file()
 
-            except Exception as e:
-                print(f'Failed to load file. Reason: {e}')
+    def load_file(self):
+        try:
+            self.update_file_name()
+            self.toggle_menus(True)
+            self.close_instances()
+            self.sheet_viewer = SheetViewer(self)
+            self.start_sheets(True)
+            self.update_part_change()
+
+        except Exception as e:
+            print(f'Failed to load file. Reason: {e}')
+            return False
+
+        self.warm_audio_engine()
+        return True
+
+    def warm_audio_engine(self):
+        """
+        Open the audio stream ahead of Play; the song stays open if it fails.
+        """
+        try:
+            AudioEngine.instance().start()
+        except Exception as e:
+            self.status_bar.showMessage(f'Audio preview unavailable: {e}', 8000)
+
+    def open_song_library(self):
+        if not hasattr(self, 'library_panel'):
+            self.library_panel = LibraryPanel(self)
+        self.library_panel.show()
+        self.library_panel.raise_()
+
+    def open_library_song(self, file_path, part, type, tuning, key_name):
+        """
+        Open a song from the library with the part and harp of the chosen result.
+        """
+        self.file_path = file_path
+        if not self.load_file():
+            return
+
+        self.harmonica_type.blockSignals(True)
+        self.harmonica_type.setCurrentText(type)
+        self.harmonica_type.blockSignals(False)
+        self.populate_type_options()
+
+        self.harmonica_tuning.blockSignals(True)
+        self.harmonica_tuning.setCurrentText(tuning)
+        self.harmonica_tuning.blockSignals(False)
+
+        self.choose_part.blockSignals(True)
+        self.choose_part.setCurrentIndex(max(0, self.choose_part.findData(min(part, self.parts_num))))
+        self.choose_part.blockSignals(False)
+
+        self.sheet_viewer.preferred_key = key_name
+        self.start_sheets(False)
 
     def make_temp_directory(self):
         self.temp_dir = os.path.join(tempfile.gettempdir(), "harmonica_tabtool")
@@ -287,7 +422,10 @@ class MainWindow(QMainWindow):
         self.sheet_viewer.get_score(
             first_use, 
             self.choose_part,
+            self.get_measure_range()
         )
+        if first_use:
+            self.update_measure_range()
         self.harmonica_key_index = self.sheet_viewer.update_key_options(
             self.tabs_with_bend, 
             self.tabs_with_overblow, 
@@ -296,10 +434,16 @@ class MainWindow(QMainWindow):
             self.harmonica_key_index,
             self.harmonica_key_options_copy
         )
-        self.score_info = self.sheet_viewer.update_sheets_viewer(
-            self.harmonica_key_index,
-            self.reduce_chords
-        )
+        if self.all_parts.isChecked():
+            self.score_info = self.sheet_viewer.update_all_parts_viewer(
+                self.harmonica_key_index,
+                self.reduce_chords
+            )
+        else:
+            self.score_info = self.sheet_viewer.update_sheets_viewer(
+                self.harmonica_key_index,
+                self.reduce_chords
+            )
         if self.score_info:
             self.tab_in_text = self.score_info['tab_in_text']
             self.parts_num = self.score_info['parts_num']
@@ -307,7 +451,16 @@ class MainWindow(QMainWindow):
             self.removed_notes = self.score_info['removed_notes']
             self.mei_data = self.score_info['mei_data']
 
+            # Midi Preview of the combined parts view not implemented yet
+            if self.score_info.get('combined'):
+                self.midi_button_play.setEnabled(False)
+                self.follow_button.setEnabled(False)
+
     def on_type_change(self):
+        self.populate_type_options()
+        self.start_sheets(False)
+
+    def populate_type_options(self):
         self.harmonica_tuning.blockSignals(True)
         self.harmonica_tuning.clear() 
         self.harmonica_key.blockSignals(True)
@@ -329,8 +482,6 @@ class MainWindow(QMainWindow):
         self.harmonica_tuning.blockSignals(False)
         self.harmonica_key.blockSignals(False)
 
-        self.start_sheets(False)
-
     def on_tuning_change(self):
         self.start_sheets(False)
 
@@ -343,10 +494,50 @@ class MainWindow(QMainWindow):
     def update_part_change(self):
         self.choose_part.blockSignals(True)
         self.choose_part.clear()   
-        self.choose_part_options = [f'{i}°' for i in range(1, self.parts_num + 1)]
-        self.choose_part.addItems(self.choose_part_options)
+        self.choose_part_options = self.sheet_viewer.part_labels()
+        if self.all_parts.isChecked():
+            self.choose_part.addItem('All')
+        for part, label in enumerate(self.choose_part_options, start=1):
+            self.choose_part.addItem(label, part)
+            self.choose_part.setItemData(self.choose_part.count() - 1, label, Qt.ToolTipRole)
         self.choose_part.blockSignals(False)
 
+    def get_measure_range(self):
+        if not hasattr(self, 'sheet_viewer') or not hasattr(self.sheet_viewer, 'measure_bounds'):
+            return None
+
+        start, end = sorted((self.measure_start.value(), self.measure_end.value()))
+        if (start, end) == self.sheet_viewer.measure_bounds:
+            return None
+
+        return start, end
+
+    def update_measure_range(self):
+        first, last = self.sheet_viewer.measure_bounds
+        for measure_spin, value in ((self.measure_start, first), (self.measure_end, last)):
+            measure_spin.blockSignals(True)
+            measure_spin.setRange(first, last)
+            measure_spin.setValue(value)
+            measure_spin.blockSignals(False)
+        self.update_loop_range()
+
+    def update_loop_range(self):
+        first, last = self.get_measure_range() or self.sheet_viewer.measure_bounds
+        for loop_spin, value in ((self.loop_start, first), (self.loop_end, last)):
+            loop_spin.blockSignals(True)
+            loop_spin.setRange(first, last)
+            if not self.loop_enabled.isChecked():
+                loop_spin.setValue(value)
+            loop_spin.blockSignals(False)
+
+    def on_measures_change(self):
+        self.start_sheets(False)
+        self.update_loop_range()
+
+    def on_practice_change(self):
+        if hasattr(self, 'midi_player') and isinstance(self.midi_player, MidiPlayer):
+            self.midi_player.apply_practice_settings()
+
     def on_chord_change(self):
         self.start_sheets(False)
 
@@ -366,15 +557,75 @@ class MainWindow(QMainWindow):
             self.midi_player.stop_midi()
             del self.midi_player
 
-        self.midi_player = MidiPlayer(self)
-        self.midi_player.play_midi()
+        try:
+            self.midi_player = MidiPlayer(self)
+        except Exception as e:
+            self.status_bar.showMessage(f'Audio preview unavailable: {e}', 8000)
+            return
+        try:
+            self.midi_player.play_midi()
+        except EngraveError as e:
+            del self.midi_player
+            self.status_bar.showMessage(f"Failed to play the preview. Reason: {e}", 8000)
+            return
         self.toggle_menus(False)
         self.midi_button_stop.setEnabled(True)
 
+    def on_instrument_change(self):
+        AudioEngine.instance().select_instrument(self.instrument.currentText())
+
     def on_stop_midi(self):
         if hasattr(self, 'midi_player') and isinstance(self.midi_player, MidiPlayer):
             self.midi_player.stop_midi()
             del self.midi_player
+        if hasattr(self, 'live_follower') and isinstance(self.live_follower, LiveFollower):
+            self.live_follower.stop()
+            del self.live_follower
+            self.toggle_menus(True)
+            self.midi_button_stop.setEnabled(False)
+
+    def on_follow(self):
+        self.on_stop_midi()
+
+        self.live_follower = LiveFollower(self)
+        if not self.live_follower.start():
+            del self.live_follower
+            return
+
+        self.toggle_menus(False)
+        self.midi_button_stop.setEnabled(True)
+
+    def toggle_all_parts(self):
+        self.update_part_change()
+        self.start_sheets(False)
+        if not self.all_parts.isChecked():
+            self.midi_button_play.setEnabled(self.reduce_chords.isChecked())
+            self.follow_button.setEnabled(True)
+
+    def auto_fit_transposition(self):
+        best = self.sheet_viewer.auto_fit()
+        if not best:
+            return
+
+        self.harmonica_type.blockSignals(True)
+        self.harmonica_type.setCurrentText(best['type'])
+        self.harmonica_type.blockSignals(False)
+        self.populate_type_options()
+
+        self.harmonica_tuning.blockSignals(True)
+        self.harmonica_tuning.setCurrentText(best['tuning'])
+        self.harmonica_tuning.blockSignals(False)
+
+        self.start_sheets(False)
+        self.status_bar.showMessage(
+            f"Transposed {best['transpose']:+d} semitones for a {best['key_name']} {best['tuning']} harp: "
+            f"{best['bends']} bends, {best['overblows']} overblows, {best['missing']} missing notes", 8000
+        )
+
+    def undo_transposition(self):
+        self.sheet_viewer.transposition = 0
+        self.start_sheets(False)
+        self.status_bar.showMessage("Transposition reset to the original score", 8000)
 
     def toggle_tabs_with_bend(self):
         self.start_sheets(False)
@@ -386,23 +637,23 @@ class MainWindow(QMainWindow):
         self.start_sheets(False)
     
     def save_file_as_musicxml(self):
-        self.musicxml_path = os.path.join(self.temp_dir, f"{self.file_name}.musicxml")
-        if self.musicxml_path: 
-            file_dialog = QFileDialog()
-            file_dialog.setAcceptMode(QFileDialog.AcceptSave)
-            file_dialog.selectFile(self.file_name)
-            file_dialog.setNameFilters(["MusicXML files (*.musicxml)"])
-            file_dialog.setDefaultSuffix('musicxml')
-            if file_dialog.exec():
-                choosed_path = file_dialog.selectedFiles()[0]
-
-                if choosed_path:
-                    with open(self.musicxml_path, 'r') as musicxml_file:
-                        musicxml_content = musicxml_file.read()
-                    
-                    musicxml_byte_array = QByteArray(musicxml_content.encode('utf-8'))
-                    with open(choosed_path, 'wb') as file:
-                        file.write(musicxml_byte_array)
+        self.sheet_viewer.wait_for_engraving()
+        musicxml_data = self.sheet_viewer.musicxml_data
+        if musicxml_data is None:
+            self.status_bar.showMessage("Choose a single part to export it as MusicXML", 8000)
+            return
+
+        file_dialog = QFileDialog()
+        file_dialog.setAcceptMode(QFileDialog.AcceptSave)
+        file_dialog.selectFile(self.file_name)
+        file_dialog.setNameFilters(["MusicXML files (*.musicxml)"])
+        file_dialog.setDefaultSuffix('musicxml')
+        if file_dialog.exec():
+            choosed_path = file_dialog.selectedFiles()[0]
+
+            if choosed_path:
+                with open(choosed_path, 'w', encoding='utf-8') as file:
+                    file.write(musicxml_data)
 
     def save_file_as_pdf(self):
         file_dialog = QFileDialog()
@@ -412,16 +663,63 @@ class MainWindow(QMainWindow):
         file_dialog.setDefaultSuffix("pdf")
 
         if file_dialog.exec():
-            self.printer = QWebEngineView()
-            svg_file_path = self.sheet_viewer.create_sheets_to_pdf()
-            url = QUrl.fromLocalFile(svg_file_path)
-            self.printer.load(url)
+            choosed_path = file_dialog.selectedFiles()[0]
+            self.sheet_viewer.wait_for_engraving()
+            svg_pages = get_engraver().iter_svg_pages(self.sheet_viewer.mei_data)
+            try:
+                page_count = PDFExporter(self).export(svg_pages, choosed_path)
+            except EngraveError as e:
+                self.status_bar.showMessage(f"Failed to export the PDF. Reason: {e}", 8000)
+                return
+
+            self.status_bar.showMessage(f"Tablature of {self.file_name} was saved successfully ({page_count} pages).", 8000)
+
+    def save_file_as_audio(self):
+        file_dialog = QFileDialog()
+        file_dialog.setAcceptMode(QFileDialog.AcceptSave)
+        file_dialog.selectFile(self.file_name)
+        file_dialog.setNameFilters(["WAV files (*.wav)", "FLAC files (*.flac)"])
+        file_dialog.setDefaultSuffix("wav")
 
+        if file_dialog.exec():
             choosed_path = file_dialog.selectedFiles()[0]
-            page_layout = QPageLayout(QPageSize(QPageSize.A2), QPageLayout.Portrait, QMarginsF())
-            self.printer.page().printToPdf(choosed_path, page_layout)
+            exporter = AudioExporter(self.instrument.currentText())
+            try:
+                duration = exporter.render(self.sheet_viewer.get_midi_data(), choosed_path)
+                self.status_bar.showMessage(f"Audio of {self.file_name} ({duration:.0f}s) was saved successfully.", 8000)
+            except Exception as e:
+                self.status_bar.showMessage(f"Failed to export audio. Reason: {e}", 8000)
+
+    def save_all_formats(self):
+        render = self.sheet_viewer.render_state()
+        if render is None:
+            self.status_bar.showMessage("Choose a single engraved part to export all formats", 8000)
+            return
+
+        output_dir = QFileDialog.getExistingDirectory(self, "Export All Formats To")
+        if not output_dir:
+            return
+
+        progress_dialog = QProgressDialog("Exporting...", None, 0, 0, self)
+        progress_dialog.setWindowModality(Qt.WindowModal)
+        progress_dialog.setMinimumDuration(0)
+
+        def progress(done, total, export_format, error):
+            progress_dialog.setMaximum(total)
+            progress_dialog.setValue(done)
+            progress_dialog.setLabelText(f"{export_format} {'failed' if error else 'written'}")
+            QApplication.processEvents()
+
+        try:
+            results = export_all(render, output_dir, self.file_name, instrument=self.instrument.currentText(), progress=progress, source_path=self.file_path)
+        finally:
+            progress_dialog.close()
 
-            self.status_bar.showMessage(f"Tablature of {self.file_name} was saved successfully.", 8000)
+        failed = [f"{result['format']} ({result['error']})" for result in results if result['error']]
+        message = f"Exported {len(results) - len(failed)} of {len(results)} formats to {output_dir}"
+        if failed:
+            message += f"; failed: {', '.join(failed)}"
+        self.status_bar.showMessage(message, 8000)
 
     def copy_to_clipboard(self):
         if self.tab_in_text:
@@ -434,19 +732,20 @@ class MainWindow(QMainWindow):
     def open_harp_keys(self):
         if self.frameview:
             harp_keys = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'assets', 'charts', 'harp-keys.svg'))
-            file = QUrl.fromLocalFile(harp_keys)
-            self.frameview.load(file)
+            self.frameview.show_svg_file(harp_keys)
 
     def open_tab_rulers(self):
         if self.frameview:
             tab_rulers = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'assets', 'charts', 'tab-rulers.svg'))
-            file = QUrl.fromLocalFile(tab_rulers)
-            self.frameview.load(file)
+            self.frameview.show_svg_file(tab_rulers)
 
     def show_about(self):
         pass
 
     def closeEvent(self, event):
+        AudioEngine.instance().shutdown()
+        shutdown_part_pool()
+        shutdown_engraver()
         try:
             self.temp_dir = os.path.join(tempfile.gettempdir(), "harmonica_tabtool")
             shutil.rmtree(self.temp_dir)
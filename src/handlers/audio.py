@@ -0,0 +1,280 @@
+import io
+import os
+import struct
+import mido
+import tinysoundfont
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from constants.soundfonts import SOUNDFONTS
+from core import memory
+from handlers.converters import FileHandler
+from handlers.score import ScoreEditor
+
+SONG_EXTENSIONS = ('.mid', '.midi', '.musicxml', '.mxl')
+SOUNDFONT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'assets', 'soundfont'))
+
+class AudioEngine:
+    """
+    App-wide synthesizer shared by every MIDI preview.
+
+    The audio stream is opened on first use and every soundfont in
+    `SOUNDFONTS` is loaded once and kept resident, so switching instruments
+    is a program change instead of a reload. Use `AudioEngine.instance()`
+    rather than building new engines.
+    """
+    _instance = None
+
+    def __init__(self, buffer_size=1024):
+        self.buffer_size = buffer_size
+        self.synth = None
+        self.soundfonts = {}
+        self.instrument = None
+        self.channel = 0
+
+    @classmethod
+    def instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def start(self):
+        """
+        Load the soundfonts and open the audio stream if not done yet.
+
+        A small buffer keeps the output latency around 25 ms at 44.1 kHz,
+        which is what makes Play feel immediate once the engine is warm.
+        """
+        if self.synth is None:
+            synth = tinysoundfont.Synth()
+            soundfonts = {}
+            for name, (file_name, _, _) in SOUNDFONTS.items():
+                soundfonts[name] = synth.sfload(os.path.join(SOUNDFONT_DIR, file_name))
+            synth.start(buffer_size=self.buffer_size)
+            # Only a started synth is kept, so a failed start is retried next time
+            self.synth, self.soundfonts = synth, soundfonts
+            self.select_instrument(self.instrument or next(iter(SOUNDFONTS)))
+
+        return self.synth
+
+    def select_instrument(self, instrument):
+        """
+        Switch the preview instrument through a program change.
+
+        Parameters
+        ----------
+        instrument : str
+            One of the names in `SOUNDFONTS` (e.g. 'Piano' or 'Harmonica').
+        """
+        if instrument not in SOUNDFONTS:
+            return
+
+        self.instrument = instrument
+        if self.synth is not None:
+            _, bank, preset = SOUNDFONTS[instrument]
+            self.synth.program_select(self.channel, self.soundfonts[instrument], bank, preset)
+
+    def play_note(self, note, volume=100):
+        self.start()
+        self.synth.noteon(self.channel, note, volume)
+        self.synth.noteoff(self.channel, note)
+
+    def silence(self):
+        if self.synth is not None:
+            self.synth.sounds_off()
+
+    def shutdown(self):
+        if self.synth is not None:
+            self.synth.stop()
+            self.synth = None
+            self.soundfonts = {}
+
+class AudioExporter:
+    """
+    Offline renderer that turns preview MIDI data into an audio file.
+
+    Audio is generated by a private, non-realtime synth in fixed-size blocks
+    and every block is written to disk as soon as it is produced, so memory
+    does not grow with the length of the song.
+    """
+    def __init__(self, instrument='Harmonica', sample_rate=44100, block_size=4096, tail=1.5):
+        self.instrument = instrument
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.tail = tail
+
+    def create_synth(self):
+        file_name, bank, preset = SOUNDFONTS[self.instrument]
+        synth = tinysoundfont.Synth(samplerate=self.sample_rate)
+        sfid = synth.sfload(os.path.join(SOUNDFONT_DIR, file_name))
+        for channel in range(16):
+            synth.program_select(channel, sfid, bank, preset)
+
+        return synth
+
+    def generate(self, synth, frames, writer):
+        while frames > 0:
+            block = min(frames, self.block_size)
+            writer.write(synth.generate(block))
+            frames -= block
+
+    def render(self, midi_data, output_path):
+        """
+        Render MIDI data to a WAV or FLAC file.
+
+        Parameters
+        ----------
+        midi_data : bytes
+            Standard MIDI file contents, as returned by `pipeline.render_midi`.
+        output_path : str
+            Destination file; the format is taken from its extension.
+
+        Returns
+        -------
+        float
+            Duration of the rendered audio in seconds.
+        """
+        synth = self.create_synth()
+        writer = open_audio_writer(output_path, self.sample_rate)
+        rendered_frames = 0
+        song_time = 0.0
+
+        try:
+            for msg in mido.MidiFile(file=io.BytesIO(midi_data)):
+                song_time += msg.time
+                frames = round(song_time * self.sample_rate) - rendered_frames
+                if frames > 0:
+                    self.generate(synth, frames, writer)
+                    rendered_frames += frames
+
+                if msg.type == 'note_on' and msg.velocity > 0:
+                    synth.noteon(msg.channel, msg.note, msg.velocity)
+                elif msg.type in ('note_on', 'note_off'):
+                    synth.noteoff(msg.channel, msg.note)
+                elif msg.type == 'control_change':
+                    synth.control_change(msg.channel, msg.control, msg.value)
+
+            synth.notes_off()
+            tail_frames = round(self.tail * self.sample_rate)
+            self.generate(synth, tail_frames, writer)
+            rendered_frames += tail_frames
+        finally:
+            writer.close()
+
+        return rendered_frames / self.sample_rate
+
+
+class FloatWaveWriter:
+    """
+    Minimal streaming writer for 32-bit float stereo WAV files.
+
+    The `wave` module only writes integer PCM, which would force a per-sample
+    conversion of the synth output; float WAV takes the blocks as they are.
+    The RIFF sizes are patched in on `close`.
+    """
+    def __init__(self, path, sample_rate, channels=2):
+        self.file = open(path, 'wb')
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.data_size = 0
+        self.write_header()
+
+    def write_header(self):
+        block_align = self.channels * 4
+        self.file.write(b'RIFF')
+        self.file.write(struct.pack('<I', 36 + self.data_size))
+        self.file.write(b'WAVEfmt ')
+        self.file.write(struct.pack('<IHHIIHH', 16, 3, self.channels, self.sample_rate,
+                                    self.sample_rate * block_align, block_align, 32))
+        self.file.write(b'data')
+        self.file.write(struct.pack('<I', self.data_size))
+
+    def write(self, block):
+        block = memoryview(block).cast('B')
+        self.file.write(block)
+        self.data_size += len(block)
+
+    def close(self):
+        self.file.seek(0)
+        self.write_header()
+        self.file.close()
+
+
+class FlacWriter:
+    def __init__(self, path, sample_rate, channels=2):
+        try:
+            import numpy
+            import soundfile
+        except ImportError as e:
+            raise RuntimeError("FLAC export requires the 'soundfile' package") from e
+
+        self.numpy = numpy
+        self.channels = channels
+        self.file = soundfile.SoundFile(path, 'w', sample_rate, channels, format='FLAC', subtype='PCM_16')
+
+    def write(self, block):
+        samples = self.numpy.frombuffer(block, dtype=self.numpy.float32).reshape(-1, self.channels)
+        self.file.write(samples)
+
+    def close(self):
+        self.file.close()
+
+
+def open_audio_writer(path, sample_rate):
+    if os.path.splitext(path)[1].lower() == '.flac':
+        return FlacWriter(path, sample_rate)
+
+    return FloatWaveWriter(path, sample_rate)
+
+
+def render_song_audio(file_path, output_path, instrument='Harmonica', part=1, measures=None):
+    """
+    Render the MIDI preview of one song to an audio file without the GUI.
+
+    The selected part goes through the same chord reduction and verovio MIDI
+    rendering as the preview (labels do not change the sound, so they are
+    skipped).
+
+    Returns
+    -------
+    tuple
+        The output path and the rendered duration in seconds.
+    """
+    from core import pipeline
+
+    source = SimpleNamespace(file_path=file_path, file_name=os.path.splitext(os.path.basename(file_path))[0])
+    piece, _ = FileHandler(source).midi_to_musicxml(part, measures)
+    piece, _, _ = ScoreEditor(source).chords_handler(piece)
+    midi_data = pipeline.render_midi(pipeline.engrave(pipeline.to_musicxml(piece)))
+
+    duration = AudioExporter(instrument).render(midi_data, output_path)
+
+    return output_path, duration
+
+
+def render_folder_audio(folder, output_dir, instrument='Harmonica', audio_format='wav', jobs=None):
+    """
+    Render every MIDI/MusicXML song of a folder on a process pool.
+
+    Yields
+    ------
+    tuple
+        The source file, and either `(output_path, duration)` or the exception raised.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    songs = [
+        os.path.join(folder, name) for name in sorted(os.listdir(folder))
+        if os.path.splitext(name)[1].lower() in SONG_EXTENSIONS
+    ]
+
+    with ProcessPoolExecutor(max_workers=memory.parallel_workers(jobs)) as executor:
+        futures = {}
+        for song in songs:
+            output_path = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(song))[0]}.{audio_format}")
+            futures[executor.submit(render_song_audio, song, output_path, instrument)] = song
+
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
@@ -0,0 +1,157 @@
+import numpy as np
+from music21 import pitch
+
+from constants.tunings import HARMONICA_TUNINGS, HARMONICA_KEYS
+from core.events import NoteEvents
+
+HARMONICA_TYPES = {
+    'Diatonic': ('diatonic', HARMONICA_KEYS),
+    'Chromatic': ('chromatic', [("C", "C4")])
+}
+PLAIN, BEND, OVERBLOW, MISSING = range(4)
+TRANSPOSE_RANGE = 24
+
+def token_category(token):
+    if '\'' in token:
+        return BEND
+    if 'o' in token:
+        return OVERBLOW
+    return PLAIN
+
+
+def pitch_histogram(score, chords=True):
+    """
+    Count how many times each MIDI pitch is played in a score (or its `NoteEvents`).
+
+    Parameters
+    ----------
+    chords : bool
+        If False, chord notes are left out: only the notes `ScoreEditor.filter_keys`
+        checks are counted.
+
+    Returns
+    -------
+    ndarray
+        128 counts indexed by MIDI pitch; chord notes are counted one by one.
+    """
+    events = score if isinstance(score, NoteEvents) else NoteEvents.from_part(score)
+    selected = events.direct() if chords else events.direct() & ~events.in_chord
+    # Microtonal pitches count for the nearest semitone, not the one below
+    pitches = np.rint(events.pitch[selected]).astype(int)
+
+    return np.bincount(np.clip(pitches, 0, 127), minlength=128)
+
+
+class AutoFit:
+    """
+    Search the transposition and harp that make a score easiest to play.
+
+    Every harp (type, tuning and key) is turned once into a table that maps each
+    MIDI pitch to plain, bend, overblow or missing. A search then shifts the
+    score's pitch histogram by every semitone in ±2 octaves and counts the four
+    categories for all harps at once with a single array product.
+    """
+    def __init__(self):
+        self.harps = []
+        categories = []
+
+        for type, (tuning_type, key_options) in HARMONICA_TYPES.items():
+            for tuning, tokens in HARMONICA_TUNINGS[tuning_type].items():
+                if not any(token.strip() for token in tokens):
+                    continue
+
+                for key_name, key in key_options:
+                    start = int(pitch.Pitch(key).ps)
+                    row = np.full(128, MISSING)
+                    for offset, token in enumerate(tokens):
+                        if start + offset < 128:
+                            row[start + offset] = token_category(token)
+
+                    self.harps.append((type, tuning, key_name, key))
+                    categories.append(row)
+
+        self.one_hot = np.eye(4, dtype=int)[np.array(categories)]  # (harps, pitches, categories)
+        self.shifts = np.arange(-TRANSPOSE_RANGE, TRANSPOSE_RANGE + 1)
+
+    def count_categories(self, histogram):
+        """
+        Return the category counts for every shift and harp, shaped (shifts, harps, 4).
+        """
+        source = np.arange(128)[None, :] - self.shifts[:, None]
+        inside = (source >= 0) & (source < 128)
+        shifted = np.where(inside, histogram[np.clip(source, 0, 127)], 0)
+
+        counts = np.tensordot(shifted, self.one_hot, axes=([1], [1]))
+        counts[..., MISSING] += (histogram.sum() - shifted.sum(axis=1))[:, None]  # Notes shifted out of the MIDI range
+
+        return counts
+
+    def harp_counts(self, histogram, transpose=0):
+        """
+        Return the category counts of every harp for one transposition, shaped (harps, 4).
+        """
+        return self.count_categories(histogram)[transpose + TRANSPOSE_RANGE]
+
+    def search(self, histogram, limit=10, harmonica_type=None):
+        """
+        Rank transpositions and harps for a pitch histogram.
+
+        Candidates are ordered by missing notes, then overblows, then bends, and
+        finally by the smallest transposition.
+
+        Parameters
+        ----------
+        histogram : ndarray
+            Output of `pitch_histogram`.
+        limit : int
+            Number of candidates to return.
+        harmonica_type : str, optional
+            Only consider 'Diatonic' or 'Chromatic' harps.
+
+        Returns
+        -------
+        list of dict
+            'transpose', 'type', 'tuning', 'key_name', 'key', 'bends',
+            'overblows' and 'missing' for each candidate, best first.
+        """
+        counts = self.count_categories(histogram)
+        cost = (
+            counts[..., MISSING] * 1e9
+            + counts[..., OVERBLOW] * 1e5
+            + counts[..., BEND] * 10
+            + np.abs(self.shifts)[:, None]
+        ).astype(float)
+
+        if harmonica_type:
+            excluded = np.array([harp[0] != harmonica_type for harp in self.harps])
+            cost[:, excluded] = np.inf
+
+        candidates = []
+        for flat_index in np.argsort(cost, axis=None)[:limit]:
+            shift_index, harp_index = np.unravel_index(flat_index, cost.shape)
+            if not np.isfinite(cost[shift_index, harp_index]):
+                break
+
+            type, tuning, key_name, key = self.harps[harp_index]
+            candidates.append({
+                'transpose': int(self.shifts[shift_index]),
+                'type': type,
+                'tuning': tuning,
+                'key_name': key_name,
+                'key': key,
+                'bends': int(counts[shift_index, harp_index, BEND]),
+                'overblows': int(counts[shift_index, harp_index, OVERBLOW]),
+                'missing': int(counts[shift_index, harp_index, MISSING])
+            })
+
+        return candidates
+
+
+_auto_fit = None
+
+def get_auto_fit():
+    global _auto_fit
+    if _auto_fit is None:
+        _auto_fit = AutoFit()
+
+    return _auto_fit
@@ -1,64 +1,111 @@
-import os
-import verovio
+import copy
 from music21 import converter
 
+from core.midiscan import is_midi, load_part, part_label, scan_midi
+from core.tab_import import is_tab, load_tab
+
+def slice_measures(part, measures=None):
+    """
+    Copy a part, keeping only a range of measures.
+
+    Only the selected measures (plus the clef, key and time signature in effect)
+    are copied, so everything downstream works on the passage alone.
+
+    Parameters
+    ----------
+    part : Part
+        Part of the parsed score; it is never modified.
+    measures : tuple of int, optional
+        First and last measure numbers, inclusive. None keeps the whole part.
+
+    Returns
+    -------
+    Part
+        A copy that labeling and chord reduction can edit freely.
+    """
+    if measures is None:
+        return copy.deepcopy(part)
+
+    return copy.deepcopy(part.measures(measures[0], measures[1]))
+
+
 class FileHandler:
     def __init__(self, source):
         self.file_path = source.file_path
-        self.file_name = source.file_name
-        self.temp_dir = source.temp_dir
 
-        self.toolkit = verovio.toolkit()
+        self.score = None
+        self.part = None
+        self.part_pos = None
+        self.part_count = None
+        self.part_labels = None
+
+    def parse_score(self):
+        """
+        Parse the source file once and keep the score for later part requests.
+        """
+        if self.score is None and is_tab(self.file_path):
+            self.score, unknown = load_tab(self.file_path)
+            if unknown:
+                print(f"Skipped tokens not found in the tuning: {' '.join(unknown)}")
+        elif self.score is None:
+            self.score = converter.parse(self.file_path)
+
+        return self.score
 
-    def midi_to_musicxml(self, part_pos):
-        score = converter.parse(self.file_path)
-        part_num = len(score.parts)
-        piece = score.parts[part_pos - 1]
+    def parse_part(self, part_pos):
+        """
+        Parse one part of the source file and keep it for later requests.
+
+        Only the chosen track of a MIDI file goes to music21 (see
+        `core.midiscan`), unless the whole score is already parsed. Files
+        mido cannot read are parsed whole.
+
+        Returns
+        -------
+        tuple
+            The part (not a copy) and the number of parts in the score.
+        """
+        if self.score is None and is_midi(self.file_path):
+            if part_pos != self.part_pos:
+                try:
+                    score, self.part_count = load_part(self.file_path, part_pos)
+                    self.part, self.part_pos = score.parts[0], part_pos
+                except Exception as e:
+                    print(f'Failed to parse part {part_pos} alone, parsing the whole file. Reason: {e}')
+                    self.parse_score()
+            if self.score is None:
+                return self.part, self.part_count
+
+        score = self.parse_score()
+        return score.parts[part_pos - 1], len(score.parts)
+
+    def scan_part_labels(self):
+        """
+        Return the Choose Part label of every part, scanned once per file.
+
+        MIDI parts are named after their tracks, with their range and note
+        count; other files get None, for the plain numbered labels.
+        """
+        if self.part_labels is None and is_midi(self.file_path):
+            try:
+                self.part_labels = [part_label(part) for part in scan_midi(self.file_path)]
+            except Exception as e:
+                print(f'Failed to scan the MIDI tracks. Reason: {e}')
+
+        return self.part_labels
+
+    def midi_to_musicxml(self, part_pos, measures=None):
+        part, part_num = self.parse_part(part_pos)
+        piece = slice_measures(part, measures)
 
         return piece, part_num
 
-    def musicxml_to_mei(self, musicxml_path):
-        self.toolkit.loadFile(musicxml_path)
-        mei_data = self.toolkit.getMEI()
-
-        return mei_data
-
-    def mei_to_svg(self, mei_data):
-        self.toolkit.loadData(mei_data)
-        page_num = self.toolkit.getPageCount()
-        svg_files = []
-        
-        for page in range(1, page_num + 1):
-            svg_file_path = os.path.join(self.temp_dir, f"{self.file_name}_page{page}.svg")
-            self.toolkit.renderToSVGFile(svg_file_path, page)
-            svg_files.append(svg_file_path)
-
-        return svg_files
-    
-    #def mei_to_svg_data(self, mei_data):
-    #    self.toolkit.loadData(mei_data)
-    #    page_num = self.toolkit.getPageCount()
-    #    svg_sheet = []
-    #    
-    #    for page in range(1, page_num + 1):
-    #        svg_page = self.toolkit.renderToSVG(page)
-    #        svg_sheet.append(svg_page)
-    #
-    #    return svg_sheet
-    
-    def mei_to_midi(self, mei_data):
-        midi_path = os.path.join(self.temp_dir, f"{self.file_name}.mid")
-
-        self.toolkit.loadData(mei_data)
-        self.toolkit.renderToMIDIFile(midi_path)  # Rare occurrence: Some data can crash the app after running this
-
-        return midi_path
-
-    def musicxml_to_svg(self, piece):
-        musicxml_path = os.path.join(self.temp_dir, f"{self.file_name}.musicxml")
-        piece.write("musicxml", fp=musicxml_path)
-
-        mei_data = self.musicxml_to_mei(musicxml_path)
-        svg_files = self.mei_to_svg(mei_data)
-
-        return svg_files, mei_data
+    def measure_bounds(self, part_pos):
+        """
+        Return the first and last measure numbers of a part.
+        """
+        part_measures = self.parse_part(part_pos)[0].getElementsByClass('Measure')
+        if not part_measures:
+            return 1, 1
+
+        return part_measures.first().number, part_measures.last().number
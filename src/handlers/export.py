@@ -0,0 +1,192 @@
+"""
+Export All: write every output format of one render at once.
+
+The render state (labeled MusicXML, MEI, SVG pages, tablature text and
+optionally MIDI) is computed once by the caller. Every format is then written
+from it in parallel on a thread pool:
+
+- PDF and the per-page SVG files share the same SVG pages.
+- The MIDI file and the audio share one MIDI rendering.
+
+Only what is missing from the render state is produced, on the verovio
+workers of `core.engraver`. Each format reports its own result, so one
+failing writer (FLAC without `soundfile`, say) does not stop the others.
+"""
+import os
+import time
+import zipfile
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from core.engraver import get_engraver
+
+EXPORT_FORMATS = ('musicxml', 'mxl', 'pdf', 'svg', 'midi', 'tab', 'audio')
+AUDIO_FORMATS = ('wav', 'flac')
+MXL_CONTAINER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<container>\n'
+    '  <rootfiles>\n'
+    '    <rootfile full-path="{name}" media-type="application/vnd.recordare.musicxml+xml"/>\n'
+    '  </rootfiles>\n'
+    '</container>\n'
+)
+
+def write_text(path, text):
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(text)
+
+    return [path]
+
+
+def write_mxl(path, musicxml_data, name):
+    """
+    Write MusicXML data as a compressed `.mxl` archive.
+    """
+    root_name = f'{name}.musicxml'
+    with zipfile.ZipFile(path, 'w') as archive:
+        # The mimetype entry comes first and uncompressed, as the format requires
+        archive.writestr('mimetype', 'application/vnd.recordare.musicxml', compress_type=zipfile.ZIP_STORED)
+        archive.writestr('META-INF/container.xml', MXL_CONTAINER.format(name=root_name), compress_type=zipfile.ZIP_DEFLATED)
+        archive.writestr(root_name, musicxml_data, compress_type=zipfile.ZIP_DEFLATED)
+
+    return [path]
+
+
+def write_svg_pages(base_path, svg_pages, check_path=None):
+    """
+    Write one SVG file per page, named `<base path>_page<number>.svg`.
+
+    `check_path`, when given, is called with every path before it is written.
+    """
+    paths = []
+    for page, svg_page in enumerate(svg_pages, start=1):
+        paths.append(f'{base_path}_page{page}.svg')
+        if check_path:
+            check_path(paths[-1])
+        write_text(paths[-1], svg_page)
+
+    return paths
+
+
+def write_pdf(path, svg_pages, title):
+    from handlers.pdf import PDFExporter
+
+    PDFExporter(SimpleNamespace(file_name=title)).export(svg_pages, path)
+
+    return [path]
+
+
+def write_midi(path, midi_data):
+    with open(path, 'wb') as file:
+        file.write(midi_data)
+
+    return [path]
+
+
+def write_audio(path, midi_data, instrument):
+    from handlers.audio import AudioExporter
+
+    AudioExporter(instrument).render(midi_data, path)
+
+    return [path]
+
+
+def same_file(path, other_path):
+    return os.path.normcase(os.path.realpath(path)) == os.path.normcase(os.path.realpath(other_path))
+
+
+def export_all(render, output_dir, name, formats=EXPORT_FORMATS, instrument='Harmonica', audio_format='wav', progress=None, source_path=None):
+    """
+    Write the chosen formats of one render in parallel.
+
+    Parameters
+    ----------
+    render : dict
+        'musicxml', 'mei_data' and 'tab_in_text', plus 'svg_pages' and
+        'midi_data' when they are already known (as in the GUI).
+    output_dir : str
+        Folder of the exported files (created if needed).
+    name : str
+        Base name of the files; also the title of the PDF.
+    formats : iterable of str
+        Any of `EXPORT_FORMATS`.
+    instrument : str
+        Soundfont of the audio, a key of `SOUNDFONTS`.
+    audio_format : str
+        'wav' or 'flac'.
+    progress : callable, optional
+        Called with (done, total, format, error) in the calling thread after
+        each format is written; `error` is None on success.
+    source_path : str, optional
+        The song the render comes from. A format whose output would replace
+        it fails instead of being written.
+
+    Returns
+    -------
+    list of dict
+        One entry per format, in `EXPORT_FORMATS` order: 'format', 'paths',
+        'seconds' and 'error' (None on success).
+    """
+    formats = [export_format for export_format in EXPORT_FORMATS if export_format in formats]
+    os.makedirs(output_dir, exist_ok=True)
+    base_path = os.path.join(output_dir, name)
+
+    def output(path):
+        if source_path is not None and same_file(path, source_path):
+            raise ValueError(f'{path} is the source file, it is not overwritten')
+        return path
+
+    if 'pdf' in formats:
+        # Qt needs its application object on the main thread before any worker paints
+        from handlers.pdf import ensure_gui_application
+        ensure_gui_application()
+
+    with ThreadPoolExecutor(max_workers=len(formats) + 2) as executor:
+        # Each shared input is produced once, while the writers that do not need it already run
+        if {'pdf', 'svg'} & set(formats):
+            svg_pages = executor.submit(lambda: render.get('svg_pages') or get_engraver().svg_pages(render['mei_data']))
+        if {'midi', 'audio'} & set(formats):
+            midi_data = executor.submit(lambda: render.get('midi_data') or get_engraver().render_midi(render['mei_data']))
+
+        writers = {
+            'musicxml': lambda: write_text(output(f'{base_path}.musicxml'), render['musicxml']),
+            'mxl': lambda: write_mxl(output(f'{base_path}.mxl'), render['musicxml'], name),
+            'pdf': lambda: write_pdf(output(f'{base_path}.pdf'), svg_pages.result(), name),
+            'svg': lambda: write_svg_pages(base_path, svg_pages.result(), output),
+            'midi': lambda: write_midi(output(f'{base_path}.mid'), midi_data.result()),
+            'tab': lambda: write_text(output(f'{base_path}.txt'), render['tab_in_text'].strip() + '\n'),
+            'audio': lambda: write_audio(output(f'{base_path}.{audio_format}'), midi_data.result(), instrument)
+        }
+
+        def run(export_format):
+            start = time.perf_counter()
+            try:
+                paths, error = writers[export_format](), None
+            except Exception as e:
+                paths, error = [], str(e) or type(e).__name__
+            return {'format': export_format, 'paths': paths, 'seconds': time.perf_counter() - start, 'error': error}
+
+        results = {}
+        futures = [executor.submit(run, export_format) for export_format in formats]
+        for done, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            results[result['format']] = result
+            if progress:
+                progress(done, len(formats), result['format'], result['error'])
+
+    return [results[export_format] for export_format in formats]
+
+
+def export_summary(results):
+    """
+    Return a short text summary of `export_all` results, one line per format.
+    """
+    lines = []
+    for result in results:
+        if result['error']:
+            lines.append(f"{result['format']:<9} failed: {result['error']}")
+        else:
+            files = result['paths'][0] if len(result['paths']) == 1 else f"{len(result['paths'])} files"
+            lines.append(f"{result['format']:<9} {files} ({result['seconds']:.1f}s)")
+
+    return '\n'.join(lines)
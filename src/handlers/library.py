@@ -0,0 +1,351 @@
+"""
+Song library: a playability index of a folder of songs, kept in SQLite.
+
+Indexing walks the folder and only analyses what changed. A file whose size
+and modification time match the index is skipped. A file whose content hash
+matches is only re-stamped, and when it matches a song whose file has gone,
+the song is moved to the new path. New and edited files are analysed on a
+process pool. For every part the index stores the note count, the pitch
+range, the pitch histogram and, for every harp (type, tuning and key), how
+many notes outside chords need bends or overblows or cannot be played at
+all, the notes the key filters of the app check. It also stores the best
+transposition found by `AutoFit`. Searches are then plain SQL queries.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from core import memory
+from handlers.audio import SONG_EXTENSIONS
+
+DEFAULT_LIBRARY_PATH = os.path.join(os.path.expanduser('~'), '.harmonica_tabtool', 'library.sqlite')
+HASH_CHUNK_SIZE = 1024 * 1024
+# Bumped when the analysis changes, so songs indexed before are analysed again
+ANALYSIS_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    title TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    hash TEXT NOT NULL,
+    part_count INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS songs_hash ON songs (hash);
+CREATE TABLE IF NOT EXISTS parts (
+    song_id INTEGER NOT NULL REFERENCES songs (id) ON DELETE CASCADE,
+    part INTEGER NOT NULL,
+    notes INTEGER NOT NULL,
+    low INTEGER,
+    high INTEGER,
+    histogram BLOB NOT NULL,
+    best_transpose INTEGER,
+    best_type TEXT,
+    best_tuning TEXT,
+    best_key TEXT,
+    best_missing INTEGER,
+    PRIMARY KEY (song_id, part)
+);
+CREATE TABLE IF NOT EXISTS feasibility (
+    song_id INTEGER NOT NULL REFERENCES songs (id) ON DELETE CASCADE,
+    part INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    tuning TEXT NOT NULL,
+    key_name TEXT NOT NULL,
+    bends INTEGER NOT NULL,
+    overblows INTEGER NOT NULL,
+    missing INTEGER NOT NULL,
+    PRIMARY KEY (song_id, part, type, tuning, key_name)
+);
+CREATE INDEX IF NOT EXISTS feasibility_harp ON feasibility (type, tuning, key_name, missing, overblows, bends);
+"""
+
+def file_hash(file_path):
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def analyse_song(file_path):
+    """
+    Analyse every part of a song; runs in a worker process.
+
+    Returns
+    -------
+    list of dict
+        Per part: 'part', 'notes', 'low', 'high', 'histogram' (128 counts),
+        'counts' (category counts per harp of the notes outside chords, in
+        `AutoFit.harps` order) and 'best' (the best `AutoFit.search`
+        candidate, or None).
+    """
+    from core import pipeline
+    from core.events import NoteEvents
+    from core.musicxml import is_musicxml
+    from handlers.autofit import get_auto_fit, pitch_histogram
+
+    auto_fit = get_auto_fit()
+    if is_musicxml(file_path):
+        events, part_count = pipeline.load_events(file_path, 1)
+        part_events = (events if part == 1 else pipeline.load_events(file_path, part)[0] for part in range(1, part_count + 1))
+    else:
+        # MIDI goes through music21 once for all of its parts
+        score = pipeline.load(file_path)
+        part_events = (NoteEvents.from_part(part) for part in score.parts)
+    parts = []
+
+    for part, events in enumerate(part_events, start=1):
+        histogram = pitch_histogram(events)
+        played = np.flatnonzero(histogram)
+        # Counted like ScoreEditor.filter_keys, so the index agrees with the key filters
+        melody = pitch_histogram(events, chords=False)
+
+        parts.append({
+            'part': part,
+            'notes': int(histogram.sum()),
+            'low': int(played[0]) if len(played) else None,
+            'high': int(played[-1]) if len(played) else None,
+            'histogram': histogram.astype(np.int32),
+            'counts': auto_fit.harp_counts(melody),
+            'best': auto_fit.search(histogram, limit=1)[0] if len(played) else None
+        })
+
+    return parts
+
+
+def iter_song_files(folder):
+    for root, directories, files in os.walk(folder):
+        directories.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in SONG_EXTENSIONS:
+                yield os.path.abspath(os.path.join(root, name))
+
+
+class SongLibrary:
+    """
+    Playability index of song folders.
+
+    Parameters
+    ----------
+    db_path : str
+        SQLite database, created on first use.
+    """
+    def __init__(self, db_path=DEFAULT_LIBRARY_PATH):
+        self.db_path = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        self.connection = sqlite3.connect(db_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(SCHEMA)
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] != ANALYSIS_VERSION:
+            with self.connection:
+                self.connection.execute('DELETE FROM songs')
+            self.connection.execute(f'PRAGMA user_version = {ANALYSIS_VERSION}')
+
+    def close(self):
+        self.connection.close()
+
+    def index(self, folder, workers=None, progress=None):
+        """
+        Bring the index of a folder up to date.
+
+        Parameters
+        ----------
+        folder : str
+            Folder walked recursively for MIDI and MusicXML files.
+        workers : int, optional
+            Analysis processes, the CPU count by default (fewer under a memory budget).
+        progress : callable, optional
+            Called with `(done, total, path)` after each analysed file.
+
+        Returns
+        -------
+        dict
+            Number of files 'added', 'updated', 'moved', 'unchanged',
+            'removed' and 'failed'.
+        """
+        folder = os.path.abspath(folder)
+        stats = dict.fromkeys(('added', 'updated', 'moved', 'unchanged', 'removed', 'failed'), 0)
+        known = {
+            row['path']: row for row in self.connection.execute('SELECT id, path, size, mtime, hash FROM songs')
+            if row['path'].startswith(os.path.join(folder, ''))
+        }
+
+        present = set()
+        changed = []
+        for file_path in iter_song_files(folder):
+            present.add(file_path)
+            status = os.stat(file_path)
+            row = known.get(file_path)
+            if row and row['size'] == status.st_size and row['mtime'] == status.st_mtime:
+                stats['unchanged'] += 1
+                continue
+            changed.append((file_path, status, row))
+
+        # Songs whose file is gone may have been moved to one of the changed paths
+        gone = {row['hash']: row for path, row in known.items() if path not in present}
+        to_analyse = []
+        with self.connection:
+            for file_path, status, row in changed:
+                content_hash = file_hash(file_path)
+                if row and row['hash'] == content_hash:
+                    self.connection.execute('UPDATE songs SET size = ?, mtime = ? WHERE id = ?', (status.st_size, status.st_mtime, row['id']))
+                    stats['unchanged'] += 1
+                elif not row and content_hash in gone:
+                    moved = gone.pop(content_hash)
+                    self.connection.execute(
+                        'UPDATE songs SET path = ?, title = ?, size = ?, mtime = ? WHERE id = ?',
+                        (file_path, song_title(file_path), status.st_size, status.st_mtime, moved['id'])
+                    )
+                    stats['moved'] += 1
+                else:
+                    to_analyse.append((file_path, status, content_hash, row))
+
+            for row in gone.values():
+                self.connection.execute('DELETE FROM songs WHERE id = ?', (row['id'],))
+                stats['removed'] += 1
+
+        if to_analyse:
+            self.analyse(to_analyse, stats, workers, progress)
+
+        return stats
+
+    def analyse(self, files, stats, workers=None, progress=None):
+        from handlers.autofit import get_auto_fit
+
+        harps = get_auto_fit().harps
+        workers = memory.parallel_workers(min(len(files), workers or os.cpu_count() or 1))
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [(executor.submit(analyse_song, file_path), file_path, status, content_hash, row) for file_path, status, content_hash, row in files]
+
+            for done, (future, file_path, status, content_hash, row) in enumerate(futures, start=1):
+                try:
+                    parts, error = future.result(), None
+                except Exception as e:
+                    parts, error = [], str(e)
+                    stats['failed'] += 1
+                else:
+                    stats['updated' if row else 'added'] += 1
+
+                with self.connection:
+                    self.store(file_path, status, content_hash, parts, error, harps)
+
+                if progress:
+                    progress(done, len(files), file_path)
+
+    def store(self, file_path, status, content_hash, parts, error, harps):
+        self.connection.execute('DELETE FROM songs WHERE path = ?', (file_path,))
+        song_id = self.connection.execute(
+            'INSERT INTO songs (path, title, size, mtime, hash, part_count, error, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (file_path, song_title(file_path), status.st_size, status.st_mtime, content_hash, len(parts), error, time.time())
+        ).lastrowid
+
+        for part in parts:
+            best = part['best'] or {}
+            self.connection.execute(
+                'INSERT INTO parts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    song_id, part['part'], part['notes'], part['low'], part['high'], part['histogram'].tobytes(),
+                    best.get('transpose'), best.get('type'), best.get('tuning'), best.get('key_name'), best.get('missing')
+                )
+            )
+            self.connection.executemany(
+                'INSERT INTO feasibility VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (song_id, part['part'], type, tuning, key_name, int(counts[1]), int(counts[2]), int(counts[3]))
+                    for (type, tuning, key_name, _), counts in zip(harps, part['counts'].tolist())
+                ]
+            )
+
+    def search(self, type=None, tuning=None, key_name=None, max_bends=None, max_overblows=None, max_missing=0, text=None, low=None, high=None, limit=200):
+        """
+        Find the song parts playable on a harp, easiest first.
+
+        Parameters
+        ----------
+        type, tuning, key_name : str, optional
+            Restrict the harp; None accepts any.
+        max_bends, max_overblows, max_missing : int, optional
+            Largest number of notes outside chords needing bends, overblows
+            or missing from the harp; None accepts any.
+        text : str, optional
+            Case-insensitive part of the title or path.
+        low, high : int, optional
+            MIDI pitch range the part must stay within.
+        limit : int
+            Maximum number of results.
+
+        Returns
+        -------
+        list of dict
+            'path', 'title', 'part', 'notes', 'low', 'high', 'type', 'tuning',
+            'key_name', 'bends', 'overblows' and 'missing', plus the best
+            transposition of the part over all harps: 'best_transpose',
+            'best_type', 'best_tuning' and 'best_key'.
+        """
+        conditions, values = ['parts.notes > 0'], []
+        for column, value in (('feasibility.type', type), ('feasibility.tuning', tuning), ('feasibility.key_name', key_name)):
+            if value:
+                conditions.append(f'{column} = ?')
+                values.append(value)
+        for column, value in (('bends', max_bends), ('overblows', max_overblows), ('missing', max_missing)):
+            if value is not None:
+                conditions.append(f'feasibility.{column} <= ?')
+                values.append(value)
+        if text:
+            conditions.append('(songs.title LIKE ? OR songs.path LIKE ?)')
+            values += [f'%{text}%'] * 2
+        if low is not None:
+            conditions.append('parts.low >= ?')
+            values.append(low)
+        if high is not None:
+            conditions.append('parts.high <= ?')
+            values.append(high)
+
+        rows = self.connection.execute(
+            'SELECT songs.path, songs.title, parts.part, parts.notes, parts.low, parts.high, '
+            'feasibility.type, feasibility.tuning, feasibility.key_name, feasibility.bends, feasibility.overblows, feasibility.missing, '
+            'parts.best_transpose, parts.best_type, parts.best_tuning, parts.best_key '
+            'FROM feasibility JOIN parts USING (song_id, part) JOIN songs ON songs.id = feasibility.song_id '
+            f'WHERE {" AND ".join(conditions)} '
+            'ORDER BY feasibility.missing, feasibility.overblows, feasibility.bends, songs.title, parts.part LIMIT ?',
+            values + [limit]
+        )
+
+        return [dict(row) for row in rows]
+
+    def histogram(self, path, part=1):
+        """
+        Return the stored pitch histogram of a song part, or None.
+        """
+        row = self.connection.execute(
+            'SELECT histogram FROM parts JOIN songs ON songs.id = parts.song_id WHERE songs.path = ? AND parts.part = ?',
+            (os.path.abspath(path), part)
+        ).fetchone()
+
+        return None if row is None else np.frombuffer(row['histogram'], dtype=np.int32)
+
+    def stats(self):
+        row = self.connection.execute(
+            'SELECT COUNT(*) AS songs, SUM(part_count) AS parts, SUM(error IS NOT NULL) AS failed FROM songs'
+        ).fetchone()
+
+        return {'songs': row['songs'], 'parts': row['parts'] or 0, 'failed': row['failed'] or 0}
+
+
+def song_title(file_path):
+    return ' '.join(os.path.splitext(os.path.basename(file_path))[0].replace('_', ' ').split())
@@ -0,0 +1,86 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from core import memory, pipeline
+from handlers.converters import slice_measures
+
+_part_pool = None
+
+def get_part_pool():
+    """
+    Return the process pool used to tab parts, starting it on first use.
+
+    The pool is kept alive between requests so workers only pay the music21
+    and verovio import cost once. Under a memory budget it gets only as many
+    workers as fit in the remaining memory.
+    """
+    global _part_pool
+    if _part_pool is None:
+        _part_pool = ProcessPoolExecutor(max_workers=memory.parallel_workers())
+
+    return _part_pool
+
+
+def shutdown_part_pool():
+    global _part_pool
+    if _part_pool is not None:
+        _part_pool.shutdown(cancel_futures=True)
+        _part_pool = None
+
+
+def process_part(part_number, piece, file_name, options, engrave=True):
+    """
+    Reduce, label and (optionally) engrave a single part.
+
+    Runs in a worker process, so it only takes and returns plain, picklable data.
+
+    Parameters
+    ----------
+    part_number : int
+        Number of the part in the score, starting at 1.
+    piece : Part
+        The music21 part to tab.
+    file_name : str
+        Song name, used for the title.
+    options : dict
+        'type', 'tuning', 'key_name', 'key' and 'reduce_chords' settings, and
+        optionally 'transpose' (semitones).
+    engrave : bool
+        If False, only the tablature text is produced.
+
+    Returns
+    -------
+    dict
+        'part', 'tab_in_text', 'removed_chords', 'removed_notes', 'mei_data'
+        and 'svg_pages' (the last two are None without engraving).
+    """
+    result = pipeline.process(piece, file_name, options, engrave)
+    del result['musicxml']
+    result['part'] = part_number
+
+    return result
+
+
+def process_all_parts(score, file_name, options, engrave=True, measures=None):
+    """
+    Tab every part of an already parsed score on the worker pool.
+
+    The score is split once and each part is handled by its own worker, so
+    the total time is close to that of the slowest part. With `measures`, only
+    that range of every part is sent to the workers.
+
+    Returns
+    -------
+    list of dict
+        One `process_part` result per part, in score order.
+    """
+    pool = get_part_pool()
+    futures = [
+        pool.submit(process_part, part_number, slice_measures(piece, measures) if measures else piece, file_name, options, engrave)
+        for part_number, piece in enumerate(score.parts, start=1)
+    ]
+
+    return [future.result() for future in futures]
+
+
+def combine_tabs(results):
+    return '\n\n'.join(f"Part {result['part']}:\n{result['tab_in_text'].strip()}" for result in results)
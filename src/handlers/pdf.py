@@ -0,0 +1,104 @@
+import os
+import sys
+from types import SimpleNamespace
+from PySide6.QtCore import QByteArray, QMarginsF, QRectF
+from PySide6.QtGui import QGuiApplication, QPageSize, QPainter, QPdfWriter
+from PySide6.QtSvg import QSvgRenderer
+
+from core import pipeline
+from handlers.svg import prepare_page_for_qt
+
+_application = None
+
+def ensure_gui_application():
+    """
+    Make sure a QGuiApplication exists so painting works outside the GUI.
+
+    When no display is available the offscreen platform is used, which lets the
+    exporter run from the command line or a worker on a headless machine.
+    """
+    global _application
+    if QGuiApplication.instance() is None:
+        if sys.platform.startswith('linux') and not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY'):
+            os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        _application = QGuiApplication([])
+
+    return QGuiApplication.instance()
+
+
+class PDFExporter:
+    """
+    Write verovio SVG pages into a multi-page A4 PDF, one page at a time.
+
+    Each page is parsed, painted and released before the next one is rendered,
+    so memory stays bounded by a single page whatever the length of the score.
+    """
+    def __init__(self, source, resolution=300):
+        self.title = source.file_name
+        self.resolution = resolution
+
+    def export(self, svg_pages, output_path, progress=None):
+        """
+        Export SVG pages to a PDF file.
+
+        Parameters
+        ----------
+        svg_pages : iterable of str
+            SVG pages, usually the generator from `pipeline.iter_svg_pages`.
+        output_path : str
+            Destination PDF file.
+        progress : callable, optional
+            Called with the number of pages written after each page.
+
+        Returns
+        -------
+        int
+            Number of pages written.
+        """
+        ensure_gui_application()
+
+        writer = QPdfWriter(output_path)
+        writer.setTitle(self.title)
+        writer.setResolution(self.resolution)
+        writer.setPageSize(QPageSize(QPageSize.A4))
+        writer.setPageMargins(QMarginsF(0, 0, 0, 0))
+
+        painter = QPainter(writer)
+        page_rect = QRectF(0, 0, writer.width(), writer.height())
+        page_count = 0
+
+        try:
+            for svg_page in svg_pages:
+                if page_count:
+                    writer.newPage()
+
+                renderer = QSvgRenderer(QByteArray(prepare_page_for_qt(svg_page)))
+                renderer.render(painter, page_rect)
+                page_count += 1
+
+                if progress:
+                    progress(page_count)
+        finally:
+            painter.end()
+
+        return page_count
+
+
+def render_song_pdf(file_path, output_path, type='Diatonic', tuning='Standard Richter', key='C', part=1, reduce_chords=True, progress=None, measures=None, transpose=0):
+    """
+    Label a song and export its tablature to PDF without the GUI.
+
+    Returns
+    -------
+    tuple
+        The output path and the number of pages written.
+    """
+    title = os.path.splitext(os.path.basename(file_path))[0]
+    options = pipeline.harmonica_options(type, tuning, key, reduce_chords, transpose)
+
+    piece, _ = pipeline.load_part(file_path, part, measures)
+    piece = pipeline.label(piece, title, options)['piece']
+    mei_data = pipeline.engrave(pipeline.to_musicxml(piece))
+    page_count = PDFExporter(SimpleNamespace(file_name=title)).export(pipeline.iter_svg_pages(mei_data), output_path, progress)
+
+    return output_path, page_count
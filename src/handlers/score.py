@@ -1,11 +1,20 @@
-from music21 import note, chord, metadata, pitch
+from music21 import metadata, pitch
 
 from constants.tunings import HARMONICA_TUNINGS
+from core.events import NoteEvents, MeasureMemo
+
+# Below this share of repeated measures, copying results costs more than it saves
+MEMO_MIN_HIT_RATE = 0.25
 
 class ScoreEditor:
-    def __init__(self, source):
+    def __init__(self, source=None):
         self.source = source
         self.harmonica_tunings = HARMONICA_TUNINGS
+        self.events = None
+        self.events_score = None
+        self.memo = None
+        self.memo_events = None
+        self.memo_min_hit_rate = MEMO_MIN_HIT_RATE
 
     def edit_metadata(self, score, title, key):
         title = title.replace("-", " ").replace("_", " ")
@@ -16,89 +25,144 @@ class ScoreEditor:
 
         return score
     
-    def chords_handler(self, score):
-        count_removed_chords = 0
-        count_removed_notes = 0
-        for measure in score.getElementsByClass('Measure'):
-            for element in measure.notesAndRests:
-                if isinstance(element, chord.Chord):
-                    count_removed_chords += 1
-                    # Encontra a nota mais aguda (com maior oitava)
-                    highest_pitch = None
-                    max_pitch_value = float('-inf')  # Inicializa com o menor valor possível
-
-                    for pitch in element.pitches:
-                        if pitch.ps > max_pitch_value:
-                            max_pitch_value = pitch.ps
-                            highest_pitch = pitch
-
-                    highest_note = highest_pitch
-                    
-                    # Remove todas as notas que não são a nota mais aguda
-                    notes_to_remove = []
-                    for pitch in element.pitches:
-                        if pitch != highest_note:
-                            notes_to_remove.append(pitch)
-
-                    # Remove cada nota que não é a mais aguda do acorde
-                    for note_to_remove in notes_to_remove:
-                        count_removed_notes += 1
-                        element.remove(note_to_remove)
+    def transpose(self, score, semitones):
+        if semitones and isinstance(score, NoteEvents):
+            score.pitch += semitones
+            self.events_score = None
+            self.memo = None
+        elif semitones:
+            score.transpose(semitones, inPlace=True)
+            self.events_score = None
+
+        return score
+
+    def get_events(self, score):
+        """
+        Return the note events of a score, building them once per score.
+
+        The events are shared by chord reduction, labeling and key filtering,
+        so the music21 object graph is only walked the first time. Events read
+        without music21 (see `core.musicxml`) can be passed as the score itself.
+        """
+        if self.events_score is not score:
+            self.events = score if isinstance(score, NoteEvents) else NoteEvents.from_part(score)
+            self.events_score = score
+
+        return self.events
+
+    def get_memo(self, events):
+        """
+        Return the repeated measures of the events, found once per event model.
+
+        Returns None when fewer than `memo_min_hit_rate` of the measures
+        repeat, so callers take the plain path.
+        """
+        if self.memo is None or self.memo_events is not events:
+            self.memo = MeasureMemo(events)
+            self.memo_events = events
+
+        return self.memo if self.memo.hit_rate >= self.memo_min_hit_rate else None
+
+    def measure_stats(self):
+        """
+        Return the measure memo statistics of the last labeled events (see `MeasureMemo.stats`).
+        """
+        if self.memo is None:
+            return {'measures': 0, 'distinct': 0, 'repeated': 0, 'hit_rate': 0.0}
+        return self.memo.stats()
+
+    def chords_handler(self, score, write_back=True):
+        """
+        Reduce every chord to its highest note.
+
+        Parameters
+        ----------
+        score : Score
+            The musical score to edit.
+        write_back : bool
+            If False, only the event model is reduced and the music21 chords are
+            left untouched (enough when the score will not be engraved).
+
+        Returns
+        -------
+        tuple
+            The score, the number of reduced chords and the number of removed notes.
+        """
+        events = self.get_events(score)
+        keep, count_removed_chords, count_removed_notes = events.chord_reduction(self.get_memo(events))
+
+        if write_back:
+            events.write_reduction(keep)
+        self.events = events.select(keep)
+        self.memo = self.memo.reduced(self.events)
+        self.memo_events = self.events
 
         return score, count_removed_chords, count_removed_notes
     
 
     def harp_map(self, key, tuning, type):
-        harp = {}
-        start_pitch = pitch.Pitch(str(key))
+        start_ps = pitch.Pitch(str(key)).ps
         tuning_sys = self.harmonica_tunings[type].get(tuning, [])
 
-        for note in tuning_sys:
-            harp[start_pitch.ps] = note
-            start_pitch = pitch.Pitch(start_pitch.ps + 1)
-
-        return harp
+        # One semitone per token, so the pitches are plain offsets of the key
+        return {start_ps + step: note for step, note in enumerate(tuning_sys)}
     
-    def label_notes(self, score, type, tuning, key, reduce_chords):
+    def label_notes(self, score, type, tuning, key, reduce_chords, write_lyrics=True):
+        """
+        Label every note with its harmonica tab.
+
+        Parameters
+        ----------
+        score : Score
+            The musical score to label.
+        type : str
+            'Diatonic' or 'Chromatic'.
+        tuning : str
+            The harmonica tuning.
+        key : str
+            Pitch of the harmonica key, e.g. 'C4'.
+        reduce_chords : bool
+            Whether chords were reduced; unreduced chords are written in parentheses.
+        write_lyrics : bool
+            If False, the tabs are only returned as text and the score is not edited.
+
+        Returns
+        -------
+        tuple
+            The score and the tablature as text.
+        """
         if type == 'Diatonic':
             self.harmonica_mapping = self.harp_map(key, tuning, 'diatonic')
         elif type == 'Chromatic':
             self.harmonica_mapping = self.harp_map(key, tuning, 'chromatic')
-        tab_in_text = ''
-
-        for measure in score.getElementsByClass('Measure'):
-            for element in measure.notes:
-                if isinstance(element, note.Note):
-                    #note_name = element.nameWithOctave # Name of the note
-                    note_ps = element.pitch.ps
-                    harmonica_note = self.harmonica_mapping.get(note_ps, ' ?')
-                    element.addLyric(harmonica_note)
-                    tab_in_text += f"{harmonica_note}"
-                
-                elif isinstance(element, chord.Chord):
-
-                    if not reduce_chords.isChecked():
-                        first_note = True
-                        tab_in_text += f" ("
-                        
-                    line = 1
-                    for pitch in reversed(element.pitches):
-                        note_ps = pitch.ps
-                        harmonica_note = self.harmonica_mapping.get(note_ps, ' ?')
-                        element.addLyric(harmonica_note, lyricNumber=line)
-                        
-                        if not reduce_chords.isChecked():
-                            if first_note:
-                                harmonica_note = harmonica_note[1:]
-                                first_note = False
-                        tab_in_text += f"{harmonica_note}"
-                        line += 1
-                    
-                    if not reduce_chords.isChecked():
-                        tab_in_text += f")"
-        
+
+        events = self.get_events(score)
+        memo = self.get_memo(events)
+        if memo is None:
+            tokens = events.tokens(self.harmonica_mapping)
+            tab_in_text = events.tab_text(tokens, reduce_chords)
+        else:
+            distinct_tokens = memo.distinct.tokens(self.harmonica_mapping)
+            tab_in_text = memo.tab_text(distinct_tokens, reduce_chords)
+            tokens = memo.expand(distinct_tokens) if write_lyrics else None
+        if write_lyrics:
+            events.write_labels(tokens)
+
         return score, tab_in_text
     
+    def measure_tabs(self, score, reduce_chords):
+        """
+        Return the tabs of every measure, as labeled by the last `label_notes`.
+
+        Returns
+        -------
+        list of tuple
+            `(measure number, tab text)` for every measure of the part.
+        """
+        events = self.get_events(score)
+
+        return events.measure_tabs(events.tokens(self.harmonica_mapping), reduce_chords)
+
     def filter_keys(self, score, tuning, key_options, char):
         """
         Filter key options based on the presence of a specific character in harmonica notes.
@@ -119,24 +183,16 @@ class ScoreEditor:
         list of tuples
             The filtered key options.
         """
+        events = self.get_events(score)
+        memo = self.get_memo(events)
+        if memo is not None:
+            events = memo.distinct
+        note_pitches = set(events.pitch[events.direct() & ~events.in_chord].tolist())
         filtered_keys = []
 
         for key_name, key in key_options:
             self.harmonica_mapping = self.harp_map(key, tuning, 'diatonic')
-            
-            remove_key = False
-            for measure in score.getElementsByClass('Measure'):
-                for element in measure.notes:
-                    if isinstance(element, note.Note):
-                        note_ps = element.pitch.ps
-                        harmonica_note = self.harmonica_mapping.get(note_ps, '?')
-                        if char in harmonica_note:
-                            remove_key = True
-                            break
-                if remove_key:
-                    break
-
-            if not remove_key:
+            if not any(char in self.harmonica_mapping.get(note_ps, '?') for note_ps in note_pitches):
                 filtered_keys.append((key_name, key))
 
         return filtered_keys
@@ -0,0 +1,348 @@
+"""
+Songbook builder: engrave the songs of a manifest into one paginated book.
+
+A manifest is a JSON file::
+
+    {
+        "title": "Campfire Songs",
+        "songs": [
+            {"file": "songs/canon.mid", "part": 1, "key": "D"},
+            {"file": "songs/prelude.mxl", "title": "Prelude", "type": "Chromatic", "tuning": "Solo", "measures": [1, 16]}
+        ]
+    }
+
+Song files are relative to the manifest. Every entry accepts the options of
+`pipeline.harmonica_options` ('type', 'tuning', 'key', 'reduce_chords',
+'transpose') plus 'part', 'measures' and 'title'.
+
+Songs are engraved on a process pool, at most one song per worker ahead of
+the one being written, and their pages are spooled to disk in manifest order
+as they arrive. Memory therefore stays bounded by the number of workers, not
+by the size of the book. Once every song is known the table of contents is
+drawn and the book is written page by page as PDF, HTML or a single SVG.
+"""
+import os
+import json
+import tempfile
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from html import escape
+from types import SimpleNamespace
+from xml.sax.saxutils import escape as escape_xml
+
+from constants.tunings import HARMONICA_KEYS, HARMONICA_TUNINGS
+from core import memory, pipeline
+
+SONGBOOK_FORMATS = ('pdf', 'html', 'svg')
+PAGE_WIDTH = 2100
+PAGE_HEIGHT = 2970
+TOC_ROWS_PER_PAGE = 25
+XML_DECLARATION_END = '?>'
+
+def load_manifest(manifest_path):
+    """
+    Read and check a songbook manifest.
+
+    Returns
+    -------
+    tuple
+        The book title and the list of song entries, each with 'file' made
+        absolute and every option filled in.
+
+    Raises
+    ------
+    ValueError
+        If the manifest or one of its entries is invalid.
+    """
+    with open(manifest_path, 'r', encoding='utf-8') as file:
+        manifest = json.load(file)
+
+    if isinstance(manifest, list):
+        manifest = {'songs': manifest}
+    songs = manifest.get('songs')
+    if not songs:
+        raise ValueError('The manifest has no songs')
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    title = manifest.get('title') or os.path.splitext(os.path.basename(manifest_path))[0]
+    entries = []
+
+    for number, song in enumerate(songs, start=1):
+        if isinstance(song, str):
+            song = {'file': song}
+        if 'file' not in song:
+            raise ValueError(f"Song {number} has no 'file'")
+
+        file_path = os.path.join(base_dir, song['file'])
+        if not os.path.isfile(file_path):
+            raise ValueError(f"Song {number}: file not found: {song['file']}")
+
+        type = song.get('type', 'Diatonic')
+        tuning = song.get('tuning', 'Standard Richter')
+        key = song.get('key', 'C')
+        if tuning not in HARMONICA_TUNINGS.get(type.lower(), {}):
+            raise ValueError(f"Song {number}: unknown {type} tuning '{tuning}'")
+        if type == 'Diatonic' and key not in dict(HARMONICA_KEYS):
+            raise ValueError(f"Song {number}: unknown key '{key}'")
+
+        measures = song.get('measures')
+        entries.append({
+            'file': file_path,
+            'title': song.get('title') or os.path.splitext(os.path.basename(file_path))[0],
+            'part': int(song.get('part', 1)),
+            'measures': tuple(measures) if measures else None,
+            'options': pipeline.harmonica_options(type, tuning, key, song.get('reduce_chords', True), int(song.get('transpose', 0)))
+        })
+
+    return title, entries
+
+
+def engrave_song(entry):
+    """
+    Label and engrave one manifest entry; runs in a worker process.
+
+    Returns
+    -------
+    dict
+        'title', 'options' and 'svg_pages' (list of str).
+    """
+    piece, _ = pipeline.load_part(entry['file'], entry['part'], entry['measures'])
+    piece = pipeline.label(piece, entry['title'], entry['options'])['piece']
+    mei_data = pipeline.engrave(pipeline.to_musicxml(piece))
+
+    return {
+        'title': entry['title'],
+        'options': entry['options'],
+        'svg_pages': list(pipeline.iter_svg_pages(mei_data))
+    }
+
+
+def iter_engraved(entries, workers=None):
+    """
+    Engrave songs in parallel and yield `(entry, result)` in manifest order.
+
+    At most `workers` songs are queued or held at any time, so finished songs
+    never pile up behind a slow one. A failed song yields the exception as
+    its result.
+    """
+    workers = memory.parallel_workers(workers or os.cpu_count() or 1)
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        pending = deque()
+
+        for entry in entries:
+            pending.append((entry, executor.submit(engrave_song, entry)))
+            if len(pending) < workers:
+                continue
+
+            entry, future = pending.popleft()
+            yield entry, future_result(future)
+
+        while pending:
+            entry, future = pending.popleft()
+            yield entry, future_result(future)
+
+
+def future_result(future):
+    try:
+        return future.result()
+    except Exception as e:
+        return e
+
+
+class PageSpool:
+    """
+    Append-only file of SVG pages, read back one page at a time.
+    """
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.spans = []
+
+    def __len__(self):
+        return len(self.spans)
+
+    def append(self, svg_page):
+        data = svg_page.encode('utf-8')
+        self.spans.append((self.file.tell(), len(data)))
+        self.file.write(data)
+
+    def __iter__(self):
+        for position, length in self.spans:
+            self.file.seek(position)
+            yield self.file.read(length).decode('utf-8')
+        self.file.seek(0, os.SEEK_END)
+
+    def close(self):
+        self.file.close()
+
+
+def toc_page_count(song_count):
+    return max(1, -(-song_count // TOC_ROWS_PER_PAGE))
+
+
+def song_caption(song):
+    options = song['options']
+    return f"{options['type']} {options['tuning']} in {options['key_name']}"
+
+
+def iter_toc_pages(title, songs):
+    """
+    Yield the table of contents as SVG pages of the same size as verovio's.
+
+    Parameters
+    ----------
+    title : str
+        Book title, shown on the first page.
+    songs : list of dict
+        'title', 'options' and 'page' (first page number in the book).
+    """
+    for first in range(0, max(1, len(songs)), TOC_ROWS_PER_PAGE):
+        lines = [
+            f'<svg width="{PAGE_WIDTH}px" height="{PAGE_HEIGHT}px" viewBox="0 0 {PAGE_WIDTH} {PAGE_HEIGHT}" version="1.1" xmlns="http://www.w3.org/2000/svg">',
+            f'<rect width="{PAGE_WIDTH}" height="{PAGE_HEIGHT}" fill="white"/>'
+        ]
+        top = 200
+        if first == 0:
+            lines.append(f'<text x="{PAGE_WIDTH // 2}" y="260" font-family="serif" font-size="110" text-anchor="middle">{escape_xml(title)}</text>')
+            lines.append(f'<text x="{PAGE_WIDTH // 2}" y="380" font-family="serif" font-size="60" text-anchor="middle">Contents</text>')
+            top = 420
+
+        for row, song in enumerate(songs[first:first + TOC_ROWS_PER_PAGE]):
+            y = top + 95 * (row + 1)
+            lines.append(f'<text x="180" y="{y}" font-family="serif" font-size="50">{escape_xml(song["title"])}</text>')
+            lines.append(f'<text x="180" y="{y + 36}" font-family="serif" font-size="30" fill="#555555">{escape_xml(song_caption(song))}</text>')
+            lines.append(f'<text x="{PAGE_WIDTH - 180}" y="{y}" font-family="serif" font-size="50" text-anchor="end">{song["page"]}</text>')
+
+        lines.append('</svg>')
+        yield '\n'.join(lines)
+
+
+def strip_xml_declaration(svg_page):
+    if svg_page.startswith('<?xml'):
+        return svg_page[svg_page.index(XML_DECLARATION_END) + len(XML_DECLARATION_END):].lstrip()
+
+    return svg_page
+
+
+def write_pdf(output_path, title, songs, toc_pages, spool):
+    # Qt is only imported when a PDF is written
+    from handlers.pdf import PDFExporter
+
+    pages = (page for pages in (iter_toc_pages(title, songs), spool) for page in pages)
+
+    return PDFExporter(SimpleNamespace(file_name=title)).export(pages, output_path)
+
+
+def write_html(output_path, title, songs, toc_pages, spool):
+    page_count = 0
+    with open(output_path, 'w', encoding='utf-8') as file:
+        file.write(
+            '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n'
+            f'<title>{escape(title)}</title>\n'
+            '<style>\n'
+            'body { margin: 0; background: #888888; font-family: serif; }\n'
+            'nav, .page { width: 210mm; margin: 8mm auto; background: white; box-sizing: border-box; }\n'
+            'nav { padding: 16mm; }\n'
+            'nav li { display: flex; justify-content: space-between; margin: 2mm 0; }\n'
+            '.page svg { display: block; width: 100%; height: auto; }\n'
+            '@media print { body { background: white; } nav, .page { margin: 0; page-break-after: always; } }\n'
+            '</style>\n</head>\n<body>\n'
+            f'<nav>\n<h1>{escape(title)}</h1>\n<ol>\n'
+        )
+        for number, song in enumerate(songs, start=1):
+            file.write(
+                f'<li><a href="#song-{number}">{escape(song["title"])}</a> '
+                f'<small>{escape(song_caption(song))}</small><span>{song["page"]}</span></li>\n'
+            )
+        file.write('</ol>\n</nav>\n')
+
+        starts = {song['page']: number for number, song in enumerate(songs, start=1)}
+        for page_number, svg_page in enumerate(spool, start=toc_pages + 1):
+            anchor = f' id="song-{starts[page_number]}"' if page_number in starts else ''
+            file.write(f'<section class="page"{anchor}>\n{strip_xml_declaration(svg_page)}\n</section>\n')
+            page_count += 1
+
+        file.write('</body>\n</html>\n')
+
+    return toc_pages + page_count
+
+
+def write_svg(output_path, title, songs, toc_pages, spool):
+    total_pages = toc_pages + len(spool)
+    with open(output_path, 'w', encoding='utf-8') as file:
+        file.write(
+            f'<svg width="{PAGE_WIDTH}px" height="{PAGE_HEIGHT * total_pages}px" '
+            f'viewBox="0 0 {PAGE_WIDTH} {PAGE_HEIGHT * total_pages}" version="1.1" '
+            'xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink">\n'
+            f'<title>{escape_xml(title)}</title>\n'
+        )
+        pages = (page for pages in (iter_toc_pages(title, songs), spool) for page in pages)
+        for index, svg_page in enumerate(pages):
+            svg_page = strip_xml_declaration(svg_page)
+            # Each page becomes a nested <svg> placed below the previous one
+            file.write(svg_page.replace('<svg ', f'<svg x="0" y="{PAGE_HEIGHT * index}" ', 1))
+            file.write('\n')
+        file.write('</svg>\n')
+
+    return total_pages
+
+
+SONGBOOK_WRITERS = {'pdf': write_pdf, 'html': write_html, 'svg': write_svg}
+
+
+def build_songbook(manifest_path, output_path, output_format=None, workers=None, progress=None):
+    """
+    Engrave every song of a manifest and write them as one book.
+
+    Parameters
+    ----------
+    manifest_path : str
+        JSON manifest (see the module documentation).
+    output_path : str
+        Destination file.
+    output_format : str, optional
+        'pdf', 'html' or 'svg'; taken from the output extension by default.
+    workers : int, optional
+        Engraving processes, the CPU count by default (fewer under a memory budget).
+    progress : callable, optional
+        Called with `(done, total, title, error)` after each song; `error`
+        is None unless the song failed.
+
+    Returns
+    -------
+    dict
+        'output_path', 'pages', 'songs' (number written) and 'failed'
+        (list of `(title, error)`).
+    """
+    output_format = (output_format or os.path.splitext(output_path)[1].lstrip('.')).lower()
+    if output_format not in SONGBOOK_FORMATS:
+        raise ValueError(f"Unsupported songbook format '{output_format}'")
+
+    title, entries = load_manifest(manifest_path)
+    songs, failed = [], []
+    spool = PageSpool()
+
+    try:
+        for done, (entry, result) in enumerate(iter_engraved(entries, workers), start=1):
+            error = result if isinstance(result, Exception) else None
+            if error:
+                failed.append((entry['title'], error))
+            else:
+                songs.append({'title': result['title'], 'options': result['options'], 'page': len(spool) + 1})
+                for svg_page in result['svg_pages']:
+                    spool.append(svg_page)
+            del result
+
+            if progress:
+                progress(done, len(entries), entry['title'], error)
+
+        toc_pages = toc_page_count(len(songs))
+        for song in songs:
+            song['page'] += toc_pages
+
+        page_count = SONGBOOK_WRITERS[output_format](output_path, title, songs, toc_pages, spool)
+    finally:
+        spool.close()
+
+    return {'output_path': output_path, 'pages': page_count, 'songs': len(songs), 'failed': failed}
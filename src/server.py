@@ -0,0 +1,488 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import multiprocessing
+import tempfile
+import urllib.request
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from constants.tunings import HARMONICA_KEYS, HARMONICA_TUNINGS
+from core import memory, pipeline
+from core.musicxml import is_musicxml
+from core.tab_import import is_tab
+
+OUTPUT_FORMATS = {
+    'tab': 'text/plain; charset=utf-8',
+    'musicxml': 'application/vnd.recordare.musicxml+xml',
+    'svg': 'application/json',
+    'midi': 'audio/midi',
+    'pdf': 'application/pdf'
+}
+SONG_SUFFIXES = ('.mid', '.midi', '.musicxml', '.xml', '.mxl', '.txt', '.tab')
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class SongError(Exception):
+    """
+    The song of a request cannot be read; raised in the workers, answered with 400.
+    """
+
+
+def parse_options(query):
+    """
+    Turn request query parameters into conversion options.
+
+    Raises
+    ------
+    HTTPError
+        If a parameter is invalid.
+    """
+    output_format = query.get('format', 'tab')
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPError(400, f"Unknown format '{output_format}', expected one of {', '.join(OUTPUT_FORMATS)}")
+
+    type = query.get('type', 'Diatonic')
+    if type not in ('Diatonic', 'Chromatic'):
+        raise HTTPError(400, f"Unknown type '{type}', expected Diatonic or Chromatic")
+    tuning = query.get('tuning', 'Standard Richter' if type == 'Diatonic' else 'Solo')
+    if tuning not in HARMONICA_TUNINGS[type.lower()]:
+        raise HTTPError(400, f"Unknown {type} tuning '{tuning}', expected one of {', '.join(HARMONICA_TUNINGS[type.lower()])}")
+    key_name = query.get('key', 'C')
+    if type == 'Diatonic' and key_name not in dict(HARMONICA_KEYS):
+        raise HTTPError(400, f"Unknown key '{key_name}'")
+
+    try:
+        measures = None
+        if query.get('measures'):
+            start, end = (int(number) for number in query['measures'].split('-'))
+            measures = (min(start, end), max(start, end))
+
+        part = int(query.get('part', 1))
+        if part < 1:
+            raise HTTPError(400, f"Invalid part {part}, parts are numbered from 1")
+
+        options = pipeline.harmonica_options(
+            type,
+            tuning,
+            key_name,
+            query.get('reduce_chords', '1') not in ('0', 'false', 'no'),
+            int(query.get('transpose', 0))
+        )
+        options.update(format=output_format, part=part, measures=measures)
+
+        return options
+    except ValueError as e:
+        raise HTTPError(400, f"Invalid parameter: {e}")
+
+
+def read_song(load, file_path, options):
+    """
+    Load the requested part of a song with a pipeline loader.
+
+    Raises
+    ------
+    SongError
+        If the file cannot be parsed; music21 often fails with an empty
+        message, so the exception type is reported then. A missing part
+        still raises IndexError.
+    """
+    try:
+        return load(file_path, options['part'], options['measures'])
+    except IndexError:
+        raise
+    except Exception as e:
+        raise SongError(f"Could not read the song: {str(e) or type(e).__name__}") from e
+
+
+def convert(file_path, file_name, options):
+    """
+    Run the conversion pipeline for one request in a worker process.
+
+    Returns
+    -------
+    tuple
+        The output bytes and a dict of stage name to duration in seconds.
+    """
+    timings = {}
+
+    @contextmanager
+    def stage(name):
+        start = time.perf_counter()
+        yield
+        timings[name] = time.perf_counter() - start
+
+    if options['format'] == 'tab' and (is_musicxml(file_path) or is_tab(file_path)):
+        # Tablature text of MusicXML and tab files never needs music21
+        with stage('parse'):
+            events, _ = read_song(pipeline.load_events, file_path, options)
+        with stage('label'):
+            result = pipeline.label_events(events, options)
+        return result['tab_in_text'].strip().encode('utf-8'), timings
+
+    with stage('parse'):
+        piece, _ = read_song(pipeline.load_part, file_path, options)
+
+    with stage('label'):
+        result = pipeline.label(piece, file_name, options)
+
+    if options['format'] == 'tab':
+        return result['tab_in_text'].strip().encode('utf-8'), timings
+
+    with stage('musicxml'):
+        musicxml_data = pipeline.to_musicxml(result['piece'])
+    if options['format'] == 'musicxml':
+        return musicxml_data.encode('utf-8'), timings
+
+    with stage('mei'):
+        mei_data = pipeline.engrave(musicxml_data)
+
+    with stage(options['format']):
+        if options['format'] == 'svg':
+            output = json.dumps({'pages': list(pipeline.iter_svg_pages(mei_data))}).encode('utf-8')
+        elif options['format'] == 'midi':
+            output = pipeline.render_midi(mei_data)
+        else:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                pdf_path = os.path.join(temp_dir, f"{file_name}.pdf")
+                pipeline.export_pdf(pipeline.iter_svg_pages(mei_data), pdf_path, file_name)
+                with open(pdf_path, 'rb') as file:
+                    output = file.read()
+
+    return output, timings
+
+
+def convert_upload(data, suffix, file_name, options):
+    with tempfile.TemporaryDirectory() as upload_dir:
+        file_path = os.path.join(upload_dir, f"upload{suffix}")
+        with open(file_path, 'wb') as file:
+            file.write(data)
+
+        return convert(file_path, file_name, options)
+
+
+class ResultCache:
+    """
+    Least-recently-used cache of conversion results, bounded in bytes.
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        result = self.results.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.results.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        if len(result) > self.max_bytes:
+            return
+
+        self.results[key] = result
+        self.used_bytes += len(result)
+        while self.used_bytes > self.max_bytes:
+            _, evicted = self.results.popitem(last=False)
+            self.used_bytes -= len(evicted)
+
+
+class Metrics:
+    """
+    Request counters and recent per-stage latencies for the /metrics endpoint.
+    """
+    def __init__(self, window=1000):
+        self.window = window
+        self.counters = {'requests': 0, 'errors': 0, 'rejected': 0, 'crashes': 0}
+        self.latencies = {}
+
+    def count(self, name):
+        self.counters[name] = self.counters.get(name, 0) + 1
+
+    def record(self, stage, seconds):
+        self.latencies.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+
+    def summary(self):
+        stages = {}
+        for stage, values in self.latencies.items():
+            ordered = sorted(values)
+            stages[stage] = {
+                'count': len(ordered),
+                'mean_ms': sum(ordered) / len(ordered) * 1000,
+                'p50_ms': ordered[len(ordered) // 2] * 1000,
+                'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+                'max_ms': ordered[-1] * 1000
+            }
+
+        return {'counters': dict(self.counters), 'stages': stages}
+
+
+class TabService:
+    """
+    Headless HTTP service for the conversion pipeline.
+
+    Requests are handled on asyncio and conversions run on a bounded process
+    pool. Identical requests share one result cache (and one in-flight job), and
+    requests beyond the queue limit are rejected with 503 instead of piling up.
+
+    Endpoints
+    ---------
+    POST /convert?format=tab|musicxml|svg|midi|pdf&type=&tuning=&key=&part=&measures=&transpose=&reduce_chords=&filename=
+        Convert the song sent as the request body.
+    GET /convert?path=...&format=...
+        Convert a song under the configured root directory.
+    GET /metrics
+        Counters, cache statistics and per-stage latencies as JSON.
+    GET /health
+    """
+    def __init__(self, workers=None, max_queue=32, cache_bytes=256 * 1024 * 1024, max_upload=32 * 1024 * 1024, root=None):
+        self.workers = memory.parallel_workers(workers)
+        self.max_queue = max_queue
+        self.max_upload = max_upload
+        self.root = os.path.realpath(root) if root else None
+        self.cache = ResultCache(memory.cache_bytes(cache_bytes))
+        self.metrics = Metrics()
+        self.in_flight = {}
+        self.pending = 0
+        self.executor = None
+        self.slots = None
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=8765):
+        self.executor = self.new_executor()
+        self.slots = asyncio.Semaphore(self.workers)
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+
+        return self.server.sockets[0].getsockname()[:2]
+
+    def new_executor(self):
+        # Spawned workers: forking the running event loop (possibly off the main
+        # thread) leaves verovio without its font resources
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            status, content_type, body = await self.handle_request(reader)
+        except HTTPError as e:
+            status, content_type, body = e.status, 'application/json', json.dumps({'error': str(e)}).encode('utf-8')
+        except Exception as e:
+            self.metrics.count('errors')
+            status, content_type, body = 500, 'application/json', json.dumps({'error': str(e)}).encode('utf-8')
+
+        headers = [
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            "Connection: close"
+        ]
+        if status == 503:
+            headers.append("Retry-After: 1")
+
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1') + body)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def handle_request(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').split()
+        if len(request_line) < 2:
+            raise HTTPError(400, 'Malformed request line')
+        method, target = request_line[0], request_line[1]
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        url = urlsplit(target)
+        query = dict(parse_qsl(url.query))
+
+        if url.path == '/health':
+            return 200, 'application/json', b'{"status": "ok"}'
+        if url.path == '/metrics':
+            return 200, 'application/json', json.dumps(self.metrics_summary()).encode('utf-8')
+        if url.path != '/convert':
+            raise HTTPError(404, f"Unknown path '{url.path}'")
+
+        self.metrics.count('requests')
+        options = parse_options(query)
+
+        if method == 'POST':
+            try:
+                length = int(headers.get('content-length', 0))
+            except ValueError:
+                raise HTTPError(400, f"Invalid Content-Length '{headers['content-length']}'")
+            if length < 0:
+                raise HTTPError(400, f"Invalid Content-Length '{length}'")
+            if length > self.max_upload:
+                raise HTTPError(413, f"Upload larger than {self.max_upload} bytes")
+            data = await reader.readexactly(length)
+            file_name = os.path.splitext(os.path.basename(query.get('filename', 'upload.mid')))[0]
+            suffix = os.path.splitext(query.get('filename', 'upload.mid'))[1].lower()
+            if suffix not in SONG_SUFFIXES:
+                raise HTTPError(400, f"Unsupported file type '{suffix}'")
+            digest = hashlib.sha256(data).hexdigest()
+            job = (convert_upload, data, suffix, file_name, options)
+        elif method == 'GET':
+            file_path = self.resolve_path(query.get('path'))
+            stat = os.stat(file_path)
+            file_name = os.path.splitext(os.path.basename(file_path))[0]
+            digest = f"{file_path}:{stat.st_mtime_ns}:{stat.st_size}"
+            job = (convert, file_path, file_name, options)
+        else:
+            raise HTTPError(405, f"Method {method} not allowed")
+
+        cache_key = (digest, json.dumps(options, sort_keys=True))
+        try:
+            output = await self.run_job(cache_key, job)
+        except IndexError as e:
+            # The worker found no such part in the song
+            raise HTTPError(404, str(e))
+        except SongError as e:
+            raise HTTPError(400, str(e))
+
+        return 200, OUTPUT_FORMATS[options['format']], output
+
+    def resolve_path(self, path):
+        if not self.root:
+            raise HTTPError(400, 'Path requests are disabled, start the server with a root directory')
+        if not path:
+            raise HTTPError(400, "Missing 'path' parameter")
+
+        file_path = os.path.realpath(os.path.join(self.root, path))
+        if os.path.commonpath([self.root, file_path]) != self.root or not os.path.isfile(file_path):
+            raise HTTPError(404, f"File '{path}' not found")
+        if os.path.splitext(file_path)[1].lower() not in SONG_SUFFIXES:
+            raise HTTPError(400, f"Unsupported file type '{path}'")
+
+        return file_path
+
+    async def run_job(self, cache_key, job):
+        """
+        Return a cached result, join an identical running job, or run a new one.
+        """
+        output = self.cache.get(cache_key)
+        if output is not None:
+            return output
+
+        if cache_key in self.in_flight:
+            return await asyncio.shield(self.in_flight[cache_key])
+
+        if self.pending >= self.max_queue:
+            self.metrics.count('rejected')
+            raise HTTPError(503, 'Too many pending conversions, retry later')
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[cache_key] = future
+        self.pending += 1
+        queued = time.perf_counter()
+
+        try:
+            async with self.slots:
+                self.metrics.record('queue', time.perf_counter() - queued)
+                started = time.perf_counter()
+                executor = self.executor
+                try:
+                    output, timings = await asyncio.get_running_loop().run_in_executor(executor, *job)
+                except BrokenProcessPool:
+                    # A worker died outside the verovio watchdog: a broken pool
+                    # fails every later job, so the next requests get a new one
+                    self.metrics.count('crashes')
+                    if self.executor is executor:
+                        self.executor = self.new_executor()
+                        executor.shutdown(wait=False, cancel_futures=True)
+                    raise HTTPError(503, 'A conversion worker crashed, retry the request')
+                self.metrics.record('total', time.perf_counter() - started)
+
+            for stage, seconds in timings.items():
+                self.metrics.record(stage, seconds)
+            self.cache.put(cache_key, output)
+            future.set_result(output)
+            return output
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark as retrieved when nobody else was waiting
+            raise
+        finally:
+            self.pending -= 1
+            del self.in_flight[cache_key]
+
+    def metrics_summary(self):
+        summary = self.metrics.summary()
+        summary['cache'] = {
+            'hits': self.cache.hits,
+            'misses': self.cache.misses,
+            'entries': len(self.cache.results),
+            'bytes': self.cache.used_bytes
+        }
+        summary['queue'] = {'pending': self.pending, 'limit': self.max_queue, 'workers': self.workers}
+
+        return summary
+
+
+class ServiceClient:
+    """
+    Small blocking client for `TabService`, for scripts and tests.
+    """
+    def __init__(self, base_url='http://127.0.0.1:8765', timeout=300):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, path, query=None, data=None):
+        url = f"{self.base_url}{path}"
+        if query:
+            url += '?' + urlencode({key: value for key, value in query.items() if value is not None})
+
+        request = urllib.request.Request(url, data=data, method='POST' if data is not None else 'GET')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return response.read()
+
+    def convert_file(self, file_path, format='tab', **options):
+        with open(file_path, 'rb') as file:
+            data = file.read()
+
+        return self.request('/convert', dict(options, format=format, filename=os.path.basename(file_path)), data)
+
+    def convert_path(self, path, format='tab', **options):
+        return self.request('/convert', dict(options, format=format, path=path))
+
+    def metrics(self):
+        return json.loads(self.request('/metrics'))
+
+
+async def serve(host='127.0.0.1', port=8765, **settings):
+    service = TabService(**settings)
+    host, port = await service.start(host, port)
+    print(f'Serving on http://{host}:{port}')
+
+    try:
+        await service.server.serve_forever()
+    finally:
+        await service.close()